@@ -0,0 +1,104 @@
+"""
+Line statistics for the `diff_patch` text fetch.py stores with each commit: sections of
+`--- File: <path> ---` followed by that file's unified-diff hunks.
+Pure functions with no database access, so they can run in worker processes.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+FILE_HEADER_PATTERN = re.compile(r'^--- File: (.*) ---$')
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+# Extension (or exact file name) -> language, for the per-commit language mix
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'Python', '.pyx': 'Cython', '.pxd': 'Cython', '.ipynb': 'Jupyter Notebook',
+    '.jl': 'Julia', '.r': 'R', '.m': 'MATLAB',
+    '.c': 'C', '.h': 'C', '.cc': 'C++', '.cpp': 'C++', '.cxx': 'C++', '.hpp': 'C++', '.hh': 'C++', '.cu': 'CUDA',
+    '.f': 'Fortran', '.f90': 'Fortran', '.f95': 'Fortran',
+    '.rs': 'Rust', '.go': 'Go', '.java': 'Java', '.kt': 'Kotlin', '.scala': 'Scala', '.cs': 'C#', '.swift': 'Swift',
+    '.js': 'JavaScript', '.jsx': 'JavaScript', '.mjs': 'JavaScript', '.ts': 'TypeScript', '.tsx': 'TypeScript',
+    '.rb': 'Ruby', '.php': 'PHP', '.lua': 'Lua', '.pl': 'Perl',
+    '.sh': 'Shell', '.bash': 'Shell', '.ps1': 'PowerShell',
+    '.html': 'HTML', '.css': 'CSS', '.scss': 'CSS', '.vue': 'Vue',
+    '.sql': 'SQL', '.proto': 'Protocol Buffers',
+    '.md': 'Markdown', '.rst': 'reStructuredText', '.txt': 'Text', '.tex': 'TeX',
+    '.json': 'JSON', '.yml': 'YAML', '.yaml': 'YAML', '.toml': 'TOML', '.cfg': 'Config', '.ini': 'Config', '.xml': 'XML',
+    '.cmake': 'CMake', 'cmakelists.txt': 'CMake', 'makefile': 'Makefile', 'dockerfile': 'Dockerfile',
+}
+OTHER_LANGUAGE = 'Other'
+
+
+def language_for_path(path: str) -> str:
+    """The language of a file, from its name or extension."""
+    name = os.path.basename(path).lower()
+    if name in LANGUAGE_BY_EXTENSION:
+        return LANGUAGE_BY_EXTENSION[name]
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(name)[1], OTHER_LANGUAGE)
+
+
+def count_patch_lines(diff_patch: str) -> Dict[str, List[int]]:
+    """
+    Returns {path: [lines_added, lines_removed]} for each file section of a diff_patch.
+    Hunks are read by their line counts, so hunk content that looks like a file header is not mistaken for one.
+    """
+    per_file: Dict[str, List[int]] = {}
+    current: Optional[List[int]] = None
+    old_remaining = new_remaining = 0
+
+    for line in diff_patch.splitlines():
+        if old_remaining > 0 or new_remaining > 0:
+            if current is None: continue
+            if line.startswith('+'):
+                current[0] += 1
+                new_remaining -= 1
+            elif line.startswith('-'):
+                current[1] += 1
+                old_remaining -= 1
+            elif not line.startswith('\\'):
+                old_remaining -= 1
+                new_remaining -= 1
+            continue
+        header = FILE_HEADER_PATTERN.match(line)
+        if header:
+            current = per_file.setdefault(header.group(1), [0, 0])
+            continue
+        hunk = HUNK_HEADER_PATTERN.match(line)
+        if hunk:
+            old_remaining = int(hunk.group(1)) if hunk.group(1) is not None else 1
+            new_remaining = int(hunk.group(2)) if hunk.group(2) is not None else 1
+    return per_file
+
+
+def commit_diff_stats(raw_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Computes the Commit analytics fields from a commit's raw_data: lines_added, lines_removed,
+    files_count and language_breakdown ({language: lines added + removed}).
+    Files whose patch fetch.py left out or cut short (`patch_elided`), or that the API sent without one,
+    are counted from their files_changed additions/deletions instead of the patch text.
+    Line counts are None when the commit has neither (undetailed, or from a webhook payload).
+    """
+    files_changed = raw_data.get('files_changed') or []
+    diff_patch = raw_data.get('diff_patch')
+    per_file = count_patch_lines(diff_patch) if isinstance(diff_patch, str) and diff_patch else {}
+    has_line_counts = bool(per_file)
+    for entry in files_changed:
+        if not isinstance(entry, dict) or not entry.get('filename'): continue
+        added, removed = entry.get('additions'), entry.get('deletions')
+        if not isinstance(added, int) or not isinstance(removed, int): continue
+        has_line_counts = True
+        if entry.get('patch_elided') or entry['filename'] not in per_file:
+            per_file[entry['filename']] = [added, removed]
+
+    language_breakdown: Dict[str, int] = {}
+    for path, (added, removed) in per_file.items():
+        if added or removed:
+            language = language_for_path(path)
+            language_breakdown[language] = language_breakdown.get(language, 0) + added + removed
+
+    return {
+        'lines_added': sum(added for added, _ in per_file.values()) if has_line_counts or diff_patch else None,
+        'lines_removed': sum(removed for _, removed in per_file.values()) if has_line_counts or diff_patch else None,
+        'files_count': len(files_changed) if files_changed else len(per_file),
+        'language_breakdown': language_breakdown,
+    }
@@ -0,0 +1,11 @@
+"""
+Imports fetch.py, which lives next to manage.py outside the api package, for the code that reuses it
+(the crawl command, the webhook handlers and the tests).
+"""
+import sys
+
+from django.conf import settings
+
+if str(settings.BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(settings.BASE_DIR))
+import fetch # noqa: E402
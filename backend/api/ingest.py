@@ -0,0 +1,413 @@
+"""
+Upserts contributor records, in the shape fetch.py writes them, into the api models.
+Used by `populate` (records read from a JSON file), `crawl` (records handed over by the fetcher)
+and the GitHub webhook (single commits and issues from event payloads).
+"""
+import collections
+from urllib.parse import urlparse
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from api.models import Repository, Contributor, RepositoryWork, Issue, Commit
+
+
+def parse_github_url(url: str) -> Optional[Tuple[str, str]]:
+    """Parses a GitHub repository URL to extract owner and repo name."""
+    try:
+        parsed = urlparse(url)
+        if parsed.netloc.lower() != 'github.com':
+            return None
+        path_parts = [part for part in parsed.path.strip('/').split('/') if part]
+        if len(path_parts) >= 2:
+            owner = path_parts[0]
+            repo = path_parts[1]
+            if repo.endswith('.git'): repo = repo[:-4]
+            return owner, repo
+        return None
+    except Exception:
+        return None
+
+
+def clear_all() -> None:
+    """Deletes every ingested row, in reverse order of dependencies."""
+    Commit.objects.all().delete()
+    Issue.objects.all().delete()
+    RepositoryWork.objects.all().delete()
+    Contributor.objects.all().delete()
+    Repository.objects.all().delete()
+
+
+def remove_issue(issue_url: str, keep_usernames: Iterable[str] = ()) -> int:
+    """
+    Deletes the stored rows of an issue, except those of `keep_usernames`, and clears the summaries
+    of the works and contributors that lost it. Returns the number of rows deleted.
+    """
+    stale_issues = Issue.objects.filter(url=issue_url).exclude(work__contributor__username__in=list(keep_usernames))
+    work_ids = list(stale_issues.values_list('work_id', flat=True).distinct())
+    deleted, _ = stale_issues.delete()
+    mark_works_stale(work_ids)
+    return deleted
+
+
+def issue_raw_data(issue_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What an Issue row stores as raw_data: the simplified issue without its html_url (the row's url)."""
+    return {k: v for k, v in issue_data.items() if k != 'html_url'}
+
+
+def commit_raw_data(commit_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What a Commit row stores as raw_data: message, changed files and patch."""
+    return {
+        'message': commit_data.get('message'),
+        'files_changed': commit_data.get('files_changed'),
+        'diff_patch': commit_data.get('diff_patch')
+    }
+
+
+def mark_works_stale(work_ids: List[int]) -> None:
+    """Clears the summaries of these works and their contributors, so create_summaries regenerates them."""
+    if not work_ids:
+        return
+    RepositoryWork.objects.filter(pk__in=work_ids).update(summary='')
+    Contributor.objects.filter(works__pk__in=work_ids).update(summary='')
+
+
+class RecordLoader:
+    """
+    Upserts contributor records one at a time. Repositories are cached across records, and
+    `counts` tracks how many rows of each kind were created.
+    """
+    def __init__(self):
+        self.repo_cache: Dict[str, Repository] = {}
+        self.counts = collections.Counter()
+
+    def get_repository(self, repo_url: str) -> Optional[Repository]:
+        repository_obj = self.repo_cache.get(repo_url)
+        if repository_obj:
+            return repository_obj
+        parsed_repo = parse_github_url(repo_url)
+        if not parsed_repo:
+            return None
+        owner, repo_name = parsed_repo
+        repository_obj, repo_created = Repository.objects.update_or_create(
+            url=repo_url,
+            defaults={
+                'name': f"{owner}/{repo_name}",
+                'avatar_url': '', # Not available in input JSON
+                'summary': '',     # Not available in input JSON
+                'raw_data': '',    # Could store full repo details if fetched separately
+            }
+        )
+        self.repo_cache[repo_url] = repository_obj
+        if repo_created:
+            self.counts['repositories'] += 1
+        return repository_obj
+
+    def load_contributor(self, contributor_data: Dict[str, Any], warn=None) -> Optional[Contributor]:
+        """
+        Upserts one contributor record with its works, issues and commits.
+        Issues and commits whose stored data is unchanged are not rewritten, and only the works that changed
+        (and their contributor, unless the record brings its own summary) have their summaries cleared.
+        Returns the Contributor, or None if the record has no username.
+        `warn` is called with a message for entries that are skipped.
+        """
+        username = contributor_data.get('username')
+        if not username:
+            return None
+
+        # --- 1. Create or Update Contributor ---
+        contributor_defaults = {
+            'url': contributor_data.get('url', ''),
+            'avatar_url': contributor_data.get('avatar_url', ''),
+        }
+        if 'summary' in contributor_data:
+            contributor_defaults['summary'] = contributor_data['summary'] or '' # Use summary if available in JSON
+        contributor, created = Contributor.objects.update_or_create(
+            username=username,
+            defaults=contributor_defaults,
+            create_defaults={'summary': '', **contributor_defaults},
+        )
+        self.counts['contributors_processed'] += 1
+        if created:
+            self.counts['contributors'] += 1
+
+        # --- 2. Process Works (Repositories) for this Contributor ---
+        changed_work_ids: List[int] = []
+        for work_data in contributor_data.get('works', []):
+            repo_url = work_data.get('repository_url')
+            if not repo_url:
+                continue
+
+            # --- 3. Create or Update Repository ---
+            repository_obj = self.get_repository(repo_url)
+            if not repository_obj:
+                continue
+
+            # --- 4. Create or Update RepositoryWork ---
+            repo_work, work_created = RepositoryWork.objects.get_or_create(
+                repository=repository_obj,
+                contributor=contributor,
+                defaults={'summary': '', 'weekly_activity': work_data.get('weekly_activity')}
+            )
+            changed = work_created
+            if work_created:
+                self.counts['works'] += 1
+            elif work_data.get('weekly_activity') is not None and work_data['weekly_activity'] != repo_work.weekly_activity:
+                repo_work.weekly_activity = work_data['weekly_activity'] # Full history, so it replaces the stored series
+                repo_work.save(update_fields=['weekly_activity', 'updated_at'])
+                changed = True
+
+            # --- 5. Create or Update Issues for this RepositoryWork ---
+            # Rows that already hold the same data are left alone, and so are the summaries built from them
+            issues = []
+            for issue_data in work_data.get('issues', []):
+                if issue_data.get('html_url'):
+                    issues.append(issue_data)
+                elif warn:
+                    warn(f"Skipping issue for repo {repo_url} due to missing 'html_url'.")
+            stored_issues = dict(Issue.objects.filter(work=repo_work, url__in=[i['html_url'] for i in issues]).values_list('url', 'raw_data'))
+            for issue_data in issues:
+                if stored_issues.get(issue_data['html_url']) == issue_raw_data(issue_data):
+                    continue
+                changed = True
+                if self.upsert_issue(repo_work, issue_data):
+                    self.counts['issues'] += 1
+
+            # --- 6. Create or Update Commits for this RepositoryWork ---
+            commits = [c for c in work_data.get('commits', []) if c.get('url')]
+            stored_commits = dict(Commit.objects.filter(work=repo_work, url__in=[c['url'] for c in commits]).values_list('url', 'raw_data'))
+            for commit_data in commits:
+                if stored_commits.get(commit_data['url']) == commit_raw_data(commit_data):
+                    continue
+                changed = True
+                if self.upsert_commit(repo_work, commit_data):
+                    self.counts['commits'] += 1
+
+            if changed:
+                changed_work_ids.append(repo_work.pk)
+
+        # Only the summaries built from changed rows need regenerating
+        if changed_work_ids:
+            RepositoryWork.objects.filter(pk__in=changed_work_ids).update(summary='')
+            if 'summary' not in contributor_data:
+                Contributor.objects.filter(pk=contributor.pk).update(summary='')
+        return contributor
+
+    def upsert_activity(
+        self, repo_url: str, profile: Dict[str, Any],
+        issues: List[Dict[str, Any]] = (), commits: List[Dict[str, Any]] = (), keep_patches: bool = False
+    ) -> Optional[RepositoryWork]:
+        """
+        Adds issues and commits to one contributor's work in one repository, leaving the rest of their
+        data alone. `profile` holds the contributor's username, url and avatar_url (used if they are new).
+        With `keep_patches`, commits without patch text don't replace stored copies that have one.
+        The work's and the contributor's summaries are cleared so create_summaries regenerates them.
+        Returns the RepositoryWork, or None if the repository URL or username is unusable.
+        """
+        username = profile.get('username')
+        repository_obj = self.get_repository(repo_url)
+        if not username or not repository_obj:
+            return None
+
+        contributor, created = Contributor.objects.get_or_create(
+            username=username,
+            defaults={
+                'url': profile.get('url') or '',
+                'avatar_url': profile.get('avatar_url') or '',
+                'summary': '',
+            }
+        )
+        if created:
+            self.counts['contributors'] += 1
+
+        repo_work, work_created = RepositoryWork.objects.get_or_create(
+            repository=repository_obj, contributor=contributor, defaults={'summary': ''}
+        )
+        if work_created:
+            self.counts['works'] += 1
+
+        for issue_data in issues:
+            if self.upsert_issue(repo_work, issue_data):
+                self.counts['issues'] += 1
+        for commit_data in commits:
+            if keep_patches and not commit_data.get('diff_patch'):
+                stored = Commit.objects.filter(work=repo_work, url=commit_data['url']).values_list('raw_data', flat=True).first()
+                if isinstance(stored, dict) and stored.get('diff_patch'):
+                    continue
+            if self.upsert_commit(repo_work, commit_data):
+                self.counts['commits'] += 1
+
+        mark_works_stale([repo_work.pk])
+        return repo_work
+
+    @staticmethod
+    def upsert_issue(repo_work: RepositoryWork, issue_data: Dict[str, Any]) -> bool:
+        """Upserts an issue keyed by its html_url, storing the rest as raw_data. Returns True if created."""
+        _, issue_created = Issue.objects.update_or_create(
+            work=repo_work,
+            url=issue_data['html_url'],
+            defaults={
+                'raw_data': issue_raw_data(issue_data),
+                'summary': '',
+            }
+        )
+        return issue_created
+
+    @staticmethod
+    def upsert_commit(repo_work: RepositoryWork, commit_data: Dict[str, Any]) -> bool:
+        """Upserts a commit keyed by its URL, storing message, files and patch as raw_data. Returns True if created."""
+        _, commit_created = Commit.objects.update_or_create(
+            work=repo_work,
+            url=commit_data['url'],
+            defaults={
+                'raw_data': commit_raw_data(commit_data),
+                'summary': '',
+                # The diff may have changed; analyze_diffs recomputes these
+                'lines_added': None,
+                'lines_removed': None,
+                'files_count': None,
+                'language_breakdown': None,
+            }
+        )
+        return commit_created
+
+
+class BulkRecordLoader:
+    """
+    Loads contributor records with batched `bulk_create(update_conflicts=True)` upserts instead of one
+    `update_or_create` per row, leaving the tables as RecordLoader.load_contributor would, except that
+    every row it writes has its summary reset (it is meant for full loads, which are summarised afresh).
+    Records are buffered by `add` and written once `batch_size` issues and commits are pending (or by `flush`).
+    Foreign keys are resolved through in-memory maps of username, repository URL and (repository, contributor)
+    to primary key, filled as rows are written. Call `finish` at the end; it flushes and fills `counts`.
+    """
+    CONTRIBUTOR_FIELDS = ['url', 'avatar_url', 'summary', 'updated_at']
+    REPOSITORY_FIELDS = ['name', 'avatar_url', 'summary', 'raw_data', 'updated_at']
+    ISSUE_FIELDS = ['raw_data', 'summary', 'updated_at']
+    COMMIT_FIELDS = ['raw_data', 'summary', 'lines_added', 'lines_removed', 'files_count', 'language_breakdown', 'updated_at']
+
+    def __init__(self, batch_size: int = 2000, warn=None):
+        self.batch_size = batch_size
+        self.warn = warn
+        self.contributor_ids: Dict[str, int] = {}
+        self.repository_ids: Dict[str, int] = {}
+        self.work_ids: Dict[Tuple[int, int], int] = {}
+        self.pending: List[Dict[str, Any]] = []
+        self.pending_rows = 0
+        self.counts = collections.Counter()
+        # Rows that exist before loading; `finish` reports the difference as created rows
+        self.initial_totals = self.table_totals()
+
+    @staticmethod
+    def table_totals() -> Dict[str, int]:
+        return {
+            'contributors': Contributor.objects.count(),
+            'repositories': Repository.objects.count(),
+            'works': RepositoryWork.objects.count(),
+            'issues': Issue.objects.count(),
+            'commits': Commit.objects.count(),
+        }
+
+    def add(self, contributor_data: Dict[str, Any]) -> None:
+        """Buffers one contributor record (skipped without a username), flushing when the batch is full."""
+        if not contributor_data.get('username'):
+            return
+        self.pending.append(contributor_data)
+        self.counts['contributors_processed'] += 1
+        self.pending_rows += 1 + sum(
+            1 + len(w.get('issues') or []) + len(w.get('commits') or []) for w in contributor_data.get('works', [])
+        )
+        if self.pending_rows >= self.batch_size:
+            self.flush()
+
+    def finish(self) -> None:
+        self.flush()
+        final_totals = self.table_totals()
+        for name, total in final_totals.items():
+            self.counts[name] = total - self.initial_totals[name]
+
+    def flush(self) -> None:
+        """Writes the buffered records: contributors, repositories and works first, then their issues and commits."""
+        if not self.pending:
+            return
+        records, self.pending, self.pending_rows = self.pending, [], 0
+
+        # Later copies of a row win, as they would with one update_or_create after another
+        contributors: Dict[str, Contributor] = {}
+        for data in records:
+            contributors[data['username']] = Contributor(
+                username=data['username'], url=data.get('url', ''),
+                avatar_url=data.get('avatar_url', ''), summary=data.get('summary', ''),
+            )
+        Contributor.objects.bulk_create(
+            contributors.values(), update_conflicts=True, unique_fields=['username'], update_fields=self.CONTRIBUTOR_FIELDS
+        )
+        self.resolve_ids(self.contributor_ids, Contributor.objects.filter(username__in=list(contributors)), 'username')
+
+        new_repositories: Dict[str, Repository] = {}
+        for data in records:
+            for work_data in data.get('works', []):
+                repo_url = work_data.get('repository_url')
+                parsed_repo = parse_github_url(repo_url) if repo_url else None
+                if parsed_repo and repo_url not in self.repository_ids:
+                    new_repositories[repo_url] = Repository(
+                        url=repo_url, name=f"{parsed_repo[0]}/{parsed_repo[1]}", avatar_url='', summary='', raw_data=''
+                    )
+        if new_repositories:
+            Repository.objects.bulk_create(
+                new_repositories.values(), update_conflicts=True, unique_fields=['url'], update_fields=self.REPOSITORY_FIELDS
+            )
+            self.resolve_ids(self.repository_ids, Repository.objects.filter(url__in=list(new_repositories)), 'url')
+
+        # A work's weekly_activity is only replaced by records that carry one
+        works: Dict[Tuple[int, int], RepositoryWork] = {}
+        work_items: List[Tuple[Tuple[int, int], Dict[str, Any]]] = []
+        for data in records:
+            contributor_id = self.contributor_ids[data['username']]
+            for work_data in data.get('works', []):
+                repository_id = self.repository_ids.get(work_data.get('repository_url'))
+                if repository_id is None:
+                    continue
+                key = (repository_id, contributor_id)
+                work = works.setdefault(key, RepositoryWork(repository_id=repository_id, contributor_id=contributor_id, summary=''))
+                if work_data.get('weekly_activity') is not None:
+                    work.weekly_activity = work_data['weekly_activity']
+                work_items.append((key, work_data))
+        for with_series in (True, False):
+            batch = [w for w in works.values() if (w.weekly_activity is not None) == with_series]
+            if batch:
+                RepositoryWork.objects.bulk_create(
+                    batch, update_conflicts=True, unique_fields=['repository', 'contributor'],
+                    update_fields=['summary', 'weekly_activity', 'updated_at'] if with_series else ['summary', 'updated_at']
+                )
+        for work in RepositoryWork.objects.filter(
+            repository_id__in={k[0] for k in works}, contributor_id__in={k[1] for k in works}
+        ).values('id', 'repository_id', 'contributor_id'):
+            self.work_ids[(work['repository_id'], work['contributor_id'])] = work['id']
+
+        issues: Dict[Tuple[int, str], Issue] = {}
+        commits: Dict[Tuple[int, str], Commit] = {}
+        for key, work_data in work_items:
+            work_id = self.work_ids[key]
+            for issue_data in work_data.get('issues', []):
+                issue_url = issue_data.get('html_url')
+                if not issue_url:
+                    if self.warn: self.warn(f"Skipping issue for repo {work_data.get('repository_url')} due to missing 'html_url'.")
+                    continue
+                issues[(work_id, issue_url)] = Issue(work_id=work_id, url=issue_url, summary='', raw_data=issue_raw_data(issue_data))
+            for commit_data in work_data.get('commits', []):
+                if not commit_data.get('url'):
+                    continue
+                # New Commit objects leave the analyze_diffs fields null, so re-loaded commits are analysed again
+                commits[(work_id, commit_data['url'])] = Commit(
+                    work_id=work_id, url=commit_data['url'], summary='', raw_data=commit_raw_data(commit_data)
+                )
+        Issue.objects.bulk_create(
+            issues.values(), update_conflicts=True, unique_fields=['work', 'url'], update_fields=self.ISSUE_FIELDS, batch_size=self.batch_size
+        )
+        Commit.objects.bulk_create(
+            commits.values(), update_conflicts=True, unique_fields=['work', 'url'], update_fields=self.COMMIT_FIELDS, batch_size=self.batch_size
+        )
+
+    @staticmethod
+    def resolve_ids(key_map: Dict[Any, int], queryset, key_field: str) -> None:
+        for row in queryset.values('id', key_field):
+            key_map[row[key_field]] = row['id']
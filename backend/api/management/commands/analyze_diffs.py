@@ -0,0 +1,55 @@
+import os
+import time
+import concurrent.futures
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Commit
+from api.diff_stats import commit_diff_stats
+
+# --- Configuration ---
+MAX_WORKERS = os.cpu_count() or 1
+BATCH_SIZE = 500 # Commits read, analysed and written back per round
+STAT_FIELDS = ['lines_added', 'lines_removed', 'files_count', 'language_breakdown']
+
+
+# --- Django Management Command ---
+class Command(BaseCommand):
+    help = ('Computes per-commit line counts, file counts and language mix from the stored diff_patch text, '
+            'using a process pool. No GitHub requests are made.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every commit, not just those not analysed yet.')
+        parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                            help=f'Worker processes (default {MAX_WORKERS}).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        qs = Commit.objects.all() if options['all'] else Commit.objects.filter(language_breakdown__isnull=True)
+        commit_ids = list(qs.order_by('id').values_list('id', flat=True))
+        total = len(commit_ids)
+        if not total:
+            self.stdout.write(self.style.SUCCESS("No commits need analysing."))
+            return
+
+        self.stdout.write(f"Analysing diffs of {total} commits with {options['workers']} worker processes...")
+        start_time = time.time()
+        batch_size = max(1, options['batch_size'])
+        processed = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for batch_start in range(0, total, batch_size):
+                # Only one batch of raw_data (which holds the patches) is in memory at a time
+                commits = list(Commit.objects.filter(id__in=commit_ids[batch_start:batch_start + batch_size]).only('id', 'raw_data'))
+                raw_data = [c.raw_data if isinstance(c.raw_data, dict) else {} for c in commits]
+                chunksize = max(1, len(commits) // (options['workers'] * 4))
+                for commit, stats in zip(commits, executor.map(commit_diff_stats, raw_data, chunksize=chunksize)):
+                    for field in STAT_FIELDS:
+                        setattr(commit, field, stats[field])
+                with transaction.atomic():
+                    Commit.objects.bulk_update(commits, STAT_FIELDS)
+                processed += len(commits)
+                self.stdout.write(f"  Analysed {processed}/{total} commits...")
+
+        self.stdout.write(self.style.SUCCESS(f"Diff analysis finished in {time.time() - start_time:.2f}s."))
@@ -0,0 +1,147 @@
+import collections
+import os
+import time
+from typing import Any, Dict, List, Set
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.fetcher import fetch
+from api.ingest import RecordLoader, clear_all, remove_issue
+
+# --- Configuration ---
+# Watermarks of what is already in the database, kept apart from fetch.py's own (which track its output file)
+CRAWL_WATERMARKS_FILE = os.getenv('CRAWL_WATERMARKS_FILE', 'crawl_watermarks.json')
+# Likewise its own checkpoint and dead letters, so a crawl doesn't clear or replay those of an interrupted fetch.py run
+CRAWL_CHECKPOINT_DIR = os.getenv('CRAWL_CHECKPOINT_DIR', '.crawl_checkpoint')
+CRAWL_DEAD_LETTER_FILE = os.getenv('CRAWL_DEAD_LETTER_FILE', 'crawl_dead_letters.jsonl')
+
+
+# --- Django Management Command ---
+class Command(BaseCommand):
+    help = ('Runs the GitHub fetcher and upserts each repository\'s contributors, issues and commits '
+            'into the database as soon as that repository is done, without an intermediate JSON file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('repo_urls', nargs='*', help='GitHub repository URLs to crawl.')
+        parser.add_argument('--org', action='append', default=[],
+                            help='Crawl every repository of this GitHub organisation, most recently pushed first. Repeatable.')
+        parser.add_argument('--max-repos', type=int, default=None,
+                            help='With --org, crawl only this many of the highest-priority repositories.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Clear existing data (and the crawl watermarks) before crawling.')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the crawl watermarks and fetch all activity again.')
+        parser.add_argument('--resume', action='store_true',
+                            help=f'Resume an interrupted crawl from the checkpoint in {CRAWL_CHECKPOINT_DIR}.')
+        parser.add_argument('--replay-dead-letters', action='store_true',
+                            help=f'Instead of crawling, retry only the requests that failed in earlier crawls ({CRAWL_DEAD_LETTER_FILE}).')
+        parser.add_argument('--commit-sampling', choices=sorted(fetch.COMMIT_SAMPLING_POLICIES), default=fetch.COMMIT_SAMPLING_POLICY,
+                            help=f'Which commits get details when a repository has more than {fetch.MAX_COMMITS_TO_DETAIL_PER_REPO} '
+                                 f'(default \'{fetch.COMMIT_SAMPLING_POLICY}\').')
+
+    def handle(self, *args, **options):
+        token = fetch.GITHUB_TOKENS[0] if fetch.GITHUB_TOKENS else None
+        if not token:
+            self.stdout.write(self.style.WARNING("GITHUB_TOKEN not set; requests will be unauthenticated and heavily rate limited."))
+        fetch.use_dead_letter_file(CRAWL_DEAD_LETTER_FILE)
+
+        if options['replay_dead_letters']:
+            self.replay_dead_letters(token)
+            return
+
+        repo_urls: List[str] = list(options['repo_urls'])
+        if options['org']:
+            discovered_repos: List[Dict[str, Any]] = []
+            for org in options['org']:
+                org_repos = fetch.fetch_org_repositories(org, token)
+                if org_repos is None:
+                    self.stdout.write(self.style.WARNING(f"Could not list the repositories of '{org}'."))
+                    continue
+                discovered_repos.extend(org_repos)
+            repo_urls += [u for u in fetch.prioritise_repositories(discovered_repos)[:options['max_repos']] if u not in repo_urls]
+        if not repo_urls:
+            raise CommandError("No repositories to crawl. Pass repository URLs or --org.")
+
+        if options['clear']:
+            self.stdout.write(self.style.WARNING("Clearing existing data..."))
+            with transaction.atomic():
+                clear_all()
+            if os.path.exists(CRAWL_WATERMARKS_FILE):
+                os.remove(CRAWL_WATERMARKS_FILE)
+            self.stdout.write(self.style.SUCCESS("Existing data cleared."))
+
+        # Repos with a watermark only fetch newer activity; the upserts add it to what is stored
+        watermarks = {} if options['full'] else fetch.load_watermarks(CRAWL_WATERMARKS_FILE)
+        if watermarks:
+            self.stdout.write(f"Incremental crawl: {len(watermarks)} repositories have watermarks in {CRAWL_WATERMARKS_FILE}.")
+
+        checkpoint = fetch.CrawlCheckpoint(CRAWL_CHECKPOINT_DIR)
+        if not options['resume']:
+            checkpoint.clear()
+
+        loader = RecordLoader()
+        warn = lambda message: self.stdout.write(self.style.WARNING(message))
+
+        def on_repository_done(repo_url: str, records: List[Dict[str, Any]], refetched_issue_urls: Set[str]) -> None:
+            # One transaction per repository, so readers see each repository complete or not at all
+            with transaction.atomic():
+                # Re-fetched issues may have changed assignees, so drop the rows of those who no longer hold them
+                assignees_by_issue = collections.defaultdict(set)
+                for record in records:
+                    for work in record['works']:
+                        for issue in work['issues']:
+                            assignees_by_issue[issue['html_url']].add(record['username'])
+                for issue_url in refetched_issue_urls:
+                    remove_issue(issue_url, keep_usernames=assignees_by_issue[issue_url])
+                for record in records:
+                    loader.load_contributor(record, warn=warn)
+            fetch.save_watermarks(CRAWL_WATERMARKS_FILE, watermarks)
+            checkpoint.discard(repo_url) # Already in the database
+            self.stdout.write(self.style.SUCCESS(f"Stored {len(records)} contributor-work records for {repo_url}."))
+
+        self.stdout.write(f"Crawling {len(repo_urls)} repositories into the database...")
+        start_time = time.time()
+        fetch.process_repositories(
+            repo_urls, token, existing_contributors={}, watermarks=watermarks,
+            on_repository_done=on_repository_done, keep_works=False, checkpoint=checkpoint,
+            sampling_policy=options['commit_sampling']
+        )
+        checkpoint.clear()
+
+        self.stdout.write(self.style.SUCCESS(f"\nCrawl finished in {time.time() - start_time:.2f} seconds."))
+        self.stdout.write(f"Processed {loader.counts['contributors_processed']} contributor-work records "
+                          f"({loader.counts['contributors']} new contributors).")
+        self.stdout.write(f"Created/updated {len(loader.repo_cache)} repositories ({loader.counts['repositories']} new).")
+        self.stdout.write(f"Created {loader.counts['works']} new RepositoryWork links.")
+        self.stdout.write(f"Created {loader.counts['issues']} new issues.")
+        self.stdout.write(f"Created {loader.counts['commits']} new commits.")
+        for line in fetch.FETCH_METRICS.summary_lines():
+            self.stdout.write(line)
+        if fetch.DEAD_LETTERS.count:
+            self.stdout.write(self.style.WARNING(
+                f"{fetch.DEAD_LETTERS.count} requests still failed after retries; run with --replay-dead-letters to retry just those."
+            ))
+
+    def replay_dead_letters(self, token) -> None:
+        """Retries the dead-lettered requests and upserts what they return. Requests that fail again stay dead-lettered."""
+        entries = fetch.begin_dead_letter_replay()
+        if not entries:
+            self.stdout.write(self.style.SUCCESS(f"No dead letters to replay in {fetch.DEAD_LETTER_FILE}."))
+            return
+        self.stdout.write(f"Replaying {len(entries)} dead-lettered requests from {fetch.DEAD_LETTER_FILE}...")
+
+        watermarks = fetch.load_watermarks(CRAWL_WATERMARKS_FILE)
+        records, unattributed = fetch.replay_dead_letters(fetch.ContributorGraph(), entries, token, watermarks, keep_works=False)
+        loader = RecordLoader()
+        with transaction.atomic():
+            for record in records:
+                loader.load_contributor(record, warn=lambda message: self.stdout.write(self.style.WARNING(message)))
+        fetch.save_watermarks(CRAWL_WATERMARKS_FILE, watermarks)
+
+        still_failing = fetch.finish_dead_letter_replay(unattributed)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(records)} contributor-work records ({loader.counts['issues']} new issues, {loader.counts['commits']} new commits)."
+        ))
+        if still_failing:
+            self.stdout.write(self.style.WARNING(f"{still_failing} requests still fail; they remain in {fetch.DEAD_LETTER_FILE}."))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_remove_contributor_works_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commit',
+            name='files_count',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commit',
+            name='language_breakdown',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commit',
+            name='lines_added',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commit',
+            name='lines_removed',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_commit_diff_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repositorywork',
+            name='weekly_activity',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_repositorywork_weekly_activity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repository',
+            name='url',
+            field=models.URLField(unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='commit',
+            constraint=models.UniqueConstraint(fields=('work', 'url'), name='unique_commit_per_work'),
+        ),
+        migrations.AddConstraint(
+            model_name='issue',
+            constraint=models.UniqueConstraint(fields=('work', 'url'), name='unique_issue_per_work'),
+        ),
+        migrations.AddConstraint(
+            model_name='repositorywork',
+            constraint=models.UniqueConstraint(fields=('repository', 'contributor'), name='unique_work_per_repository_contributor'),
+        ),
+    ]
@@ -7,7 +7,7 @@ class Repository(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=255)
     avatar_url = models.URLField()
-    url = models.URLField()
+    url = models.URLField(unique=True)
     summary = models.TextField()
     raw_data = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -35,9 +35,17 @@ class RepositoryWork(models.Model):
     repository = models.ForeignKey(Repository, on_delete=models.CASCADE)
     contributor = models.ForeignKey(Contributor, on_delete=models.CASCADE, related_name='works')
     summary = models.TextField()
+    # Weeks with activity from GitHub's contributor statistics, whole history:
+    # [{"week": "YYYY-MM-DD", "commits": n, "additions": n, "deletions": n}]; null if not fetched
+    weekly_activity = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['repository', 'contributor'], name='unique_work_per_repository_contributor'),
+        ]
+
     def __str__(self):
         return f"{self.contributor.username} - {self.repository.name}"
     
@@ -50,11 +58,26 @@ class Issue(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['work', 'url'], name='unique_issue_per_work'),
+        ]
+
 class Commit(models.Model):
     id = models.AutoField(primary_key=True)
     work = models.ForeignKey(RepositoryWork, on_delete=models.CASCADE, related_name='commits')
     url = models.URLField()
     raw_data = models.JSONField()
     summary = models.TextField()
+    # Computed from raw_data's diff_patch by the analyze_diffs command; null until analysed
+    lines_added = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    lines_removed = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    files_count = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    language_breakdown = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['work', 'url'], name='unique_commit_per_work'),
+        ]
@@ -0,0 +1,155 @@
+"""
+Reads contributor records from fetch.py output one at a time, so memory stays flat however large the file is.
+The JSON document form (`{"contributors": [...], "metadata": {...}}`) is parsed incrementally with
+json.JSONDecoder.raw_decode; the NDJSON form (`.ndjson`/`.jsonl`, one record per line) is read line by line.
+Either may be gzip-compressed (`.gz`).
+"""
+import gzip
+import json
+from typing import Any, Dict, Iterator, TextIO
+
+CHUNK_SIZE = 1 << 16 # Characters read at a time; grown while a single value doesn't fit
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+WHITESPACE = ' \t\n\r'
+
+
+class RecordStreamError(ValueError):
+    """The input file is not valid fetch.py output (bad JSON, bad encoding, or no `contributors` list)."""
+
+
+def open_text(path: str) -> TextIO:
+    """Opens a file for reading text, decompressing it when the path ends in .gz."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def is_ndjson_path(path: str) -> bool:
+    return path[:-len('.gz')].endswith(NDJSON_SUFFIXES) if path.endswith('.gz') else path.endswith(NDJSON_SUFFIXES)
+
+
+class JSONStreamReader:
+    """
+    Decodes the values of a JSON document one by one from a text stream. Only the unparsed part of the
+    current chunk is held, so memory is bounded by the largest single value decoded, not the document.
+    """
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Drops the consumed text and reads more, at least as much as is still unparsed. Returns False at EOF."""
+        remaining = self.buffer[self.pos:]
+        chunk = self.stream.read(max(self.chunk_size, len(remaining)))
+        self.buffer, self.pos = remaining + chunk, 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """The next non-whitespace character, without consuming it ('' at the end of the stream)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, token: str) -> None:
+        found = self.peek()
+        if found != token:
+            raise ValueError(f"Expected '{token}' but found {found!r} at character {self.pos} of the current chunk.")
+        self.pos += 1
+
+    def decode_value(self) -> Any:
+        """Decodes the next complete JSON value, reading further chunks until it fits."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self.fill():
+                    raise
+                continue
+            if end == len(self.buffer) and not self.eof:
+                self.fill() # A number may continue in the next chunk, so decode again with it
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yields the elements of the array that starts at the current position."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or ']' between array elements but found {separator!r}.")
+
+
+def iter_document_records(stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yields the entries of a JSON document's top-level `contributors` list. Other keys are decoded and dropped."""
+    reader = JSONStreamReader(stream, chunk_size)
+    found_contributors = False
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.decode_value()
+            reader.expect(':')
+            if key == 'contributors':
+                if reader.peek() != '[':
+                    raise ValueError("Invalid JSON format: Expected a 'contributors' key with a list value.")
+                found_contributors = True
+                yield from reader.iter_array()
+            else:
+                reader.decode_value()
+            separator = reader.peek()
+            reader.pos += 1
+            if separator == '}':
+                break
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' between object members but found {separator!r}.")
+    if not found_contributors:
+        raise ValueError("Invalid JSON format: Expected a 'contributors' key with a list value.")
+
+
+def iter_ndjson_records(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yields the contributor records of an NDJSON stream, skipping the metadata lines fetch.py appends after each run."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+        if isinstance(record, dict) and 'metadata' in record and 'username' not in record:
+            continue
+        yield record
+
+
+def iter_contributor_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the contributor records of a fetch.py output file, in file order. Raises RecordStreamError for
+    malformed input (records before the error have already been yielded) and OSError if it can't be read.
+    """
+    with open_text(path) as stream:
+        try:
+            if is_ndjson_path(path):
+                yield from iter_ndjson_records(stream)
+            else:
+                yield from iter_document_records(stream)
+        except ValueError as e: # Includes json.JSONDecodeError and UnicodeDecodeError
+            raise RecordStreamError(str(e)) from e
@@ -1,3 +1,1254 @@
-from django.test import TestCase
+import contextlib
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qsl, urlparse
 
-# Create your tests here.
+import requests
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from .models import Repository, Contributor, RepositoryWork, Issue, Commit
+from .diff_stats import commit_diff_stats, count_patch_lines
+from .ingest import BulkRecordLoader, RecordLoader
+from .record_stream import RecordStreamError, iter_contributor_records, iter_document_records, open_text
+from .fetcher import fetch
+
+WEBHOOK_FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'webhooks'
+WEBHOOK_SECRET = 'test-webhook-secret'
+
+
+@override_settings(GITHUB_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class GitHubWebhookTests(TestCase):
+    """Replays recorded webhook payloads against the github_webhook view."""
+
+    def deliver(self, event, fixture=None, body=None, secret=WEBHOOK_SECRET):
+        if body is None:
+            body = (WEBHOOK_FIXTURES / f'{fixture}.json').read_bytes()
+        signature = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('github_webhook'), data=body, content_type='application/json',
+            HTTP_X_GITHUB_EVENT=event, HTTP_X_HUB_SIGNATURE_256=signature,
+        )
+
+    def test_rejects_bad_signature(self):
+        response = self.deliver('push', 'push', secret='wrong-secret')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Commit.objects.exists())
+
+    @override_settings(GITHUB_WEBHOOK_SECRET=None)
+    def test_refuses_deliveries_without_a_configured_secret(self):
+        self.assertEqual(self.deliver('push', 'push').status_code, 503)
+
+    def test_ping(self):
+        response = self.deliver('ping', body=b'{"zen": "Keep it logically awesome."}')
+        self.assertEqual(response.json(), {"status": "pong"})
+
+    def test_push_upserts_distinct_commits_under_their_authors(self):
+        response = self.deliver('push', 'push')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['commits'], 2)
+
+        self.assertEqual(Repository.objects.get().url, 'https://github.com/simpeg/simpeg')
+        commit = Commit.objects.get(url__endswith='4b1d2e3f5a6c7d8e9f00112233445566778899aa')
+        self.assertEqual(commit.work.contributor.username, 'jdoe')
+        self.assertEqual(commit.raw_data['files_changed'], [
+            {"filename": "tests/test_tiles.py", "status": "added"},
+            {"filename": "simpeg/directives/_directives.py", "status": "modified"},
+        ])
+        self.assertEqual(Contributor.objects.get(username='jdoe').avatar_url, 'https://avatars.githubusercontent.com/u/1203345?v=4')
+        self.assertEqual(Commit.objects.get(url__endswith='9c2f5c1c0b1ea52d8d3c3d0e1b8f0c2d6f2a4e11').work.contributor.username, 'sroe')
+        self.assertFalse(Commit.objects.filter(url__endswith='77aa88bb99cc00dd11ee22ff33aa44bb55cc66dd').exists())
+
+        # Redelivery doesn't duplicate rows
+        self.deliver('push', 'push')
+        self.assertEqual(Commit.objects.count(), 2)
+
+    def test_push_matches_crawled_commits_and_keeps_their_patches(self):
+        payload = json.loads((WEBHOOK_FIXTURES / 'push.json').read_text())
+        payload['commits'][0]['message'] = 'Fix sensitivity weighting\n\nLong description of the fix.'
+        crawled = {"sha": payload['commits'][0]['id'], "url": payload['commits'][0]['url'], "message": "Fix sensitivity weighting",
+                   "files_changed": [{"filename": "tests/test_tiles.py", "status": "added"}], "comment_count": 0,
+                   "diff_patch": "--- File: tests/test_tiles.py ---\n@@ -0,0 +1 @@\n+import simpeg"}
+        RecordLoader().load_contributor({"username": "jdoe", "url": "https://github.com/jdoe", "avatar_url": "", "works": [
+            {"repository_url": "https://github.com/simpeg/simpeg", "issues": [], "commits": [crawled]},
+        ]})
+
+        self.deliver('push', body=json.dumps(payload).encode('utf-8'))
+        commit = Commit.objects.get(url=crawled['url'])
+        self.assertEqual(commit.raw_data['message'], 'Fix sensitivity weighting')
+        self.assertEqual(commit.raw_data['diff_patch'], crawled['diff_patch'])
+        self.assertEqual(Commit.objects.get(url=payload['commits'][1]['url']).raw_data['message'], payload['commits'][1]['message'])
+
+    def test_push_to_other_branch_is_ignored(self):
+        payload = json.loads((WEBHOOK_FIXTURES / 'push.json').read_text())
+        payload['ref'] = 'refs/heads/feature'
+        response = self.deliver('push', body=json.dumps(payload).encode('utf-8'))
+        self.assertEqual(response.json()['status'], 'ignored')
+        self.assertFalse(Commit.objects.exists())
+
+    def test_push_marks_existing_summaries_stale(self):
+        repository = Repository.objects.create(name='simpeg/simpeg', url='https://github.com/simpeg/simpeg', avatar_url='', summary='')
+        contributor = Contributor.objects.create(username='jdoe', url='https://github.com/jdoe', avatar_url='', summary='Profile')
+        work = RepositoryWork.objects.create(repository=repository, contributor=contributor, summary='Work summary')
+        Commit.objects.create(work=work, url='https://github.com/simpeg/simpeg/commit/0ld', raw_data={}, summary='Old commit')
+
+        self.deliver('push', 'push')
+        work.refresh_from_db()
+        contributor.refresh_from_db()
+        self.assertEqual(work.summary, '')
+        self.assertEqual(contributor.summary, '')
+        self.assertEqual(Commit.objects.get(url__endswith='0ld').summary, 'Old commit')
+        self.assertEqual(work.commits.count(), 2)
+
+    def test_closed_issue_is_stored_per_assignee_and_reopening_removes_it(self):
+        response = self.deliver('issues', 'issues_closed')
+        self.assertEqual(response.json()['issues'], 2)
+        issues = Issue.objects.filter(url='https://github.com/simpeg/simpeg/issues/1523')
+        self.assertEqual(sorted(i.work.contributor.username for i in issues), ['jdoe', 'kli'])
+        self.assertEqual(issues.first().raw_data['state_reason'], 'completed')
+        self.assertEqual(issues.first().raw_data['labels'][0]['name'], 'bug')
+
+        for work in RepositoryWork.objects.all():
+            work.summary = 'Work summary'
+            work.save()
+        response = self.deliver('issues', 'issues_reopened')
+        self.assertEqual(response.json()['removed_issues'], 2)
+        self.assertFalse(Issue.objects.exists())
+        self.assertFalse(RepositoryWork.objects.exclude(summary='').exists())
+
+    def test_bot_assignees_are_not_stored(self):
+        payload = json.loads((WEBHOOK_FIXTURES / 'issues_closed.json').read_text())
+        payload['issue']['assignees'][1].update(login='renovate[bot]', type='Bot')
+        response = self.deliver('issues', body=json.dumps(payload).encode('utf-8'))
+        self.assertEqual(response.json()['issues'], 1)
+        self.assertEqual(list(Contributor.objects.values_list('username', flat=True)), ['jdoe'])
+
+    def test_unassigned_contributor_loses_the_issue(self):
+        self.deliver('issues', 'issues_closed')
+        payload = json.loads((WEBHOOK_FIXTURES / 'issues_closed.json').read_text())
+        payload['action'] = 'unassigned'
+        payload['issue']['assignees'] = payload['issue']['assignees'][:1]
+        self.deliver('issues', body=json.dumps(payload).encode('utf-8'))
+        self.assertEqual([i.work.contributor.username for i in Issue.objects.all()], ['jdoe'])
+
+
+class CommitDiffStatsTests(SimpleTestCase):
+
+    def test_counts_lines_per_file_and_language(self):
+        diff_patch = (
+            "--- File: simpeg/maps.py ---\n"
+            "@@ -10,3 +10,4 @@ class Map:\n"
+            "     def __init__(self):\n"
+            "-        self.x = 1\n"
+            "+        self.x = 2\n"
+            "+        self.y = 3\n"
+            "     pass\n\n"
+            "--- File: README.md ---\n"
+            "@@ -1 +1 @@\n"
+            "--- File: not/a/header.py ---\n"
+            "+++ File: still content\n"
+            "\\ No newline at end of file"
+        )
+        stats = commit_diff_stats({"diff_patch": diff_patch, "files_changed": [
+            {"filename": "simpeg/maps.py", "status": "modified"},
+            {"filename": "README.md", "status": "modified"},
+            {"filename": "docs/logo.png", "status": "added"},
+        ]})
+        self.assertEqual(stats, {
+            'lines_added': 3,
+            'lines_removed': 2,
+            'files_count': 3,
+            'language_breakdown': {'Python': 3, 'Markdown': 2},
+        })
+
+    def test_commit_without_patch_has_no_line_counts(self):
+        stats = commit_diff_stats({"diff_patch": None, "files_changed": [{"filename": "a.py", "status": "added"}]})
+        self.assertIsNone(stats['lines_added'])
+        self.assertEqual(stats['files_count'], 1)
+        self.assertEqual(stats['language_breakdown'], {})
+
+
+class FetchMetricsTests(SimpleTestCase):
+
+    def test_report_counts_requests_per_endpoint_with_latency_percentiles(self):
+        metrics = fetch.FetchMetrics()
+        for _ in range(8):
+            metrics.record_request('commit_detail', 200, 0.03, 100)
+        metrics.record_request('commit_detail', 304, 0.3)
+        metrics.record_request('commit_detail', None, 12)
+        metrics.record_cache_hit('commit_detail')
+        metrics.record_request('issue_list', 200, 0.02, 10)
+        metrics.record_page('issue_list', 30)
+        metrics.record_retry('commit_detail', 'network_error')
+
+        report = metrics.report()
+        self.assertEqual((report["requests"], report["bytes"], report["retries"]), (11, 810, {"commit_detail:network_error": 1}))
+        commit_detail = report["endpoints"]["commit_detail"]
+        self.assertEqual(
+            {k: commit_detail[k] for k in ("requests", "status_codes", "network_errors", "not_modified", "cache_hits", "bytes")},
+            {"requests": 10, "status_codes": {"200": 8, "304": 1}, "network_errors": 1, "not_modified": 1, "cache_hits": 1, "bytes": 800},
+        )
+        self.assertEqual({k: v for k, v in commit_detail["latency_histogram_ms"].items() if v}, {"<=50": 8, "<=500": 1, ">10000": 1})
+        # Percentiles are read off the histogram: the bucket's upper bound, capped at the largest latency seen
+        self.assertEqual((commit_detail["latency_ms_p50"], commit_detail["latency_ms_p95"], commit_detail["latency_ms_max"]), (50.0, 12000.0, 12000.0))
+        issue_list = report["endpoints"]["issue_list"]
+        self.assertEqual((issue_list["latency_ms_p50"], issue_list["pages"], issue_list["items"]), (20.0, 1, 30))
+        self.assertIsNone(fetch.histogram_percentile([0] * (len(fetch.LATENCY_BUCKETS_MS) + 1), 0.5, 0.0))
+
+
+class FakeClock:
+    """Stands in for the time module in fetch.py, so waits are recorded instead of slept."""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+class RateLimitSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for patcher in (mock.patch.object(fetch, 'time', self.clock), mock.patch.object(fetch, 'FETCH_METRICS', fetch.FetchMetrics()),
+                        mock.patch.object(fetch, 'MIN_REQUEST_INTERVAL_SECONDS', 0.5)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def response(self, status, headers=None, text=''):
+        return mock.Mock(status_code=status, headers=dict(headers or {}), text=text)
+
+    def test_each_token_is_paced_by_the_floor_and_by_its_remaining_budget(self):
+        scheduler = fetch.RateLimitScheduler(['a'])
+        self.assertEqual([scheduler.acquire('a') for _ in range(3)], ['a', 'a', 'a'])
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+        # 10 requests left for the next 100 seconds: one every 10 seconds
+        scheduler.record_response('a', 'core', self.response(200, {
+            'X-RateLimit-Remaining': '10', 'X-RateLimit-Limit': '5000', 'X-RateLimit-Reset': str(self.clock.now + 100),
+        }))
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler.acquire('a')
+            scheduler.acquire('a')
+        self.assertEqual(self.clock.sleeps[-1], 10.0)
+
+    def test_rate_limited_token_is_blocked_while_the_rest_of_the_pool_is_used(self):
+        scheduler = fetch.RateLimitScheduler(['a', 'b'])
+        self.assertTrue(scheduler.record_response('a', 'core', self.response(429, {'Retry-After': '30'})))
+        self.assertEqual([scheduler.acquire('a') for _ in range(2)], ['b', 'b'])
+        self.clock.now += 31
+        self.assertEqual(scheduler.acquire('b'), 'a')
+
+        self.assertTrue(scheduler.record_response('b', 'core', self.response(403, text='You have exceeded a secondary rate limit.')))
+        self.assertEqual(scheduler.acquire('b'), 'a')
+        # A plain 403 is a permissions problem and blocks nothing
+        self.assertFalse(scheduler.record_response('a', 'core', self.response(403, text='Resource not accessible')))
+        self.clock.now += fetch.SECONDARY_RATE_LIMIT_WAIT_SECONDS
+        self.assertEqual(sorted(scheduler.acquire('a') for _ in range(2)), ['a', 'b'])
+
+    def test_tokens_outside_the_pool_are_swapped_for_pool_tokens(self):
+        self.assertEqual(fetch.RateLimitScheduler(['a', 'b']).acquire('main'), 'a')
+        self.assertEqual(fetch.RateLimitScheduler(['a', 'b']).acquire(None), 'a')
+        self.assertEqual(fetch.RateLimitScheduler([]).acquire('main'), 'main')
+
+
+class GitHubRequestTestCase(SimpleTestCase):
+    """Base for tests of make_github_request against a patched requests.Session.get, without pacing or caching."""
+    API = 'https://api.github.com'
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(fetch, 'FETCH_METRICS', fetch.FetchMetrics()), mock.patch.object(fetch, 'RATE_LIMITER', fetch.RateLimitScheduler([])),
+            mock.patch.object(fetch, 'MIN_REQUEST_INTERVAL_SECONDS', 0), mock.patch.object(fetch, 'HTTP_CACHE_DIR', ''),
+            mock.patch.object(fetch, 'API_BASE_URL', self.API), contextlib.redirect_stdout(io.StringIO()),
+        ):
+            self.enterContext(patcher)
+
+    def http_response(self, status, body=None, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body if body is not None else {}).encode('utf-8') if status != 304 else b''
+        response.headers.update(headers or {})
+        response.url = 'https://api.github.com/'
+        return response
+
+    def serve(self, routes):
+        """
+        Patches requests.Session.get to answer each URL with its responses in turn (the last one repeating).
+        Returns the (url, headers) of the requests made.
+        """
+        requested = []
+        def get(url, headers=None, **kwargs):
+            requested.append((url, dict(headers or {})))
+            responses = routes[url]
+            result = responses.pop(0) if len(responses) > 1 else responses[0]
+            if isinstance(result, Exception): raise result
+            return result
+        self.enterContext(mock.patch.object(requests.Session, 'get', side_effect=get))
+        return requested
+
+
+class RetryAndDeadLetterTests(GitHubRequestTestCase):
+    SHA = 'a' * 40
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.dead_letter_file = str(Path(directory) / 'dead_letters.jsonl')
+        for patcher in (
+            mock.patch.object(fetch, 'TRANSIENT_RETRIES', 2),
+            mock.patch.object(fetch, 'DEAD_LETTER_FILE', fetch.DEAD_LETTER_FILE), mock.patch.object(fetch, 'DEAD_LETTERS', fetch.DEAD_LETTERS),
+        ):
+            self.enterContext(patcher)
+        self.backoff_delay = self.enterContext(mock.patch.object(fetch, 'backoff_delay', return_value=0))
+        fetch.use_dead_letter_file(self.dead_letter_file)
+
+    def dead_letters(self):
+        with open(self.dead_letter_file, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def commit_url(self, sha=SHA):
+        return f'{self.API}/repos/o/r/commits/{sha}'
+
+    def commit_details(self, sha=SHA):
+        return {"sha": sha, "html_url": f"https://github.com/o/r/commit/{sha}", "commit": {"message": "Fix", "comment_count": 0},
+                "author": {"login": "alice", "id": 1, "html_url": "https://github.com/alice", "avatar_url": "", "type": "User"},
+                "files": [{"filename": "a.py", "status": "modified", "additions": 1, "deletions": 0, "patch": "@@ -0,0 +1 @@\n+x"}]}
+
+    def test_server_error_is_retried_until_it_succeeds(self):
+        requested = self.serve({self.commit_url(): [self.http_response(502), self.http_response(200, {"sha": self.SHA})]})
+        response = fetch.make_github_request(self.commit_url(), None)
+        self.assertEqual(response.json(), {"sha": self.SHA})
+        self.assertEqual(len(requested), 2)
+        self.assertEqual(fetch.FETCH_METRICS.report()["retries"], {"commit_detail:server_error": 1})
+        self.assertFalse(Path(self.dead_letter_file).exists())
+
+    def test_persistent_server_error_is_dead_lettered_after_its_retries(self):
+        requested = self.serve({self.commit_url(): [self.http_response(500)]})
+        self.assertIsNone(fetch.make_github_request(self.commit_url(), None))
+        self.assertEqual(len(requested), 1 + fetch.TRANSIENT_RETRIES)
+        self.assertEqual(self.backoff_delay.call_count, fetch.TRANSIENT_RETRIES)
+        self.assertEqual([(e["url"], e["endpoint"], e["reason"]) for e in self.dead_letters()],
+                         [(self.commit_url(), "commit_detail", "server_error_500")])
+
+    def test_network_errors_are_retried_then_dead_lettered(self):
+        requested = self.serve({
+            self.commit_url(): [requests.exceptions.ConnectionError("reset"), self.http_response(200, {"sha": self.SHA})],
+            self.commit_url('b' * 40): [requests.exceptions.ConnectionError("reset")],
+        })
+        self.assertEqual(fetch.make_github_request(self.commit_url(), None).status_code, 200)
+        self.assertIsNone(fetch.make_github_request(self.commit_url('b' * 40), None))
+        self.assertEqual(len(requested), 2 + 1 + fetch.TRANSIENT_RETRIES)
+        self.assertEqual([e["reason"] for e in self.dead_letters()], ["network_error"])
+
+    def test_replayed_commit_detail_is_merged_into_its_author_work(self):
+        self.serve({self.commit_url(): [self.http_response(200, self.commit_details())]})
+        graph = fetch.ContributorGraph()
+        graph.add_contributor("alice", 1, "https://github.com/alice", "")
+        work, _ = graph.get_or_create_work("alice", "https://github.com/o/r")
+        work.replace([], [fetch.simplify_commit(self.commit_details())])
+        entry = {"url": self.commit_url(), "endpoint": "commit_detail", "reason": "server_error_502"}
+
+        records, unattributed = fetch.replay_dead_letters(graph, [entry])
+        self.assertEqual(unattributed, [])
+        [commit] = graph.to_contributors_map()["alice"]["works"][0]["commits"]
+        self.assertEqual(commit["files_changed"], [{"filename": "a.py", "status": "modified", "additions": 1, "deletions": 0}])
+        self.assertEqual(records[0]["works"][0]["commits"], [commit])
+
+    def test_failed_list_request_recrawls_its_repository(self):
+        activity = {
+            "repository_url": "https://github.com/o/r", "owner": "o", "repo": "r", "is_incremental": False,
+            "contributors": [], "issues_by_user": {}, "commits_by_user": {"alice": [fetch.simplify_commit(self.commit_details())]},
+            "assignee_details": {}, "author_details": {"alice": {"id": 1, "url": "https://github.com/alice", "avatar_url": ""}},
+            "refetched_issue_urls": set(), "watermark": {"last_commit_sha": self.SHA},
+        }
+        entries = [{"url": f'{self.API}/repos/o/r/commits', "params": {"page": 3}, "endpoint": "commit_list"},
+                   {"url": self.commit_url(), "endpoint": "commit_detail"}]
+        watermarks = {}
+        with mock.patch.object(fetch, 'fetch_repository_activity', return_value=activity) as fetch_activity:
+            records, _ = fetch.replay_dead_letters(fetch.ContributorGraph(), entries, watermarks=watermarks)
+        fetch_activity.assert_called_once_with("https://github.com/o/r", None)
+        self.assertEqual([r["username"] for r in records], ["alice"]) # The detail entry is covered by the re-crawl
+        self.assertEqual(watermarks, {"https://github.com/o/r": {"last_commit_sha": self.SHA}})
+
+    def test_entries_that_fail_again_stay_in_the_file(self):
+        failing_url = self.commit_url('b' * 40)
+        self.serve({self.commit_url(): [self.http_response(200, self.commit_details())], failing_url: [self.http_response(500)]})
+        fetch.DEAD_LETTERS.record(self.commit_url(), None, "application/vnd.github+json", None, "server_error_502")
+        fetch.DEAD_LETTERS.record(failing_url, None, "application/vnd.github+json", None, "server_error_502")
+        fetch.DEAD_LETTERS.record(failing_url, None, "application/vnd.github+json", None, "server_error_502") # A repeat
+        fetch.DEAD_LETTERS.record(f'{self.API}/graphql', None, "application/json", {"query": "{}"}, "network_error")
+
+        entries = fetch.begin_dead_letter_replay()
+        self.assertEqual(len(entries), 3)
+        _, unattributed = fetch.replay_dead_letters(fetch.ContributorGraph(), entries)
+        self.assertEqual(fetch.finish_dead_letter_replay(unattributed), 2)
+        self.assertEqual([(e["url"], e["reason"]) for e in self.dead_letters()],
+                         [(failing_url, "server_error_500"), (f'{self.API}/graphql', "network_error")])
+        self.assertFalse(Path(self.dead_letter_file + ".replay").exists())
+
+
+class ResponseCacheTests(GitHubRequestTestCase):
+    COMMIT_URL = 'https://api.github.com/repos/o/r/commits/' + 'a' * 40
+    LIST_URL = 'https://api.github.com/repos/o/r/issues'
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.enterContext(mock.patch.object(fetch, 'HTTP_CACHE_DIR', directory))
+
+    def endpoint_metrics(self, endpoint):
+        return fetch.FETCH_METRICS.report()["endpoints"][endpoint]
+
+    def test_immutable_entry_is_served_without_a_request(self):
+        requested = self.serve({self.COMMIT_URL: [self.http_response(200, {"sha": "a" * 40}, {"ETag": '"v1"'})]})
+        fetch.make_github_request(self.COMMIT_URL, 'token')
+        self.assertEqual(fetch.make_github_request(self.COMMIT_URL, 'token').json(), {"sha": "a" * 40})
+        self.assertEqual(len(requested), 1)
+        self.assertEqual(self.endpoint_metrics("commit_detail")["cache_hits"], 1)
+
+    def test_not_modified_response_returns_the_cached_body(self):
+        requested = self.serve({self.LIST_URL: [
+            self.http_response(200, [{"number": 1}], {"ETag": '"v1"', "Last-Modified": "Sun, 02 Jun 2024 10:00:00 GMT"}),
+            self.http_response(304),
+        ]})
+        fetch.make_github_request(self.LIST_URL, 'token', params={"page": 1})
+        response = fetch.make_github_request(self.LIST_URL, 'token', params={"page": 1})
+        self.assertEqual((response.status_code, response.json()), (200, [{"number": 1}]))
+        self.assertNotIn("If-None-Match", requested[0][1])
+        self.assertEqual(requested[1][1]["If-None-Match"], '"v1"')
+        self.assertEqual(requested[1][1]["If-Modified-Since"], "Sun, 02 Jun 2024 10:00:00 GMT")
+        self.assertEqual(self.endpoint_metrics("issue_list")["not_modified"], 1)
+
+    def test_unreadable_entry_falls_back_to_a_live_request(self):
+        cache_path = fetch.response_cache_path(self.COMMIT_URL, None, "application/vnd.github+json", 'token')
+        os.makedirs(os.path.dirname(cache_path))
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            f.write('{"url": "https://api.github.com/", "status_code": 200, "bo')
+        requested = self.serve({self.COMMIT_URL: [self.http_response(200, {"sha": "a" * 40})]})
+        self.assertEqual(fetch.make_github_request(self.COMMIT_URL, 'token').json(), {"sha": "a" * 40})
+        self.assertEqual(len(requested), 1)
+        with open(cache_path, encoding='utf-8') as f:
+            self.assertEqual(json.loads(json.load(f)["body"]), {"sha": "a" * 40}) # Rewritten by the live response
+
+    def test_entries_are_kept_apart_per_credentials(self):
+        path = lambda token: fetch.response_cache_path(self.LIST_URL, None, "application/vnd.github+json", token)
+        self.assertNotEqual(path('token-a'), path('token-b'))
+        self.assertNotEqual(path('token-a'), path(None))
+        with mock.patch.object(fetch, 'RATE_LIMITER', fetch.RateLimitScheduler(['token-a', 'token-b'])):
+            self.assertEqual(path('token-a'), path('token-b')) # Any pool token may serve the request
+
+
+class PaginationTests(SimpleTestCase):
+    URL = 'https://api.github.com/repos/o/r/issues'
+
+    def serve(self, page_count, failing=(), last_link=True):
+        """A stand-in for make_github_request serving `page_count` pages of two items, and the pages it was asked for."""
+        requested = []
+        def make_github_request(url, token, params=None, **kwargs):
+            query = dict(parse_qsl(urlparse(url).query), **(params or {}))
+            page = int(query['page'])
+            requested.append(page)
+            if page in failing:
+                return None
+            links = {}
+            if page < page_count:
+                links['next'] = {'url': fetch.page_url(f'{self.URL}?state=closed&per_page=2', page + 1)}
+                if last_link: links['last'] = {'url': fetch.page_url(f'{self.URL}?state=closed&per_page=2', page_count)}
+            items = [{"n": page * 10 + i} for i in range(2)]
+            return mock.Mock(status_code=200, content=json.dumps(items).encode('utf-8'), links=links, json=mock.Mock(return_value=items))
+        return requested, make_github_request
+
+    def test_page_url_replaces_only_the_page_parameter(self):
+        self.assertEqual(fetch.page_url(f'{self.URL}?state=closed&page=2&per_page=100', 7), f'{self.URL}?state=closed&per_page=100&page=7')
+
+    def test_concurrent_pages_arrive_in_order(self):
+        for last_link in (True, False):
+            requested, fake_request = self.serve(6, last_link=last_link)
+            with mock.patch.object(fetch, 'make_github_request', side_effect=fake_request):
+                items = fetch.fetch_paginated_data(self.URL, None, {"state": "closed", "per_page": 2})
+            self.assertEqual([i["n"] for i in items], [n for page in range(1, 7) for n in (page * 10, page * 10 + 1)])
+            self.assertEqual(sorted(requested), [1, 2, 3, 4, 5, 6])
+
+    def test_failed_page_stops_pagination(self):
+        requested, fake_request = self.serve(6, failing={3})
+        with mock.patch.object(fetch, 'make_github_request', side_effect=fake_request):
+            pages = list(fetch.iter_paginated_pages(self.URL, None))
+            self.assertEqual(pages[-1], None)
+            self.assertEqual(len(pages), 3)
+            self.assertEqual(len(fetch.fetch_paginated_data(self.URL, None)), 4) # The pages before the failure
+
+        requested, fake_request = self.serve(6, failing={1})
+        with mock.patch.object(fetch, 'make_github_request', side_effect=fake_request):
+            self.assertIsNone(fetch.fetch_paginated_data(self.URL, None))
+
+    def test_lazy_listing_stops_requesting_pages_with_its_consumer(self):
+        requested, fake_request = self.serve(20)
+        with mock.patch.object(fetch, 'make_github_request', side_effect=fake_request), \
+                mock.patch.object(fetch, 'MAX_CONCURRENT_PAGE_REQUESTS', 2):
+            keys = (item["n"] for item in fetch.iter_paginated_data(self.URL, None))
+            details = fetch.fetch_details_up_to_limit(lambda n: {"n": n}, keys, 3, "issue")
+            keys.close()
+        self.assertEqual(sorted(details), [10, 11, 20])
+        # Page 2 was read, and at most the two pages fetched ahead of it were requested
+        self.assertLessEqual(max(requested), 4)
+
+
+class OrgRepositoryTests(SimpleTestCase):
+
+    def repo(self, name, pushed_at, size=100, **flags):
+        return dict({"html_url": f"https://github.com/org/{name}", "pushed_at": pushed_at, "size": size}, **flags)
+
+    def test_org_listing_is_filtered_and_ordered_by_push_day_then_size(self):
+        repos = [
+            self.repo("small-today", "2024-06-10T23:59:00Z", size=10),
+            self.repo("big-today", "2024-06-10T08:00:00Z", size=5000),
+            self.repo("latest", "2024-06-11T00:01:00Z", size=1),
+            self.repo("old", "2023-01-01T00:00:00Z", size=90000),
+            self.repo("fork", "2024-06-12T00:00:00Z", fork=True),
+            self.repo("archived", "2024-06-12T00:00:00Z", archived=True),
+            self.repo("empty", "2024-06-12T00:00:00Z", size=0),
+            self.repo("never-pushed", None),
+        ]
+        with mock.patch.object(fetch, 'fetch_paginated_data', return_value=repos) as list_repos, \
+                contextlib.redirect_stdout(io.StringIO()):
+            listed = fetch.fetch_org_repositories('org')
+            self.assertEqual(list_repos.call_args.args[0], f"{fetch.API_BASE_URL}/orgs/org/repos")
+            self.assertEqual([r["html_url"].rsplit('/', 1)[1] for r in listed],
+                             ["small-today", "big-today", "latest", "old", "never-pushed"])
+            self.assertEqual([url.rsplit('/', 1)[1] for url in fetch.prioritise_repositories(listed)],
+                             ["latest", "big-today", "small-today", "old", "never-pushed"])
+
+            with mock.patch.object(fetch, 'ORG_INCLUDE_FORKS', True), mock.patch.object(fetch, 'ORG_INCLUDE_ARCHIVED', True):
+                self.assertEqual(len(fetch.fetch_org_repositories('org')), 7)
+
+
+class ContributorGraphTests(SimpleTestCase):
+    REPO = 'https://github.com/o/r'
+
+    def commit(self, sha, message='Change'):
+        return {"sha": sha, "url": f"{self.REPO}/commit/{sha}", "message": message, "files_changed": [], "comment_count": 0, "diff_patch": None}
+
+    def issue(self, number, title='Issue'):
+        return {"html_url": f"{self.REPO}/issues/{number}", "number": number, "title": title, "body": "", "labels": [], "comments": 0, "state_reason": "completed"}
+
+    def merge(self, graph, issues_by_user=None, commits_by_user=None, is_incremental=False, refetched=(), keep_works=True):
+        users = [{"login": login, "id": n, "html_url": f"https://github.com/{login}", "avatar_url": "", "type": "User"}
+                 for n, login in enumerate(("alice", "bob", "dependabot[bot]"))]
+        users[2]["type"] = "Bot"
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fetch.merge_repository_activity(graph, {
+                "repository_url": self.REPO, "owner": "o", "repo": "r", "is_incremental": is_incremental, "contributors": users,
+                "issues_by_user": issues_by_user or {}, "commits_by_user": commits_by_user or {},
+                "assignee_details": {}, "author_details": {}, "refetched_issue_urls": set(refetched), "weekly_activity_by_user": None,
+            }, keep_works)
+
+    def work(self, graph, username):
+        return graph.to_contributors_map()[username]["works"][0]
+
+    def test_full_run_replaces_and_incremental_run_extends(self):
+        graph = fetch.ContributorGraph()
+        records = self.merge(graph, {"alice": [self.issue(1)]}, {"alice": [self.commit('a1'), self.commit('a1')], "bob": [self.commit('b1')]})
+        self.assertEqual([r["username"] for r in records], ["alice", "bob"])
+        self.assertNotIn("dependabot[bot]", graph.contributors)
+        self.assertEqual([c["sha"] for c in self.work(graph, "alice")["commits"]], ["a1"]) # First copy of a duplicate wins
+
+        # Incremental: new activity goes in front, and a re-fetched commit replaces its stored copy
+        self.merge(graph, commits_by_user={"alice": [self.commit('a2'), self.commit('a1', 'Edited')]}, is_incremental=True)
+        commits = self.work(graph, "alice")["commits"]
+        self.assertEqual([(c["sha"], c["message"]) for c in commits], [("a2", "Change"), ("a1", "Edited")])
+        self.assertEqual(len(self.work(graph, "alice")["issues"]), 1)
+
+        # Full run: the work holds only this run's activity
+        self.merge(graph, commits_by_user={"alice": [self.commit('a3')]})
+        self.assertEqual(self.work(graph, "alice"), {"repository_url": self.REPO, "issues": [], "commits": [self.commit('a3')]})
+
+    def test_refetched_issue_moves_to_its_new_assignee(self):
+        graph = fetch.ContributorGraph()
+        self.merge(graph, {"alice": [self.issue(1), self.issue(2)]})
+        self.merge(graph, {"bob": [self.issue(1, 'Reassigned')]}, is_incremental=True, refetched={f"{self.REPO}/issues/1"})
+        self.assertEqual([i["number"] for i in self.work(graph, "alice")["issues"]], [2])
+        self.assertEqual(self.work(graph, "bob")["issues"], [self.issue(1, 'Reassigned')])
+
+    def test_transferred_issue_is_matched_by_number(self):
+        graph = fetch.ContributorGraph()
+        self.merge(graph, {"alice": [self.issue(1), self.issue(2)]})
+        moved = dict(self.issue(1, 'Moved'), html_url='https://github.com/o/renamed/issues/1')
+        self.merge(graph, {"alice": [moved]}, is_incremental=True, refetched={moved["html_url"]})
+        self.assertEqual(self.work(graph, "alice")["issues"], [moved, self.issue(2)])
+
+        self.merge(graph, {"bob": [moved]}, is_incremental=True, refetched={moved["html_url"]})
+        self.assertEqual(self.work(graph, "alice")["issues"], [self.issue(2)])
+
+    def test_records_are_only_built_when_consumed(self):
+        graph = fetch.ContributorGraph()
+        with contextlib.redirect_stdout(io.StringIO()):
+            records = fetch.merge_repository_activity(graph, {
+                "repository_url": self.REPO, "owner": "o", "repo": "r", "is_incremental": False, "contributors": [],
+                "issues_by_user": {}, "commits_by_user": {"alice": [self.commit('a1')]}, "assignee_details": {},
+                "author_details": {"alice": {"id": 1, "url": "https://github.com/alice"}}, "refetched_issue_urls": set(),
+            }, build_records=False)
+        self.assertEqual(records, [])
+        self.assertEqual(self.work(graph, "alice")["commits"], [self.commit('a1')])
+
+        activity = {"repository_url": self.REPO, "watermark": {}, "is_incremental": False, "refetched_issue_urls": set()}
+        for kwargs, build_records in (({}, False), ({"keep_works": False}, True), ({"on_repository_done": mock.Mock()}, True)):
+            with mock.patch.object(fetch, 'fetch_repository_activity', return_value=activity), \
+                    mock.patch.object(fetch, 'merge_repository_activity', return_value=[]) as merge_activity:
+                fetch.process_repositories([self.REPO], **kwargs)
+            self.assertEqual(merge_activity.call_args.kwargs, {"build_records": build_records})
+
+    def test_records_without_kept_works_and_round_trip(self):
+        graph = fetch.ContributorGraph()
+        records = self.merge(graph, commits_by_user={"alice": [self.commit('a1')]}, keep_works=False)
+        self.assertEqual(records[0]["works"][0]["commits"], [self.commit('a1')])
+        self.assertEqual(graph.contributors["alice"].works, {}) # Streamed out, not kept
+
+        self.merge(graph, {"bob": [self.issue(1)]}, {"alice": [self.commit('a1')]})
+        contributors_map = graph.to_contributors_map()
+        self.assertEqual(fetch.ContributorGraph.from_contributors_map(contributors_map).to_contributors_map(), contributors_map)
+        self.assertEqual(graph.repository_contributors[self.REPO], {"alice", "bob"})
+
+    def test_repositories_run_ahead_of_the_merge_only_within_the_window(self):
+        started, merged = [], []
+        def fetch_activity(repo_url, *args):
+            started.append(repo_url)
+            return {"repository_url": repo_url, "watermark": {}}
+        def merge_activity(graph, activity, *args, **kwargs):
+            merged.append((activity["repository_url"], len(started)))
+            return []
+        repo_urls = [f"https://github.com/o/r{n}" for n in range(12)]
+        with mock.patch.object(fetch, 'fetch_repository_activity', side_effect=fetch_activity), \
+                mock.patch.object(fetch, 'merge_repository_activity', side_effect=merge_activity), \
+                mock.patch.object(fetch, 'REPOSITORY_WINDOW', 3):
+            fetch.process_repositories(repo_urls)
+        self.assertEqual([url for url, _ in merged], repo_urls)
+        # Besides the repository being merged, at most the window's worth have been started
+        self.assertLessEqual(max(started_count - position - 1 for position, (_, started_count) in enumerate(merged)), 3)
+
+
+class CrawlCheckpointTests(SimpleTestCase):
+
+    repo_url = 'https://github.com/simpeg/simpeg'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.directory = str(Path(directory) / 'checkpoint')
+        self.checkpoint = fetch.CrawlCheckpoint(self.directory)
+
+    def test_resumed_fetcher_reuses_recorded_details_and_skips_a_cut_off_line(self):
+        calls = []
+        def fetch_details(key):
+            calls.append(key)
+            return {"sha": key} if key != 'gone' else None
+
+        fetcher = self.checkpoint.checkpointed_fetcher(self.repo_url, 'commit', fetch_details)
+        self.assertEqual(fetcher('abc'), {"sha": "abc"})
+        self.assertIsNone(fetcher('gone'))
+        details_path = Path(self.directory) / 'simpeg__simpeg' / 'details-commit.jsonl'
+        with open(details_path, 'a', encoding='utf-8') as f:
+            f.write('{"key": "def", "da')
+
+        resumed = fetch.CrawlCheckpoint(self.directory)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetcher = resumed.checkpointed_fetcher(self.repo_url, 'commit', fetch_details)
+        self.assertEqual(fetcher('abc'), {"sha": "abc"})
+        self.assertIsNone(fetcher('gone'))
+        self.assertEqual(calls, ['abc', 'gone', 'gone'])
+        self.assertEqual(resumed.load_details(self.repo_url, 'issue'), {})
+
+    def test_saved_activity_round_trips_and_replaces_detail_checkpoints(self):
+        self.checkpoint.record_detail(self.repo_url, 'issue', 7, {"number": 7})
+        self.assertEqual(self.checkpoint.load_details(self.repo_url, 'issue'), {"7": {"number": 7}})
+        activity = {"repository_url": self.repo_url, "commits": [{"sha": "abc"}],
+                    "refetched_issue_urls": {"https://github.com/simpeg/simpeg/issues/7"}}
+        self.checkpoint.save_activity(activity)
+        self.assertEqual(self.checkpoint.load_activity(self.repo_url), activity)
+        self.assertEqual(self.checkpoint.load_details(self.repo_url, 'issue'), {})
+        self.assertIsNone(self.checkpoint.load_activity('https://github.com/simpeg/discretize'))
+
+    def test_discard_and_clear_remove_checkpoints(self):
+        other_url = 'https://github.com/simpeg/discretize'
+        for repo_url in (self.repo_url, other_url):
+            self.checkpoint.save_activity({"repository_url": repo_url, "refetched_issue_urls": set()})
+        self.checkpoint.discard(self.repo_url)
+        self.assertIsNone(self.checkpoint.load_activity(self.repo_url))
+        self.assertIsNotNone(self.checkpoint.load_activity(other_url))
+        self.checkpoint.clear()
+        self.assertFalse(Path(self.directory).exists())
+
+
+class GraphQLIssueTests(SimpleTestCase):
+
+    def test_graphql_issue_matches_rest_issue_except_label_ids(self):
+        label = {"name": "good first issue", "color": "7057ff", "default": True, "description": "Good for newcomers"}
+        assignee = {"login": "jdoe", "id": 42, "html_url": "https://github.com/jdoe", "avatar_url": "https://avatars/jdoe", "type": "User"}
+        rest_issue = {
+            "id": 9001, "number": 7, "html_url": "https://github.com/simpeg/simpeg/issues/7", "title": "Fix", "body": "Body",
+            "labels": [dict(label, id=208045946, node_id="LA_kwDO",
+                            url="https://api.github.com/repos/simpeg/simpeg/labels/good%20first%20issue")],
+            "comments": 3, "state": "closed", "state_reason": "not_planned", "updated_at": "2024-06-01T00:00:00Z",
+            "assignees": [assignee], "assignee": assignee,
+        }
+        node = {
+            "databaseId": 9001, "number": 7, "url": rest_issue["html_url"], "title": "Fix", "body": "Body",
+            "updatedAt": "2024-06-01T00:00:00Z", "stateReason": "NOT_PLANNED", "comments": {"totalCount": 3},
+            "labels": {"nodes": [{"id": "LA_kwDO", "name": "good first issue", "color": "7057ff",
+                                  "description": "Good for newcomers", "isDefault": True}]},
+            "assignees": {"nodes": [{"login": "jdoe", "databaseId": 42, "url": "https://github.com/jdoe", "avatarUrl": "https://avatars/jdoe"}]},
+        }
+        graphql_issue = fetch.graphql_issue_to_rest(node, 'simpeg', 'simpeg')
+
+        # GraphQL has no numeric label id; that is the only difference in what gets stored
+        rest_simplified = fetch.simplify_issue(rest_issue)
+        rest_simplified["labels"] = [{k: v for k, v in l.items() if k != "id"} for l in rest_simplified["labels"]]
+        self.assertEqual(fetch.simplify_issue(graphql_issue), rest_simplified)
+        self.assertNotIn("id", graphql_issue["labels"][0])
+        self.assertEqual(fetch.issue_user_assignees(graphql_issue), fetch.issue_user_assignees(rest_issue))
+
+
+class WatermarkTests(SimpleTestCase):
+
+    def setUp(self):
+        self.watermark = {"last_commit_sha": "old", "last_commit_date": "2024-01-01T00:00:00Z",
+                          "last_issue_updated_at": "2024-01-01T00:00:00Z"}
+        self.commits = [{"sha": "new", "commit": {"committer": {"date": "2024-06-01T00:00:00Z"}}}]
+        self.issues = [{"updated_at": "2024-06-02T00:00:00Z"}, {"updated_at": "2024-05-01T00:00:00Z"}]
+
+    def test_advances_past_lists_read_to_the_end(self):
+        updated = fetch.update_watermark(self.watermark, self.commits, self.issues)
+        self.assertEqual(updated, {"last_commit_sha": "new", "last_commit_date": "2024-06-01T00:00:00Z",
+                                   "last_issue_updated_at": "2024-06-02T00:00:00Z"})
+
+    def test_lists_cut_short_keep_the_previous_watermark(self):
+        updated = fetch.update_watermark(self.watermark, self.commits, self.issues, commits_complete=False, issues_complete=False)
+        self.assertEqual(updated, self.watermark)
+
+    def test_paginated_listing_is_complete_only_after_the_last_page(self):
+        with mock.patch.object(fetch, 'iter_paginated_pages', return_value=iter([[{"n": 1}, {"n": 2}], [{"n": 3}]])):
+            listing = fetch.PaginatedListing('https://api.github.com/repos/o/r/issues', None)
+            items = iter(listing)
+            next(items)
+            self.assertFalse(listing.complete) # Stopped early, as at a detail limit
+            self.assertEqual([i["n"] for i in items], [2, 3])
+            self.assertTrue(listing.complete)
+        with mock.patch.object(fetch, 'iter_paginated_pages', return_value=iter([[{"n": 1}], None])):
+            listing = fetch.PaginatedListing('https://api.github.com/repos/o/r/issues', None)
+            self.assertEqual(len(list(listing)), 1)
+            self.assertFalse(listing.complete) # The second page failed
+
+
+class CommitSamplingTests(SimpleTestCase):
+
+    def candidate(self, sha, author, date, is_merge=False):
+        return {"sha": sha, "author": author, "timestamp": fetch.parse_iso_timestamp(date),
+                "is_merge": is_merge, "is_bot": bool(fetch.BOT_LOGIN_PATTERN.search(author))}
+
+    def setUp(self):
+        # Newest first, as the commit list returns them
+        self.candidates = [
+            self.candidate('a1', 'alice', '2024-06-10T00:00:00Z'),
+            self.candidate('m1', 'alice', '2024-06-09T00:00:00Z', is_merge=True),
+            self.candidate('a2', 'alice', '2024-06-08T00:00:00Z'),
+            self.candidate('r1', 'renovate-bot', '2024-06-07T00:00:00Z'),
+            self.candidate('a3', 'alice', '2024-06-06T00:00:00Z'),
+            self.candidate('b1', 'bob', '2023-01-01T00:00:00Z'),
+        ]
+
+    def test_recent_keeps_list_order(self):
+        self.assertEqual(fetch.order_commits_for_details(self.candidates, 'recent'), ['a1', 'm1', 'a2', 'r1', 'a3', 'b1'])
+
+    def test_per_author_alternates_authors_and_defers_merges_and_bots(self):
+        self.assertEqual(fetch.order_commits_for_details(self.candidates, 'per_author'), ['a1', 'b1', 'a2', 'a3', 'm1', 'r1'])
+
+    def test_time_stratified_reaches_old_history_early(self):
+        self.assertEqual(fetch.order_commits_for_details(self.candidates, 'time_stratified')[:2], ['a1', 'b1'])
+
+
+class GitMirrorParsingTests(SimpleTestCase):
+
+    def test_diff_header_paths(self):
+        self.assertEqual(fetch.split_diff_header_paths("diff --git a/src/old.py b/src/new.py"), ("src/old.py", "src/new.py"))
+        self.assertEqual(fetch.split_diff_header_paths("diff --git odd path"), ("odd path", "odd path"))
+
+    def test_unified_diff_reads_statuses_renames_and_counts(self):
+        diff_lines = [
+            "diff --git a/setup.py b/setup.py",
+            "index 1111111..2222222 100644",
+            "--- a/setup.py",
+            "+++ b/setup.py",
+            "@@ -1,3 +1,3 @@",
+            " import os",
+            "--- removed line that looks like a header",
+            "+++ added line that looks like a header",
+            " print(os.name)",
+            "\\ No newline at end of file",
+            "diff --git a/docs/a.md b/docs/b.md",
+            "similarity index 90%",
+            "rename from docs/a.md",
+            "rename to docs/b.md",
+            "--- a/docs/a.md",
+            "+++ b/docs/b.md",
+            "@@ -2 +2,2 @@",
+            "-old",
+            "+new",
+            "+more",
+            "diff --git a/NEWS b/NEWS",
+            "new file mode 100644",
+            "--- /dev/null",
+            "+++ b/NEWS",
+            "@@ -0,0 +1 @@",
+            "+news",
+            "diff --git a/logo.png b/logo.png",
+            "deleted file mode 100644",
+            "Binary files a/logo.png and /dev/null differ",
+        ]
+        self.assertEqual(fetch.parse_unified_diff(diff_lines), [
+            {"filename": "setup.py", "status": "modified", "additions": 1, "deletions": 1,
+             "patch": "@@ -1,3 +1,3 @@\n import os\n--- removed line that looks like a header\n"
+                      "+++ added line that looks like a header\n print(os.name)\n\\ No newline at end of file"},
+            {"filename": "docs/b.md", "status": "renamed", "previous_filename": "docs/a.md", "additions": 2, "deletions": 1,
+             "patch": "@@ -2 +2,2 @@\n-old\n+new\n+more"},
+            {"filename": "NEWS", "status": "added", "additions": 1, "deletions": 0, "patch": "@@ -0,0 +1 @@\n+news"},
+            {"filename": "logo.png", "status": "removed", "additions": 0, "deletions": 0},
+        ])
+
+    def test_git_log_record_splits_header_fields_from_the_diff(self):
+        record = (fetch.GIT_LOG_RECORD_START + "\x00".join([
+            "a" * 40, "b" * 40 + " " + "c" * 40, "Jane Doe", "jdoe@example.com",
+            "2024-06-02T10:00:00+02:00", "2024-06-03T10:00:00+02:00", "Merge it\n\ndiff --git in the body\n", "",
+        ]) + "\ndiff --git a/x b/x\n@@ -1 +1 @@\n-a\n+b").split("\n")
+        fields, diff_lines = fetch.parse_git_log_record(record)
+        self.assertEqual(fields[:3], ["a" * 40, "b" * 40 + " " + "c" * 40, "Jane Doe"])
+        self.assertEqual(fields[6], "Merge it\n\ndiff --git in the body\n")
+        self.assertEqual(diff_lines, ["diff --git a/x b/x", "@@ -1 +1 @@", "-a", "+b"])
+        fields, diff_lines = fetch.parse_git_log_record((fetch.GIT_LOG_RECORD_START + "\x00".join(["d" * 40] + [""] * 7)).split("\n"))
+        self.assertEqual((fields[0], diff_lines), ("d" * 40, []))
+
+    def git(self, directory, *args, email='jdoe@example.com'):
+        subprocess.run(["git", "-C", directory, "-c", "user.name=Jane Doe", "-c", f"user.email={email}",
+                        "-c", "commit.gpgsign=false"] + list(args), check=True, capture_output=True)
+
+    def init_repository(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.git(directory, "init", "-q")
+        return directory
+
+    @skipUnless(shutil.which('git'), "git is not installed")
+    def test_git_log_records_stream_every_commit_of_a_repository(self):
+        directory = self.init_repository()
+        git = lambda *args: self.git(directory, *args)
+        (Path(directory) / "notes.txt").write_text("one\ntwo\n", encoding='utf-8')
+        git("add", "notes.txt")
+        git("commit", "-q", "-m", "Add notes")
+        git("mv", "notes.txt", "notes.md")
+        git("commit", "-q", "-m", "Rename notes")
+        (Path(directory) / "notes.md").write_text("one\n", encoding='utf-8')
+        git("commit", "-q", "-a", "-m", "Trim notes")
+
+        records = list(fetch.iter_git_log_records(directory, ["HEAD"]))
+        self.assertEqual([fields[6].strip() for fields, _ in records], ["Trim notes", "Rename notes", "Add notes"])
+        self.assertEqual(records[0][0][1], records[1][0][0])
+        self.assertEqual(records[2][0][1], "")
+        self.assertEqual([fetch.parse_unified_diff(diff_lines) for _, diff_lines in records], [
+            [{"filename": "notes.md", "status": "modified", "additions": 0, "deletions": 1, "patch": "@@ -1,2 +1 @@\n one\n-two"}],
+            [{"filename": "notes.md", "status": "renamed", "previous_filename": "notes.txt", "additions": 0, "deletions": 0}],
+            [{"filename": "notes.txt", "status": "added", "additions": 2, "deletions": 0, "patch": "@@ -0,0 +1,2 @@\n+one\n+two"}],
+        ])
+        with self.assertRaises(RuntimeError):
+            list(fetch.iter_git_log_records(directory, ["no-such-revision"]))
+
+    @skipUnless(shutil.which('git'), "git is not installed")
+    def test_mirror_authors_are_resolved_once_per_email(self):
+        directory = self.init_repository()
+        for n, email in enumerate(["jdoe@example.com", "1234+kli@users.noreply.github.com", "JDoe@example.com", "ghost@example.com"]):
+            self.git(directory, "commit", "-q", "--allow-empty", "-m", f"Commit {n}", email=email)
+        newest_shas = {}
+        for fields, _ in fetch.iter_git_log_records(directory, ["HEAD"]):
+            newest_shas.setdefault(fields[3].lower(), fields[0])
+        jdoe = {"login": "jdoe", "id": 7, "html_url": "https://github.com/jdoe", "avatar_url": "", "type": "User"}
+        def fetch_commit_details(owner, repo, sha, token=None):
+            return {"sha": sha, "author": jdoe if sha == newest_shas["jdoe@example.com"] else None}
+
+        with mock.patch.object(fetch, 'fetch_commit_details', side_effect=fetch_commit_details) as commit_details, \
+                contextlib.redirect_stdout(io.StringIO()):
+            summaries, details = fetch.fetch_commits_from_git_mirror("o", "r", directory)
+            # One lookup per unresolved email (the newest commit's), none for the noreply address
+            self.assertEqual(sorted(call.args[2] for call in commit_details.call_args_list),
+                             sorted([newest_shas["jdoe@example.com"], newest_shas["ghost@example.com"]]))
+            with mock.patch.object(fetch, 'GIT_MIRROR_OFFLINE', True):
+                offline_summaries, _ = fetch.fetch_commits_from_git_mirror("o", "r", directory)
+        self.assertEqual([(s["commit"]["message"], (s["author"] or {}).get("login")) for s in summaries],
+                         [("Commit 3", None), ("Commit 2", "jdoe"), ("Commit 1", "kli"), ("Commit 0", "jdoe")])
+        self.assertEqual([(s["author"] or {}).get("login") for s in offline_summaries], [None, None, "kli", None])
+        self.assertEqual(len(details), 4)
+
+
+class CompareBatchingTests(SimpleTestCase):
+
+    def summary(self, sha, *parents):
+        return {"sha": sha, "parents": [{"sha": parent} for parent in parents]}
+
+    def test_linear_runs_stop_at_merges_gaps_and_the_request_limit(self):
+        summaries = [
+            self.summary('c6', 'c5'), self.summary('c5', 'm1'), self.summary('m1', 'c4', 'x1'),
+            self.summary('c4', 'c3'), self.summary('c3', 'c2'), self.summary('c2', 'c1'), self.summary('c1'),
+        ]
+        shas = ['c6', 'c5', 'm1', 'c4', 'c3', 'c2', 'c1']
+        self.assertEqual(fetch.find_linear_commit_runs(summaries, shas), [('m1', ['c6', 'c5']), ('c1', ['c4', 'c3', 'c2'])])
+        # A skipped commit breaks the run, and a run never exceeds the per-request limit
+        self.assertEqual(fetch.find_linear_commit_runs(summaries, ['c6', 'c4', 'c3']), [('c2', ['c4', 'c3'])])
+        with mock.patch.object(fetch, 'COMPARE_MAX_COMMITS_PER_REQUEST', 2):
+            self.assertEqual(fetch.find_linear_commit_runs(summaries, shas[3:]), [('c2', ['c4', 'c3'])])
+
+    def test_patch_series_is_split_per_commit_after_the_message(self):
+        sha_a, sha_b = 'a' * 40, 'b' * 40
+        patch_text = "\n".join([
+            f"From {sha_a} Mon Sep 17 00:00:00 2001",
+            "Subject: [PATCH 1/2] Change one line",
+            "",
+            "diff --git a/looks/like/a/diff b/in/the/message",
+            "---",
+            " src/app.py | 2 +-",
+            " 1 file changed, 1 insertion(+), 1 deletion(-)",
+            "",
+            "diff --git a/src/app.py b/src/app.py",
+            "--- a/src/app.py",
+            "+++ b/src/app.py",
+            "@@ -1 +1 @@",
+            "-old",
+            "+new",
+            "",
+            f"From {sha_b} Mon Sep 17 00:00:00 2001",
+            "Subject: [PATCH 2/2] Add a file",
+            "---",
+            "diff --git a/NEWS b/NEWS",
+            "new file mode 100644",
+            "--- /dev/null",
+            "+++ b/NEWS",
+            "@@ -0,0 +1,2 @@",
+            "+one",
+            "+two",
+            "-- ",
+            "2.45.0",
+        ])
+        files = fetch.split_patch_series(patch_text)
+        self.assertEqual(list(files), [sha_a, sha_b])
+        self.assertEqual(files[sha_a], [{"filename": "src/app.py", "status": "modified", "additions": 1, "deletions": 1,
+                                         "patch": "@@ -1 +1 @@\n-old\n+new"}])
+        self.assertEqual(files[sha_b], [{"filename": "NEWS", "status": "added", "additions": 2, "deletions": 0,
+                                         "patch": "@@ -0,0 +1,2 @@\n+one\n+two"}])
+
+    def test_benchmark_digest_is_the_same_across_detail_modes_and_a_warm_cache(self):
+        import benchmark_fetch
+        from fake_github_server import SyntheticGitHub, parse_repository_spec, start_server
+
+        server = start_server(synthetic=SyntheticGitHub([parse_repository_spec("o/alpha:40:10:4")]))
+        self.addCleanup(server.shutdown)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        repo_urls = ['https://github.com/o/alpha']
+        with mock.patch.multiple(fetch, API_BASE_URL=server.base_url, MIN_REQUEST_INTERVAL_SECONDS=0,
+                                 HTTP_CACHE_DIR=fetch.HTTP_CACHE_DIR, RATE_LIMITER=fetch.RATE_LIMITER,
+                                 FETCH_METRICS=fetch.FETCH_METRICS, DEAD_LETTERS=fetch.DEAD_LETTERS):
+            with mock.patch.object(fetch, 'COMMIT_DETAIL_MODE', 'commit'):
+                commit_run = benchmark_fetch.run_once(server, repo_urls, None, verbose=False)
+            with mock.patch.object(fetch, 'COMMIT_DETAIL_MODE', 'compare'):
+                compare_run = benchmark_fetch.run_once(server, repo_urls, cache_dir, verbose=False)
+                warm_run = benchmark_fetch.run_once(server, repo_urls, cache_dir, verbose=False)
+        self.assertGreater(commit_run["commits"], 0)
+        self.assertLess(compare_run["requests_by_endpoint"].get("commit", 0), commit_run["requests_by_endpoint"].get("commit", 0))
+        self.assertGreater(warm_run["not_modified"], 0)
+        self.assertEqual({compare_run["digest"], warm_run["digest"]}, {commit_run["digest"]})
+
+
+class PatchFilterTests(SimpleTestCase):
+
+    def big_patch(self, lines):
+        return "@@ -1,2 +1,{0} @@ def f():\n def f():\n-    pass\n".format(lines + 1) + "\n".join(f"+    x{i} = {i}" for i in range(lines))
+
+    def test_lockfiles_are_elided_and_long_patches_truncated(self):
+        commit = {}
+        with mock.patch.object(fetch, 'MAX_PATCH_BYTES_PER_FILE', 200), mock.patch.object(fetch, 'MAX_PATCH_BYTES_PER_COMMIT', 1000):
+            fetch.apply_commit_details(commit, {"commit": {"comment_count": 0}, "files": [
+                {"filename": "package-lock.json", "status": "modified", "patch": "@@ -1 +1 @@\n-a\n+b"},
+                {"filename": "src/vendor/lib.js", "status": "added", "patch": "@@ -0,0 +1 @@\n+x"},
+                {"filename": "src/big.py", "status": "modified", "patch": self.big_patch(50)},
+                {"filename": "src/small.py", "status": "modified", "patch": "@@ -1 +1 @@\n-a\n+b"},
+            ]})
+
+        notes = {f["filename"]: f.get("patch_elided") for f in commit["files_changed"]}
+        self.assertEqual(notes, {"package-lock.json": "lockfile", "src/vendor/lib.js": "vendored",
+                                 "src/big.py": "truncated", "src/small.py": None})
+        self.assertNotIn("package-lock.json", commit["diff_patch"])
+        # The cut hunk's header matches the lines kept, so later file sections still parse
+        added, removed = count_patch_lines(commit["diff_patch"])["src/big.py"]
+        self.assertEqual(removed, 1)
+        self.assertTrue(0 < added < 50)
+        self.assertEqual(count_patch_lines(commit["diff_patch"])["src/small.py"], [1, 1])
+
+    def test_commit_cap_drops_later_patches(self):
+        commit = {}
+        with mock.patch.object(fetch, 'MAX_PATCH_BYTES_PER_FILE', 0), mock.patch.object(fetch, 'MAX_PATCH_BYTES_PER_COMMIT', 300):
+            fetch.apply_commit_details(commit, {"files": [
+                {"filename": "a.py", "status": "modified", "patch": self.big_patch(10)},
+                {"filename": "b.py", "status": "modified", "patch": self.big_patch(10)},
+                {"filename": "c.py", "status": "modified", "patch": self.big_patch(10)},
+            ]})
+        self.assertEqual([f.get("patch_elided") for f in commit["files_changed"]], [None, "truncated", "too_large"])
+        self.assertLessEqual(len(commit["diff_patch"].encode('utf-8')), 300 + 3 * 30)
+
+    def test_elided_and_truncated_files_keep_their_line_counts(self):
+        # Compare and git-mirror input is parsed from diff text, so its counts come from the untruncated patch
+        diff = ["diff --git a/poetry.lock b/poetry.lock", "--- a/poetry.lock", "+++ b/poetry.lock", "@@ -1 +1,2 @@", "-a", "+b", "+c",
+                "diff --git a/src/big.py b/src/big.py", "--- a/src/big.py", "+++ b/src/big.py"] + self.big_patch(50).split("\n")
+        files = fetch.parse_unified_diff(diff)
+        self.assertEqual([(f["additions"], f["deletions"]) for f in files], [(2, 1), (50, 1)])
+
+        commit = {}
+        with mock.patch.object(fetch, 'MAX_PATCH_BYTES_PER_FILE', 200):
+            fetch.apply_commit_details(commit, {"files": files})
+        self.assertEqual([f.get("patch_elided") for f in commit["files_changed"]], ["lockfile", "truncated"])
+        stats = commit_diff_stats(commit)
+        self.assertEqual((stats['lines_added'], stats['lines_removed']), (52, 2))
+        self.assertEqual(stats['language_breakdown'], {'Other': 3, 'Python': 51})
+
+        lockfile_only = {}
+        fetch.apply_commit_details(lockfile_only, {"files": files[:1]})
+        self.assertIsNone(lockfile_only["diff_patch"])
+        self.assertEqual(commit_diff_stats(lockfile_only)['lines_added'], 2)
+
+
+class ContributorStatsTests(TestCase):
+
+    def stats_response(self, status, body):
+        response = mock.Mock(status_code=status, content=json.dumps(body).encode('utf-8'))
+        response.json.return_value = body
+        return response
+
+    def test_waits_for_statistics_and_keeps_active_weeks(self):
+        stats = [{"total": 3, "author": {"login": "jdoe", "type": "User"}, "weeks": [
+            {"w": 1717286400, "a": 12, "d": 3, "c": 2},
+            {"w": 1717891200, "a": 0, "d": 0, "c": 0},
+            {"w": 1718496000, "a": 1, "d": 1, "c": 1},
+        ]}]
+        responses = [self.stats_response(202, {}), self.stats_response(200, stats)]
+        with mock.patch.object(fetch, 'make_github_request', side_effect=responses), \
+                mock.patch.object(fetch, 'CONTRIBUTOR_STATS_RETRY_SECONDS', 0):
+            result = fetch.fetch_contributor_stats('simpeg', 'simpeg')
+        self.assertEqual(result['jdoe']['weekly_activity'], [
+            {"week": "2024-06-02", "commits": 2, "additions": 12, "deletions": 3},
+            {"week": "2024-06-16", "commits": 1, "additions": 1, "deletions": 1},
+        ])
+
+    def test_loader_stores_series_and_keeps_it_for_records_without_one(self):
+        weeks = [{"week": "2024-06-02", "commits": 2, "additions": 12, "deletions": 3}]
+        record = {"username": "jdoe", "url": "https://github.com/jdoe", "avatar_url": "", "works": [
+            {"repository_url": "https://github.com/simpeg/simpeg", "issues": [], "commits": [], "weekly_activity": weeks},
+        ]}
+        RecordLoader().load_contributor(record)
+        del record["works"][0]["weekly_activity"]
+        RecordLoader().load_contributor(record)
+        self.assertEqual(RepositoryWork.objects.get().weekly_activity, weeks)
+
+    def test_incremental_crawl_without_new_activity_keeps_summaries(self):
+        from fake_github_server import SyntheticGitHub, parse_repository_spec, start_server
+        from .management.commands import crawl
+
+        server = start_server(synthetic=SyntheticGitHub([parse_repository_spec("o/alpha:40:10:4")]))
+        self.addCleanup(server.shutdown)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.object(fetch, 'API_BASE_URL', server.base_url), mock.patch.object(fetch, 'HTTP_CACHE_DIR', ''), \
+                mock.patch.object(fetch, 'DEAD_LETTERS', fetch.DEAD_LETTERS), mock.patch.object(fetch, 'DEAD_LETTER_FILE', fetch.DEAD_LETTER_FILE), \
+                mock.patch.object(crawl, 'CRAWL_WATERMARKS_FILE', str(Path(directory) / 'watermarks.json')), \
+                mock.patch.object(crawl, 'CRAWL_CHECKPOINT_DIR', str(Path(directory) / 'checkpoint')), \
+                mock.patch.object(crawl, 'CRAWL_DEAD_LETTER_FILE', str(Path(directory) / 'dead_letters.jsonl')), \
+                contextlib.redirect_stdout(io.StringIO()):
+            call_command('crawl', 'https://github.com/o/alpha', stdout=io.StringIO())
+            self.assertTrue(RepositoryWork.objects.filter(weekly_activity__isnull=False).exists())
+            Contributor.objects.update(summary='Summary')
+            RepositoryWork.objects.update(summary='Summary')
+
+            output = io.StringIO()
+            call_command('crawl', 'https://github.com/o/alpha', stdout=output)
+        self.assertIn("Stored 0 contributor-work records", output.getvalue())
+        self.assertFalse(Contributor.objects.exclude(summary='Summary').exists())
+        self.assertFalse(RepositoryWork.objects.exclude(summary='Summary').exists())
+
+
+class CrawlLoadingTests(TestCase):
+    REPO = 'https://github.com/simpeg/simpeg'
+    OTHER_REPO = 'https://github.com/simpeg/discretize'
+
+    def record(self, username, issues=(), commits=(), repository_url=REPO):
+        return {"username": username, "url": f"https://github.com/{username}", "avatar_url": "", "works": [
+            {"repository_url": repository_url, "issues": list(issues), "commits": list(commits)},
+        ]}
+
+    def issue(self, number, title='Bug'):
+        return {"html_url": f"{self.REPO}/issues/{number}", "number": number, "title": title, "labels": []}
+
+    def commit(self, sha, message='Change'):
+        return {"sha": sha, "url": f"{self.REPO}/commit/{sha}", "message": message, "files_changed": [], "diff_patch": None}
+
+    def summaries(self):
+        return {
+            'contributors': dict(Contributor.objects.values_list('username', 'summary')),
+            'works': dict(RepositoryWork.objects.values_list('repository__url', 'summary')),
+        }
+
+    def test_reloading_unchanged_records_keeps_summaries(self):
+        loader = RecordLoader()
+        loader.load_contributor(self.record("jdoe", [self.issue(1)], [self.commit('a1')]))
+        loader.load_contributor(self.record("jdoe", commits=[self.commit('b1')], repository_url=self.OTHER_REPO))
+        Contributor.objects.update(summary='Summary')
+        RepositoryWork.objects.update(summary='Summary')
+
+        loader.load_contributor(self.record("jdoe", [self.issue(1)], [self.commit('a1')]))
+        self.assertEqual(self.summaries(), {'contributors': {'jdoe': 'Summary'},
+                                            'works': {self.REPO: 'Summary', self.OTHER_REPO: 'Summary'}})
+
+        loader.load_contributor(self.record("jdoe", [self.issue(1)], [self.commit('a1', 'Edited')]))
+        self.assertEqual(self.summaries(), {'contributors': {'jdoe': ''}, 'works': {self.REPO: '', self.OTHER_REPO: 'Summary'}})
+        self.assertEqual(Commit.objects.get(url=f"{self.REPO}/commit/a1").raw_data['message'], 'Edited')
+
+    def test_incremental_crawl_drops_reassigned_issues(self):
+        from .management.commands import crawl
+
+        RecordLoader().load_contributor(self.record("alice", [self.issue(1), self.issue(2)]))
+        RecordLoader().load_contributor(self.record("carol", [self.issue(3)]))
+        Contributor.objects.update(summary='Summary')
+        RepositoryWork.objects.update(summary='Summary')
+
+        def process_repositories(repo_urls, token, on_repository_done, **kwargs):
+            # Issue 1 moved from alice to bob; issue 2 was reopened, so it is no longer listed
+            on_repository_done(self.REPO, [self.record("bob", [self.issue(1, 'Reassigned')])],
+                               {self.issue(1)["html_url"], self.issue(2)["html_url"]})
+            return {}
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.object(fetch, 'process_repositories', side_effect=process_repositories), \
+                mock.patch.object(fetch, 'DEAD_LETTERS', fetch.DEAD_LETTERS), mock.patch.object(fetch, 'DEAD_LETTER_FILE', fetch.DEAD_LETTER_FILE), \
+                mock.patch.object(crawl, 'CRAWL_WATERMARKS_FILE', str(Path(directory) / 'watermarks.json')), \
+                mock.patch.object(crawl, 'CRAWL_CHECKPOINT_DIR', str(Path(directory) / 'checkpoint')), \
+                mock.patch.object(crawl, 'CRAWL_DEAD_LETTER_FILE', str(Path(directory) / 'dead_letters.jsonl')), \
+                contextlib.redirect_stdout(io.StringIO()):
+            call_command('crawl', self.REPO, stdout=io.StringIO())
+
+        self.assertEqual(sorted(Issue.objects.values_list('work__contributor__username', 'url')),
+                         [('bob', self.issue(1)["html_url"]), ('carol', self.issue(3)["html_url"])])
+        self.assertEqual(dict(Contributor.objects.values_list('username', 'summary')), {'alice': '', 'bob': '', 'carol': 'Summary'})
+
+
+class BulkRecordLoaderTests(TestCase):
+
+    def records(self, message):
+        repo = 'https://github.com/simpeg/simpeg'
+        commit = {"sha": "abc", "url": f"{repo}/commit/abc", "message": message, "files_changed": [], "diff_patch": None}
+        issue = {"html_url": f"{repo}/issues/7", "number": 7, "title": message, "labels": []}
+        return [
+            {"username": "jdoe", "url": "https://github.com/jdoe", "avatar_url": "", "works": [
+                {"repository_url": repo, "issues": [issue], "commits": [commit],
+                 "weekly_activity": [{"week": "2024-06-02", "commits": 1, "additions": 2, "deletions": 0}]},
+                {"repository_url": "not a github url", "issues": [], "commits": [commit]},
+            ]},
+            {"username": "kli", "url": "https://github.com/kli", "avatar_url": "", "works": [
+                {"repository_url": repo, "issues": [issue, {"title": "no url"}], "commits": []},
+            ]},
+            {"username": "jdoe", "url": "https://github.com/jdoe2", "avatar_url": "", "works": [
+                {"repository_url": repo, "issues": [], "commits": [dict(commit, message=message + " (edited)")]},
+            ]},
+        ]
+
+    def snapshot(self):
+        return {
+            'contributors': sorted(Contributor.objects.values_list('username', 'url', 'summary')),
+            'repositories': sorted(Repository.objects.values_list('url', 'name')),
+            'works': sorted(RepositoryWork.objects.values_list('repository__url', 'contributor__username', 'summary', 'weekly_activity')),
+            'issues': sorted((i.work.contributor.username, i.url, json.dumps(i.raw_data)) for i in Issue.objects.all()),
+            'commits': sorted((c.work.contributor.username, c.url, json.dumps(c.raw_data)) for c in Commit.objects.all()),
+        }
+
+    def test_matches_row_by_row_loading_including_reloads(self):
+        row_loader = RecordLoader()
+        for message in ("first", "second"):
+            for record in self.records(message):
+                row_loader.load_contributor(record)
+        expected = self.snapshot()
+
+        Contributor.objects.all().delete()
+        Repository.objects.all().delete()
+        for message in ("first", "second"):
+            warnings = []
+            bulk_loader = BulkRecordLoader(batch_size=2, warn=warnings.append)
+            for record in self.records(message):
+                bulk_loader.add(record)
+            bulk_loader.finish()
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(bulk_loader.counts['commits'], 0)
+        self.assertEqual(bulk_loader.counts['contributors_processed'], 3)
+
+
+class RecordStreamTests(SimpleTestCase):
+
+    def test_ndjson_output_appends_or_truncates_and_ends_runs_with_metadata(self):
+        first, second = {"username": "jdoe", "works": []}, {"username": "kli", "works": []}
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('contributors.ndjson', 'contributors.ndjson.gz'):
+                path = str(Path(directory) / name)
+                for append, record, run in ((False, first, 1), (True, second, 2)):
+                    with fetch.open_ndjson_output(path, append=append) as output_file:
+                        fetch.write_ndjson_records(output_file, [record])
+                        fetch.write_ndjson_metadata(output_file, {"run": run})
+                with open_text(path) as f:
+                    lines = [json.loads(line) for line in f]
+                self.assertEqual([line.get("username") or line["metadata"] for line in lines], ["jdoe", {"run": 1}, "kli", {"run": 2}])
+                self.assertIn("endpoints", lines[-1]["fetch_metrics"])
+                self.assertEqual(list(iter_contributor_records(path)), [first, second])
+
+                with fetch.open_ndjson_output(path) as output_file:
+                    fetch.write_ndjson_records(output_file, [second])
+                self.assertEqual(list(iter_contributor_records(path)), [second])
+
+    def test_document_and_ndjson_forms_yield_the_same_records(self):
+        records = [{"username": "jdoe", "works": [{"repository_url": "https://github.com/simpeg/simpeg", "commits": [1.5, 12345]}]},
+                   {"username": "kli", "works": []}]
+        document = json.dumps({"metadata": {"total_contributors": 2}, "contributors": records, "fetch_metrics": {}}, indent=2)
+        # A tiny chunk size makes every string, number and separator straddle chunk boundaries
+        self.assertEqual(list(iter_document_records(io.StringIO(document), chunk_size=3)), records)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'contributors.ndjson'
+            lines = [json.dumps(r) for r in records] + [json.dumps({"metadata": {"run": 1}, "fetch_metrics": {}})]
+            path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+            self.assertEqual(list(iter_contributor_records(str(path))), records)
+
+            path = Path(directory) / 'truncated.json'
+            path.write_text('{"contributors": [{"username": "a"}, {"username": ', encoding='utf-8')
+            stream = iter_contributor_records(str(path))
+            self.assertEqual(next(stream), {"username": "a"})
+            with self.assertRaises(RecordStreamError):
+                next(stream)
@@ -1,12 +1,18 @@
 import os
+import json
 import time # Optional: for slight delay if needed during testing
+from django.db import transaction
 from django.http import StreamingHttpResponse, JsonResponse, HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from openai import OpenAI, APIError # Make sure to import OpenAI and potential errors
 from django.conf import settings
 from .models import *
 from .serializers import DataSerializer
+from .ingest import RecordLoader
+from .webhooks import EVENT_HANDLERS, EVENT_HEADER, SIGNATURE_HEADER, verify_signature
 
 try:
     client = OpenAI(api_key=settings.LLAMA_API_KEY, 
@@ -178,4 +184,36 @@ def llm_stream_view(request):
     except Exception as e:
         # Catch potential errors during generator setup (though most are handled inside)
         print(f"Error setting up stream view: {e}")
-        return JsonResponse({"error": f"Failed to start stream: {str(e)}"}, status=500)
\ No newline at end of file
+        return JsonResponse({"error": f"Failed to start stream: {str(e)}"}, status=500)
+
+
+# --- GitHub Webhook View ---
+@csrf_exempt
+@require_POST
+def github_webhook(request):
+    """
+    Receives GitHub `push` and `issues` webhook deliveries, checks their signature against
+    GITHUB_WEBHOOK_SECRET, and upserts the affected commits and issues. The summaries of the
+    works and contributors they belong to are cleared so create_summaries regenerates them.
+    """
+    secret = settings.GITHUB_WEBHOOK_SECRET
+    if not secret:
+        return JsonResponse({"error": "Webhook secret not configured"}, status=503)
+    if not verify_signature(secret, request.body, request.META.get(SIGNATURE_HEADER)):
+        return JsonResponse({"error": "Invalid signature"}, status=403)
+
+    event = request.META.get(EVENT_HEADER, '')
+    if event == 'ping':
+        return JsonResponse({"status": "pong"})
+    handler = EVENT_HANDLERS.get(event)
+    if not handler:
+        return JsonResponse({"status": "ignored", "reason": f"unsupported event '{event}'"})
+
+    try:
+        payload = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponseBadRequest("Invalid JSON payload.")
+
+    with transaction.atomic():
+        result = handler(payload, RecordLoader())
+    return JsonResponse({"event": event, **result})
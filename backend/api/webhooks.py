@@ -0,0 +1,118 @@
+"""
+Turns GitHub `push` and `issues` webhook payloads into the commit and issue entries fetch.py produces,
+and applies them to the database through api.ingest.
+"""
+import hashlib
+import hmac
+from typing import Any, Dict, List, Optional
+
+from api.fetcher import fetch
+from api.ingest import RecordLoader, remove_issue
+
+SIGNATURE_HEADER = 'HTTP_X_HUB_SIGNATURE_256'
+EVENT_HEADER = 'HTTP_X_GITHUB_EVENT'
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Checks an `X-Hub-Signature-256` value (`sha256=<hex HMAC of the body>`) in constant time."""
+    if not secret or not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len('sha256='):])
+
+
+def contributor_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    """The username/url/avatar_url of a user object from a payload."""
+    return {
+        'username': user.get('login'),
+        'url': user.get('html_url') or (f"https://github.com/{user['login']}" if user.get('login') else ''),
+        'avatar_url': user.get('avatar_url') or '',
+    }
+
+
+def push_commit_entry(commit: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A commit from a push payload in fetch.py's simplified form, with the message shortened the same way.
+    Payloads carry file names but no patches, so `diff_patch` is left empty.
+    """
+    files_changed = (
+        [{"filename": f, "status": "added"} for f in commit.get('added', [])] +
+        [{"filename": f, "status": "modified"} for f in commit.get('modified', [])] +
+        [{"filename": f, "status": "removed"} for f in commit.get('removed', [])]
+    )
+    return {
+        "sha": commit.get('id'),
+        "url": commit.get('url'),
+        "message": fetch.commit_message_summary(commit.get('message') or 'No commit message'),
+        "files_changed": files_changed,
+        "comment_count": 0,
+        "diff_patch": None,
+    }
+
+
+def issue_entry(issue: Dict[str, Any]) -> Dict[str, Any]:
+    """An issue from an issues payload in fetch.py's simplified form."""
+    return {
+        "html_url": issue.get('html_url'),
+        "number": issue.get('number'),
+        "title": issue.get('title'),
+        "body": issue.get('body'),
+        "labels": issue.get('labels', []),
+        "comments": issue.get('comments'),
+        "state_reason": issue.get('state_reason'),
+    }
+
+
+def handle_push(payload: Dict[str, Any], loader: RecordLoader) -> Dict[str, Any]:
+    """
+    Stores the new commits of a push to the default branch under their authors' works.
+    Commits without a GitHub username, or already seen in an earlier push, are skipped, and a commit
+    a crawl already stored with its patch is left as it is.
+    """
+    repository = payload.get('repository') or {}
+    repo_url = repository.get('html_url')
+    default_branch = repository.get('default_branch') or repository.get('master_branch')
+    if payload.get('deleted') or payload.get('ref') != f"refs/heads/{default_branch}":
+        return {"status": "ignored", "reason": "not a push to the default branch"}
+
+    sender = payload.get('sender') or {}
+    commits_by_author: Dict[str, List[Dict[str, Any]]] = {}
+    for commit in payload.get('commits', []):
+        username = (commit.get('author') or {}).get('username')
+        if not username or not commit.get('distinct', True) or not commit.get('url'):
+            continue
+        commits_by_author.setdefault(username, []).append(push_commit_entry(commit))
+
+    for username, commits in commits_by_author.items():
+        profile = contributor_profile(sender) if sender.get('login') == username else contributor_profile({'login': username})
+        loader.upsert_activity(repo_url, profile, commits=commits, keep_patches=True)
+    return {"status": "ok", "commits": sum(len(c) for c in commits_by_author.values()), "contributors": len(commits_by_author)}
+
+
+def handle_issues(payload: Dict[str, Any], loader: RecordLoader) -> Dict[str, Any]:
+    """
+    Keeps an issue's rows in step with its state. Like fetch.py, only closed issues are stored,
+    once per assignee that is a user (not a bot): closing or editing an issue upserts it for its current assignees and drops it
+    from anyone no longer assigned; reopening or deleting it drops all of its rows.
+    """
+    issue = payload.get('issue') or {}
+    repo_url = (payload.get('repository') or {}).get('html_url')
+    issue_url = issue.get('html_url')
+    if not issue_url or 'pull_request' in issue:
+        return {"status": "ignored", "reason": "not an issue"}
+
+    assignees = fetch.issue_user_assignees(issue)
+    if payload.get('action') == 'deleted' or issue.get('state') != 'closed':
+        assignees = []
+
+    removed = remove_issue(issue_url, keep_usernames=[a['login'] for a in assignees])
+    entry = issue_entry(issue)
+    for assignee in assignees:
+        loader.upsert_activity(repo_url, contributor_profile(assignee), issues=[entry])
+    return {"status": "ok", "issues": len(assignees), "removed_issues": removed}
+
+
+EVENT_HANDLERS = {
+    'push': handle_push,
+    'issues': handle_issues,
+}
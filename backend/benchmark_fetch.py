@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks fetch.process_repositories against the local fake GitHub server (fake_github_server.py),
+so throughput changes to the fetcher can be measured without network access.
+
+Each run starts from an empty response cache unless --warm-cache is given. The output digest is a hash of
+the contributor map; it must stay the same across fetcher changes that aren't meant to change the output.
+
+Examples:
+  python benchmark_fetch.py --latency 50 --runs 3
+  python benchmark_fetch.py --repo bench/big:5000:2000 --commit-limit 2000 --issue-limit 1000
+  python benchmark_fetch.py --replay github_recordings --repo-url https://github.com/simpeg/simpeg
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import statistics
+import tempfile
+import time
+from typing import List, Dict, Optional, Any
+
+import fetch
+from fake_github_server import (
+    start_server, parse_repository_spec, SyntheticGitHub, RecordingStore, FakeGitHubServer
+)
+
+BENCHMARK_TOKEN = "benchmark-token"
+
+def output_digest(contributors_map: Dict[str, Dict[str, Any]]) -> str:
+    """Hash of the contributor map, independent of the order contributors were added in."""
+    contributors = sorted(contributors_map.values(), key=lambda c: c.get('username', ''))
+    return hashlib.sha256(json.dumps(contributors, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def run_once(server: FakeGitHubServer, repo_urls: List[str], cache_dir: Optional[str], verbose: bool) -> Dict[str, Any]:
+    """Runs one crawl against the server and returns its timing, request counts and output digest."""
+    fetch.HTTP_CACHE_DIR = cache_dir or ""
+    fetch.RATE_LIMITER = fetch.RateLimitScheduler([BENCHMARK_TOKEN])
+    fetch.FETCH_METRICS = fetch.FetchMetrics()
+    fetch.DEAD_LETTERS = fetch.DeadLetterQueue("") # Counted, not written
+    server.reset_stats()
+    start_time = time.perf_counter()
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        contributors_map = fetch.process_repositories(repo_urls, BENCHMARK_TOKEN)
+    elapsed = time.perf_counter() - start_time
+    requests_served = server.total_requests()
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": requests_served,
+        "requests_by_endpoint": dict(server.request_counts),
+        "not_modified": server.not_modified_count,
+        "injected_errors": server.error_count,
+        "dead_letters": fetch.DEAD_LETTERS.count,
+        "bytes": server.bytes_sent,
+        "requests_per_second": round(requests_served / elapsed, 1) if elapsed else None,
+        "contributors": len(contributors_map),
+        "commits": sum(len(w.get("commits", [])) for c in contributors_map.values() for w in c.get("works", [])),
+        "issues": sum(len(w.get("issues", [])) for c in contributors_map.values() for w in c.get("works", [])),
+        # Contributor-works with at least one detailed commit: how widely the detail budget was spread
+        "detailed_works": sum(
+            any(commit.get("files_changed") is not None for commit in w.get("commits", []))
+            for c in contributors_map.values() for w in c.get("works", [])
+        ),
+        "digest": output_digest(contributors_map),
+        "fetch_metrics": fetch.FETCH_METRICS.report(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fetch.py against a local fake GitHub API.")
+    parser.add_argument('--repo', dest='repos', action='append', type=parse_repository_spec, default=[],
+                        help="Synthetic repository as OWNER/NAME[:COMMITS[:ISSUES[:CONTRIBUTORS]]]. Repeatable.")
+    parser.add_argument('--replay', metavar='RECORDINGS', help="Replay recorded responses instead of synthetic repositories.")
+    parser.add_argument('--repo-url', dest='repo_urls', action='append', default=[],
+                        help="Repository URL to crawl in replay mode (as recorded). Repeatable.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=30.0, help="Server latency per request, in milliseconds.")
+    parser.add_argument('--jitter', type=float, default=10.0, help="Uniform +/- jitter on the latency, in milliseconds.")
+    parser.add_argument('--rate-limit', type=int, default=1_000_000, help="Requests per token per hour on the fake server.")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests the fake server answers with a 502, to measure retry overhead.")
+    parser.add_argument('--commit-limit', type=int, default=fetch.MAX_COMMITS_TO_DETAIL_PER_REPO)
+    parser.add_argument('--issue-limit', type=int, default=fetch.MAX_ISSUES_TO_DETAIL_PER_REPO)
+    parser.add_argument('--issue-mode', choices=["rest", "graphql"], default=fetch.ISSUE_FETCH_MODE)
+    parser.add_argument('--commit-detail-mode', choices=["commit", "compare"], default=fetch.COMMIT_DETAIL_MODE)
+    parser.add_argument('--commit-sampling', choices=sorted(fetch.COMMIT_SAMPLING_POLICIES), default=fetch.COMMIT_SAMPLING_POLICY)
+    parser.add_argument('--pacing', action='store_true',
+                        help=f"Keep fetch.py's per-token request floor ({fetch.MIN_REQUEST_INTERVAL_SECONDS:.3f}s). Off by default so the fetcher itself is measured.")
+    parser.add_argument('--warm-cache', action='store_true', help="Reuse one response cache across runs (first run fills it).")
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+    parser.add_argument('--verbose', action='store_true', help="Show fetch.py's progress output.")
+    args = parser.parse_args()
+
+    if args.replay:
+        if not args.repo_urls: parser.error("--replay needs at least one --repo-url")
+        server = start_server(mode="replay", recordings=RecordingStore(args.replay),
+                              latency_ms=args.latency, jitter_ms=args.jitter, rate_limit=args.rate_limit,
+                              error_rate=args.error_rate)
+        repo_urls = args.repo_urls
+    else:
+        repositories = args.repos or [parse_repository_spec("bench/alpha:1200:600"), parse_repository_spec("bench/beta:400:200")]
+        server = start_server(mode="synthetic", synthetic=SyntheticGitHub(repositories),
+                              latency_ms=args.latency, jitter_ms=args.jitter, rate_limit=args.rate_limit,
+                              error_rate=args.error_rate)
+        repo_urls = [f"https://github.com/{r.owner}/{r.name}" for r in repositories]
+
+    fetch.API_BASE_URL = server.base_url
+    fetch.MAX_COMMITS_TO_DETAIL_PER_REPO = args.commit_limit
+    fetch.MAX_ISSUES_TO_DETAIL_PER_REPO = args.issue_limit
+    fetch.ISSUE_FETCH_MODE = args.issue_mode
+    fetch.COMMIT_DETAIL_MODE = args.commit_detail_mode
+    fetch.COMMIT_SAMPLING_POLICY = args.commit_sampling
+    if not args.pacing: fetch.MIN_REQUEST_INTERVAL_SECONDS = 0
+
+    print(f"Benchmarking process_repositories on {len(repo_urls)} repositories against {server.base_url} "
+          f"(latency {args.latency:.0f}±{args.jitter:.0f} ms, {args.runs} runs, {'warm' if args.warm_cache else 'cold'} cache)")
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="fetch_bench_cache_") as shared_cache_dir:
+        for run in range(1, args.runs + 1):
+            if args.warm_cache:
+                result = run_once(server, repo_urls, shared_cache_dir, args.verbose)
+            else:
+                with tempfile.TemporaryDirectory(prefix="fetch_bench_cache_") as cache_dir:
+                    result = run_once(server, repo_urls, cache_dir, args.verbose)
+            results.append(result)
+            errors_note = f", {result['injected_errors']} injected errors, {result['dead_letters']} dead letters" if args.error_rate else ""
+            print(f"  run {run}: {result['seconds']:.2f}s, {result['requests']} requests ({result['not_modified']} not modified), "
+                  f"{result['requests_per_second']} req/s, {result['commits']} commits ({result['detailed_works']} works with details), {result['issues']} issues, digest {result['digest']}{errors_note}")
+    server.shutdown()
+    server.server_close()
+
+    timings = [r["seconds"] for r in results]
+    summary = {
+        "repositories": repo_urls,
+        "latency_ms": args.latency,
+        "jitter_ms": args.jitter,
+        "runs": results,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "digests_match": len({r["digest"] for r in results}) == 1,
+    }
+    print(f"Median {summary['median_seconds']:.2f}s, best {summary['min_seconds']:.2f}s"
+          f"{'' if summary['digests_match'] else ' -- WARNING: output differs between runs'}")
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Wrote results to {args.json_path}")
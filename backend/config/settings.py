@@ -141,4 +141,7 @@ REST_FRAMEWORK = {
 }
 
 
-LLAMA_API_KEY = os.getenv('LLAMA_API_KEY')
\ No newline at end of file
+LLAMA_API_KEY = os.getenv('LLAMA_API_KEY')
+
+# Shared secret of the GitHub webhook that posts to api/github_webhook/
+GITHUB_WEBHOOK_SECRET = os.getenv('GITHUB_WEBHOOK_SECRET')
\ No newline at end of file
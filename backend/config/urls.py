@@ -16,10 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from api.views import get_data, llm_stream_view
+from api.views import get_data, llm_stream_view, github_webhook
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/get_data/', get_data, name='get_data'),
-    path('api/llm_stream/', llm_stream_view, name='llm_stream')
+    path('api/llm_stream/', llm_stream_view, name='llm_stream'),
+    path('api/github_webhook/', github_webhook, name='github_webhook')
 ]
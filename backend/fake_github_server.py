@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the parts of the GitHub API that fetch.py uses, for offline benchmarks and regression runs.
+
+Modes:
+  synthetic  Serves deterministic generated repositories (see --repo). Needs nothing but this file.
+  record     Proxies every request to the real API (--upstream) and saves the response under --recordings.
+  replay     Serves only what was saved by a record run. Unrecorded requests get a 404.
+
+Every mode serves the org repository list, contributors, contributor statistics, issue list/detail, commit list/detail and
+compare (JSON or patch) endpoints plus the GraphQL issues query, with real pagination `Link` headers (rewritten to point at this server), ETag/304 handling,
+per-token `X-RateLimit-*` headers (a 403 once a token's budget is spent), configurable latency and an optional
+rate of injected 502 errors (--error-rate) for exercising retries. Synthetic statistics can be made to answer 202
+("still computing") a few times first (--stats-pending).
+
+Example:
+  python fake_github_server.py --port 8765 --repo bench/alpha:2000:800 --latency 50
+  GITHUB_API_BASE_URL=http://127.0.0.1:8765 python fetch.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict, Optional, Tuple, Any
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+import requests
+
+GITHUB_API_URL = "https://api.github.com"
+DEFAULT_RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW_SECONDS = 3600
+# Response headers kept in recordings. Rate-limit headers are not recorded; replay emulates them.
+RECORDED_HEADER_NAMES = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+SYNTHETIC_START_DATE = datetime(2024, 6, 1, tzinfo=timezone.utc)
+PATCH_MEDIA_TYPE = "application/vnd.github.patch"
+COMPARE_MAX_COMMITS = 250
+
+ROUTE_PATTERNS = [
+    ("org_repos", re.compile(r'^/orgs/([^/]+)/repos$')),
+    ("contributors", re.compile(r'^/repos/([^/]+)/([^/]+)/contributors$')),
+    ("contributor_stats", re.compile(r'^/repos/([^/]+)/([^/]+)/stats/contributors$')),
+    ("issues", re.compile(r'^/repos/([^/]+)/([^/]+)/issues$')),
+    ("issue", re.compile(r'^/repos/([^/]+)/([^/]+)/issues/(\d+)$')),
+    ("commits", re.compile(r'^/repos/([^/]+)/([^/]+)/commits$')),
+    ("commit", re.compile(r'^/repos/([^/]+)/([^/]+)/commits/([0-9a-fA-F]+)$')),
+    ("compare", re.compile(r'^/repos/([^/]+)/([^/]+)/compare/([0-9a-fA-F]+)\.\.\.([0-9a-fA-F]+)$')),
+    ("graphql", re.compile(r'^/graphql$')),
+]
+
+def match_route(path: str) -> Tuple[str, Tuple[str, ...]]:
+    """Returns the endpoint kind for a request path and the captured path parts ("other" if unknown)."""
+    for kind, pattern in ROUTE_PATTERNS:
+        match = pattern.match(path)
+        if match: return kind, match.groups()
+    return "other", ()
+
+def iso_date(value: datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# --- Synthetic Repositories ---
+class SyntheticRepository:
+    """A deterministic generated repository: contributors, newest-first commits with patches, and closed issues/PRs."""
+
+    def __init__(self, owner: str, name: str, commit_count: int, issue_count: int, contributor_count: int = 12):
+        self.owner, self.name = owner, name
+        rng = random.Random(f"{owner}/{name}")
+        self.users = [
+            {
+                "login": f"{name}-dev{i}", "id": 10_000 + i + 1_000 * (sum(map(ord, name)) % 97),
+                "html_url": f"https://github.com/{name}-dev{i}",
+                "avatar_url": f"https://avatars.githubusercontent.com/u/{10_000 + i}?v=4", "type": "User"
+            }
+            for i in range(contributor_count)
+        ]
+        bot = {"login": "dependabot[bot]", "id": 49699333, "html_url": "https://github.com/apps/dependabot",
+               "avatar_url": "https://avatars.githubusercontent.com/in/29110?v=4", "type": "Bot"}
+
+        self.commits: List[Dict[str, Any]] = []
+        self.commit_files: Dict[str, List[Dict[str, Any]]] = {}
+        for i in range(commit_count):
+            sha = hashlib.sha1(f"{owner}/{name}:commit:{i}".encode('utf-8')).hexdigest()
+            author = bot if rng.random() < 0.05 else rng.choice(self.users)
+            date = iso_date(SYNTHETIC_START_DATE - timedelta(hours=3 * i + rng.randint(0, 2)))
+            self.commits.append({
+                "sha": sha,
+                "url": f"{GITHUB_API_URL}/repos/{owner}/{name}/commits/{sha}",
+                "html_url": f"https://github.com/{owner}/{name}/commit/{sha}",
+                "author": author,
+                "committer": author,
+                "commit": {
+                    "message": f"Change {commit_count - i} in {name}\n\nDetails of change {commit_count - i}.",
+                    "author": {"name": author["login"], "email": f"{author['id']}+{author['login']}@users.noreply.github.com", "date": date},
+                    "committer": {"name": author["login"], "email": f"{author['id']}+{author['login']}@users.noreply.github.com", "date": date},
+                    "comment_count": rng.choice([0, 0, 0, 1, 2]),
+                },
+                "parents": [],
+            })
+            self.commit_files[sha] = [
+                {
+                    "filename": f"src/module_{module}.py",
+                    "status": rng.choice(["modified", "modified", "added", "removed"]),
+                    "additions": 1, "deletions": 1, "changes": 2,
+                    "patch": "@@ -1,2 +1,2 @@\n def f():\n-    return %d\n+    return %d" % (j, j + 1),
+                }
+                for j, module in enumerate(rng.sample(range(40), rng.randint(0, 5)))
+            ]
+        for i in range(commit_count - 1):
+            self.commits[i]["parents"] = [{"sha": self.commits[i + 1]["sha"]}]
+
+        self.issues: List[Dict[str, Any]] = []
+        for i in range(issue_count):
+            number = issue_count - i
+            assignees = rng.sample(self.users, rng.choice([0, 1, 1, 2]))
+            issue = {
+                "id": 500_000 + number,
+                "number": number,
+                "url": f"{GITHUB_API_URL}/repos/{owner}/{name}/issues/{number}",
+                "html_url": f"https://github.com/{owner}/{name}/issues/{number}",
+                "title": f"Issue {number} in {name}",
+                "body": f"Steps to reproduce issue {number}.\n\n```python\nimport {name}\n```",
+                "state": "closed",
+                "state_reason": rng.choice(["completed", "completed", "not_planned"]),
+                "labels": [{"id": 1, "name": "bug", "color": "d73a4a", "default": True, "description": "Something isn't working"}] if number % 3 == 0 else [],
+                "comments": rng.randint(0, 8),
+                "updated_at": iso_date(SYNTHETIC_START_DATE - timedelta(hours=5 * i)),
+                "assignees": assignees,
+                "assignee": assignees[0] if assignees else None,
+            }
+            if number % 5 == 0:
+                issue["pull_request"] = {"url": f"{GITHUB_API_URL}/repos/{owner}/{name}/pulls/{number}"}
+            self.issues.append(issue)
+        self.issues_by_number = {issue["number"]: issue for issue in self.issues}
+        self.commits_by_sha = {commit["sha"]: commit for commit in self.commits}
+
+        counts: Dict[str, int] = {}
+        for commit in self.commits:
+            counts[commit["author"]["login"]] = counts.get(commit["author"]["login"], 0) + 1
+        people = {user["login"]: user for user in self.users + [bot]}
+        self.contributors = [
+            dict(people[login], contributions=count)
+            for login, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    def contributor_stats(self) -> List[Dict[str, Any]]:
+        """Weekly commit/addition/deletion counts per author over the whole history, as /stats/contributors returns them."""
+        def week_start(commit: Dict[str, Any]) -> int:
+            day = datetime.strptime(commit["commit"]["author"]["date"], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+            day = day.replace(hour=0, minute=0, second=0) - timedelta(days=(day.weekday() + 1) % 7) # Weeks start on Sunday
+            return int(day.timestamp())
+        if not self.commits: return []
+        weeks = list(range(week_start(self.commits[-1]), week_start(self.commits[0]) + 1, 7 * 24 * 3600))
+        by_author: Dict[str, Dict[int, Dict[str, int]]] = {}
+        authors: Dict[str, Dict[str, Any]] = {}
+        for commit in self.commits:
+            login = commit["author"]["login"]
+            authors[login] = commit["author"]
+            week = by_author.setdefault(login, {w: {"w": w, "a": 0, "d": 0, "c": 0} for w in weeks})[week_start(commit)]
+            week["c"] += 1
+            for f in self.commit_files[commit["sha"]]:
+                week["a"] += f["patch"].count("\n+")
+                week["d"] += f["patch"].count("\n-")
+        stats = [
+            {"total": sum(w["c"] for w in author_weeks.values()), "weeks": list(author_weeks.values()), "author": authors[login]}
+            for login, author_weeks in by_author.items()
+        ]
+        return sorted(stats, key=lambda entry: (entry["total"], entry["author"]["login"])) # GitHub lists the top author last
+
+    def summary(self) -> Dict[str, Any]:
+        """The repository as listed by the org repositories endpoint."""
+        return {
+            "name": self.name, "full_name": f"{self.owner}/{self.name}",
+            "html_url": f"https://github.com/{self.owner}/{self.name}",
+            "fork": False, "archived": False, "size": len(self.commits) * 10,
+            "pushed_at": self.commits[0]["commit"]["committer"]["date"] if self.commits else None,
+        }
+
+    def commits_between(self, base: str, head: str) -> Optional[List[Dict[str, Any]]]:
+        """Commits reachable from head but not base, oldest first (first-parent history only)."""
+        chain: List[Dict[str, Any]] = []
+        commit = self.commits_by_sha.get(head.lower())
+        while commit is not None and commit["sha"] != base.lower():
+            if len(chain) >= COMPARE_MAX_COMMITS: return None
+            chain.append(commit)
+            commit = self.commits_by_sha.get(commit["parents"][0]["sha"]) if commit["parents"] else None
+        return list(reversed(chain)) if commit is not None else None
+
+    def format_patch(self, commits: List[Dict[str, Any]]) -> str:
+        """Renders commits as a `git format-patch` series, like the compare endpoint's patch media type."""
+        parts = []
+        for number, commit in enumerate(commits, start=1):
+            author = commit["commit"]["author"]
+            subject, _, body = commit["commit"]["message"].partition("\n")
+            date = datetime.strptime(author["date"], '%Y-%m-%dT%H:%M:%SZ').strftime('%a, %d %b %Y %H:%M:%S +0000')
+            files = self.commit_files[commit["sha"]]
+            lines = [
+                f"From {commit['sha']} Mon Sep 17 00:00:00 2001",
+                f"From: {author['name']} <{author['email']}>",
+                f"Date: {date}",
+                f"Subject: [PATCH {number}/{len(commits)}] {subject}",
+                "", body.strip(), "---",
+            ]
+            lines += [f" {f['filename']} | 2 +-" for f in files]
+            lines += [f" {len(files)} files changed", ""]
+            for f in files:
+                old_name = "/dev/null" if f["status"] == "added" else f"a/{f['filename']}"
+                new_name = "/dev/null" if f["status"] == "removed" else f"b/{f['filename']}"
+                lines.append(f"diff --git a/{f['filename']} b/{f['filename']}")
+                if f["status"] == "added": lines.append("new file mode 100644")
+                if f["status"] == "removed": lines.append("deleted file mode 100644")
+                lines += [f"--- {old_name}", f"+++ {new_name}", f["patch"]]
+            lines += ["-- ", "2.39.5", "", ""]
+            parts.append("\n".join(lines))
+        return "".join(parts)
+
+class SyntheticGitHub:
+    """Answers API requests from a set of SyntheticRepository objects."""
+
+    def __init__(self, repositories: List[SyntheticRepository], stats_pending: int = 0):
+        self.repositories = {(r.owner.lower(), r.name.lower()): r for r in repositories}
+        # Statistics requests per repository still to be answered with 202 while they are "computed"
+        self.stats_pending = {key: stats_pending for key in self.repositories}
+        self.lock = threading.Lock()
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Optional[bytes], accept: str = "") -> Tuple[int, Any, Optional[Tuple[int, int]]]:
+        """Returns (status, JSON body or patch text, (page, last_page) or None for unpaginated responses)."""
+        kind, parts = match_route(path)
+        if kind == "graphql" and method == "POST":
+            return self.graphql(json.loads(body or b'{}'))
+        if kind in ("other", "graphql") or method != "GET":
+            return 404, {"message": "Not Found"}, None
+        if kind == "org_repos":
+            repos = [r.summary() for r in self.repositories.values() if r.owner.lower() == parts[0].lower()]
+            return self.paginate(repos, query) if repos else (404, {"message": "Not Found"}, None)
+        repository = self.repositories.get((parts[0].lower(), parts[1].lower()))
+        if repository is None:
+            return 404, {"message": "Not Found"}, None
+
+        if kind == "contributor_stats":
+            with self.lock:
+                key = (repository.owner.lower(), repository.name.lower())
+                pending = self.stats_pending[key] > 0
+                if pending: self.stats_pending[key] -= 1
+            return (202, {}, None) if pending else (200, repository.contributor_stats(), None)
+        if kind == "issue":
+            issue = repository.issues_by_number.get(int(parts[2]))
+            return (200, issue, None) if issue else (404, {"message": "Not Found"}, None)
+        if kind == "commit":
+            commit = repository.commits_by_sha.get(parts[2].lower())
+            if commit is None: return 422, {"message": f"No commit found for SHA: {parts[2]}"}, None
+            return 200, dict(commit, files=repository.commit_files[commit["sha"]]), None
+        if kind == "compare":
+            commits = repository.commits_between(parts[2], parts[3])
+            if commits is None: return 404, {"message": "Not Found"}, None
+            if PATCH_MEDIA_TYPE in accept: return 200, repository.format_patch(commits), None
+            files = [f for c in commits for f in repository.commit_files[c["sha"]]]
+            return 200, {"status": "ahead", "ahead_by": len(commits), "behind_by": 0, "total_commits": len(commits), "commits": commits, "files": files}, None
+
+        if kind == "contributors":
+            items = repository.contributors
+        elif kind == "issues":
+            items = repository.issues
+            if query.get("state", "open") == "open": items = []
+            if query.get("since"): items = [i for i in items if i["updated_at"] >= query["since"]]
+        else:
+            items = repository.commits
+            if query.get("since"): items = [c for c in items if c["commit"]["committer"]["date"] >= query["since"]]
+        return self.paginate(items, query)
+
+    @staticmethod
+    def paginate(items: List[Any], query: Dict[str, str]) -> Tuple[int, Any, Optional[Tuple[int, int]]]:
+        try:
+            per_page = max(1, min(100, int(query.get("per_page", 30))))
+            page = max(1, int(query.get("page", 1)))
+        except ValueError:
+            return 422, {"message": "Invalid pagination parameters"}, None
+        last_page = max(1, -(-len(items) // per_page))
+        return 200, items[(page - 1) * per_page:page * per_page], (page, last_page)
+
+    def graphql(self, payload: Dict[str, Any]) -> Tuple[int, Any, None]:
+        """Answers the closed-issues query used by fetch.py; anything else gets a GraphQL error."""
+        variables = payload.get("variables") or {}
+        repository = self.repositories.get((str(variables.get("owner", "")).lower(), str(variables.get("name", "")).lower()))
+        if "issues(" not in payload.get("query", "") or repository is None:
+            return 200, {"data": None, "errors": [{"message": "Unsupported query for the fake GitHub server"}]}, None
+        issues = [i for i in repository.issues if "pull_request" not in i]
+        if variables.get("since"): issues = [i for i in issues if i["updated_at"] >= variables["since"]]
+        start = int(variables.get("cursor") or 0)
+        page = issues[start:start + int(variables.get("pageSize") or 100)]
+        end = start + len(page)
+        nodes = [
+            {
+                "databaseId": i["id"], "number": i["number"], "title": i["title"], "body": i["body"], "url": i["html_url"],
+                "updatedAt": i["updated_at"], "stateReason": i["state_reason"].upper(),
+                "comments": {"totalCount": i["comments"]},
+                "labels": {"nodes": [
+                    {"id": f"LA_{l['id']}", "name": l["name"], "color": l["color"], "description": l["description"], "isDefault": l["default"]}
+                    for l in i["labels"]
+                ]},
+                "assignees": {"nodes": [
+                    {"login": a["login"], "databaseId": a["id"], "url": a["html_url"], "avatarUrl": a["avatar_url"]}
+                    for a in i["assignees"]
+                ]},
+            }
+            for i in page
+        ]
+        connection = {"pageInfo": {"hasNextPage": end < len(issues), "endCursor": str(end)}, "nodes": nodes}
+        return 200, {"data": {"repository": {"issues": connection}}}, None
+
+def parse_repository_spec(spec: str) -> SyntheticRepository:
+    """Parses OWNER/NAME[:COMMITS[:ISSUES[:CONTRIBUTORS]]] into a synthetic repository."""
+    name_part, *counts = spec.split(':')
+    owner, _, name = name_part.partition('/')
+    if not owner or not name:
+        raise argparse.ArgumentTypeError(f"Expected OWNER/NAME[:COMMITS[:ISSUES[:CONTRIBUTORS]]], got '{spec}'")
+    numbers = [int(c) for c in counts] + [300, 150, 12][len(counts):]
+    return SyntheticRepository(owner, name, numbers[0], numbers[1], numbers[2])
+
+
+# --- Recordings ---
+class RecordingStore:
+    """Saved responses on disk, one JSON file per request keyed by method, path, query, body and Accept header."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def request_key(method: str, path: str, query: Dict[str, str], body: Optional[bytes], accept: str = "") -> str:
+        body_hash = hashlib.sha256(body).hexdigest() if body else ""
+        canonical = f"{method}\n{path}\n{urlencode(sorted(query.items()))}\n{body_hash}\n{accept}"
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self.path_for(key)
+        if not os.path.exists(path): return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+
+# --- Server ---
+class FakeGitHubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        mode: str = "synthetic",
+        synthetic: Optional[SyntheticGitHub] = None,
+        recordings: Optional[RecordingStore] = None,
+        upstream: str = GITHUB_API_URL,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate_limit: int = DEFAULT_RATE_LIMIT,
+        error_rate: float = 0.0
+    ):
+        super().__init__(address, FakeGitHubRequestHandler)
+        if mode in ("record", "replay") and recordings is None:
+            raise ValueError(f"{mode} mode needs a recordings directory")
+        self.mode = mode
+        self.synthetic = synthetic or SyntheticGitHub([])
+        self.recordings = recordings
+        self.upstream = upstream.rstrip('/')
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.budgets: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self.request_counts: Dict[str, int] = {}
+        self.not_modified_count = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def total_requests(self) -> int:
+        with self.lock:
+            return sum(self.request_counts.values())
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.request_counts.clear()
+            self.not_modified_count = 0
+            self.error_count = 0
+            self.bytes_sent = 0
+
+    def charge(self, authorization: str, resource: str) -> Dict[str, float]:
+        """Spends one request from the caller's budget and returns the budget (remaining may already be 0)."""
+        now = time.time()
+        with self.lock:
+            budget = self.budgets.get((authorization, resource))
+            if budget is None or budget["reset_at"] <= now:
+                budget = self.budgets[(authorization, resource)] = {"remaining": self.rate_limit, "reset_at": int(now) + RATE_LIMIT_WINDOW_SECONDS}
+            budget = dict(budget, exhausted=budget["remaining"] <= 0)
+            if not budget["exhausted"]:
+                self.budgets[(authorization, resource)]["remaining"] -= 1
+                budget["remaining"] -= 1
+            return budget
+
+    def respond(self, method: str, path: str, query: Dict[str, str], body: Optional[bytes], headers) -> Tuple[int, Dict[str, str], bytes]:
+        """Produces the status, headers and body for one request in the server's mode."""
+        if self.mode == "synthetic":
+            status, payload, pagination = self.synthetic.handle(method, path, query, body, headers.get("Accept", ""))
+            if isinstance(payload, str):
+                return status, {"Content-Type": "text/plain; charset=utf-8"}, payload.encode('utf-8')
+            response_headers = {"Content-Type": "application/json; charset=utf-8"}
+            if pagination:
+                link = self.link_header(path, query, *pagination)
+                if link: response_headers["Link"] = link
+            return status, response_headers, json.dumps(payload).encode('utf-8')
+
+        key = RecordingStore.request_key(method, path, query, body, headers.get("Accept", ""))
+        entry = self.recordings.load(key) if self.mode == "replay" else None
+        if entry is None and self.mode == "replay":
+            print(f"Not recorded: {method} {path}?{urlencode(query)}")
+            return 404, {"Content-Type": "application/json"}, b'{"message": "Not recorded"}'
+        if entry is None:
+            entry = self.record(key, method, path, query, body, headers)
+        response_headers = dict(entry["headers"])
+        if "Link" in response_headers:
+            response_headers["Link"] = response_headers["Link"].replace(entry.get("upstream", self.upstream), self.base_url)
+        return entry["status"], response_headers, entry["body"].encode('utf-8')
+
+    def record(self, key: str, method: str, path: str, query: Dict[str, str], body: Optional[bytes], headers) -> Dict[str, Any]:
+        forward_headers = {name: headers[name] for name in ("Authorization", "Accept", "X-GitHub-Api-Version", "Content-Type") if headers.get(name)}
+        response = requests.request(method, f"{self.upstream}{path}", params=query, data=body, headers=forward_headers, timeout=60)
+        entry = {
+            "upstream": self.upstream,
+            "method": method,
+            "path": path,
+            "query": query,
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in RECORDED_HEADER_NAMES if name in response.headers},
+            "body": response.text,
+        }
+        if response.status_code < 500 and response.status_code not in (202, 403, 429):
+            self.recordings.save(key, entry) # Don't freeze transient failures, rate-limit rejections or unfinished statistics into the recording
+        return entry
+
+    def link_header(self, path: str, query: Dict[str, str], page: int, last_page: int) -> str:
+        def url_for(target_page: int) -> str:
+            return f"{self.base_url}{path}?{urlencode(dict(query, page=str(target_page)))}"
+        links = []
+        if page < last_page:
+            links.append(f'<{url_for(page + 1)}>; rel="next"')
+            links.append(f'<{url_for(last_page)}>; rel="last"')
+        if page > 1:
+            links.append(f'<{url_for(1)}>; rel="first"')
+            links.append(f'<{url_for(page - 1)}>; rel="prev"')
+        return ", ".join(links)
+
+class FakeGitHubRequestHandler(BaseHTTPRequestHandler):
+    server: FakeGitHubServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass # Benchmarks would drown in per-request log lines
+
+    def do_GET(self) -> None:
+        self.handle_api_request("GET")
+
+    def do_POST(self) -> None:
+        self.handle_api_request("POST")
+
+    def handle_api_request(self, method: str) -> None:
+        server = self.server
+        parsed = urlparse(self.path)
+        query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        kind, _ = match_route(parsed.path)
+
+        if server.latency_ms or server.jitter_ms:
+            delay_ms = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+            time.sleep(max(0.0, delay_ms) / 1000)
+
+        if server.error_rate and random.random() < server.error_rate:
+            status, headers, payload = 502, {"Content-Type": "application/json"}, b'{"message": "Server Error (injected by fake GitHub server)."}'
+            with server.lock:
+                server.error_count += 1
+        else:
+            try:
+                status, headers, payload = server.respond(method, parsed.path, query, body, self.headers)
+            except requests.exceptions.RequestException as e:
+                status, headers, payload = 502, {"Content-Type": "application/json"}, json.dumps({"message": f"Upstream error: {e}"}).encode('utf-8')
+
+        if status == 200 and "ETag" not in headers:
+            headers["ETag"] = f'"{hashlib.sha1(payload).hexdigest()}"'
+        if status == 200 and self.headers.get("If-None-Match") == headers["ETag"]:
+            # Conditional hits are free on GitHub, so they don't touch the rate-limit budget
+            with server.lock:
+                server.request_counts[kind] = server.request_counts.get(kind, 0) + 1
+                server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header("ETag", headers["ETag"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if server.mode != "record":
+            resource = "graphql" if kind == "graphql" else "core"
+            budget = server.charge(self.headers.get("Authorization", ""), resource)
+            if budget["exhausted"]:
+                status, headers = 403, {"Content-Type": "application/json"}
+                payload = b'{"message": "API rate limit exceeded (fake GitHub server)."}'
+            headers.update({
+                "X-RateLimit-Limit": str(server.rate_limit),
+                "X-RateLimit-Remaining": str(max(0, int(budget["remaining"]))),
+                "X-RateLimit-Reset": str(int(budget["reset_at"])),
+                "X-RateLimit-Resource": resource,
+            })
+
+        with server.lock:
+            server.request_counts[kind] = server.request_counts.get(kind, 0) + 1
+            server.bytes_sent += len(payload)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs: Any) -> FakeGitHubServer:
+    """Starts a FakeGitHubServer on a background thread (port 0 picks a free port). Call shutdown() when done."""
+    server = FakeGitHubServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="FakeGitHubServer", daemon=True).start()
+    return server
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the GitHub API used by fetch.py.")
+    parser.add_argument('--mode', choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--repo', dest='repos', action='append', type=parse_repository_spec, default=[],
+                        help="Synthetic repository as OWNER/NAME[:COMMITS[:ISSUES[:CONTRIBUTORS]]]. Repeatable.")
+    parser.add_argument('--recordings', default="github_recordings", help="Directory of recorded responses (record/replay modes).")
+    parser.add_argument('--upstream', default=GITHUB_API_URL, help="API recorded from in record mode.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Added latency per request, in milliseconds.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Uniform +/- jitter on the latency, in milliseconds.")
+    parser.add_argument('--rate-limit', type=int, default=DEFAULT_RATE_LIMIT, help="Requests per token per hour before 403s.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 502.")
+    parser.add_argument('--stats-pending', type=int, default=0,
+                        help="Answer the first N contributor statistics requests per synthetic repository with 202, as GitHub does while computing them.")
+    args = parser.parse_args()
+
+    repositories = args.repos or [parse_repository_spec("bench/alpha"), parse_repository_spec("bench/beta:120:60")]
+    server = FakeGitHubServer(
+        (args.host, args.port), mode=args.mode,
+        synthetic=SyntheticGitHub(repositories, stats_pending=args.stats_pending) if args.mode == "synthetic" else None,
+        recordings=RecordingStore(args.recordings) if args.mode != "synthetic" else None,
+        upstream=args.upstream, latency_ms=args.latency, jitter_ms=args.jitter, rate_limit=args.rate_limit,
+        error_rate=args.error_rate
+    )
+    print(f"Fake GitHub API ({args.mode}) listening on {server.base_url}")
+    if args.mode == "synthetic":
+        for r in repositories:
+            print(f"  https://github.com/{r.owner}/{r.name}: {len(r.commits)} commits, {len(r.issues)} issues")
+    print(f"Point fetch.py at it with GITHUB_API_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,22 +1,134 @@
 # -*- coding: utf-8 -*-
 import requests
+from requests.structures import CaseInsensitiveDict
 import json
 import os
-from urllib.parse import urlparse
-from typing import List, Dict, Optional, Tuple, Any
+import gzip
+import re
+import hashlib
+import threading
+import collections
+import concurrent.futures
+import itertools
+import fnmatch
+import shutil
+import subprocess
+import argparse
+from urllib.parse import urlparse, urlunparse, urlencode, parse_qsl, quote
+from typing import List, Dict, Optional, Tuple, Any, Callable, Hashable, Set, Iterable, Iterator
 from dotenv import load_dotenv
 import time
+import random
+from datetime import datetime, timezone
 
 # --- Load Environment Variables ---
 load_dotenv()
 
 # --- Configuration ---
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+# Optional comma-separated pool of tokens. Requests are spread across the pool, each token
+# keeping its own rate-limit budget. GITHUB_TOKEN, if set, is always part of the pool.
+GITHUB_TOKENS = list(dict.fromkeys(
+    ([GITHUB_TOKEN] if GITHUB_TOKEN else []) + [t.strip() for t in os.getenv('GITHUB_TOKENS', '').split(',') if t.strip()]
+))
 GITHUB_API_VERSION = "2022-11-28"
-API_BASE_URL = "https://api.github.com"
+# Overridable so crawls can run against a local stand-in (see fake_github_server.py)
+API_BASE_URL = os.getenv('GITHUB_API_BASE_URL', "https://api.github.com")
 COMMIT_MESSAGE_MAX_LEN = 200
 MAX_COMMITS_TO_DETAIL_PER_REPO = 500
 MAX_ISSUES_TO_DETAIL_PER_REPO = 500
+# Number of commit/issue detail requests kept in flight at once. GitHub's secondary
+# rate limits discourage heavy concurrency, so keep this modest.
+MAX_CONCURRENT_DETAIL_REQUESTS = 8
+# Number of list pages (contributors, issues, commits) fetched at once once the last page is known.
+MAX_CONCURRENT_PAGE_REQUESTS = 4
+# Number of repositories crawled at once. Their results are merged in input order.
+MAX_CONCURRENT_REPOSITORIES = 4
+# Number of repositories submitted ahead of the one being merged. Results that finish early are held
+# in memory until their turn, so this bounds how many can pile up behind a slow repository.
+REPOSITORY_WINDOW = 2 * MAX_CONCURRENT_REPOSITORIES
+# On-disk cache of GitHub responses. Commit details (keyed by SHA) never change and are
+# served straight from disk; everything else is revalidated with If-None-Match/If-Modified-Since,
+# and a 304 reply does not count against the rate limit. Set to an empty string to disable.
+HTTP_CACHE_DIR = os.getenv('GITHUB_HTTP_CACHE_DIR', '.github_http_cache')
+# Per-repo watermarks (last seen commit and issue update) used for incremental crawls.
+# When this file and the previous output file both exist, only newer activity is fetched
+# and merged into the previous contributor map.
+WATERMARKS_FILE = os.getenv('GITHUB_WATERMARKS_FILE', 'fetch_watermarks.json')
+# How closed issues are ingested: "rest" lists issues and then fetches each one's details,
+# "graphql" gets bodies, labels, comment counts and assignees for 100 issues per request (needs a token).
+ISSUE_FETCH_MODE = os.getenv('GITHUB_ISSUE_FETCH_MODE', 'rest')
+GRAPHQL_ISSUES_PAGE_SIZE = 100
+# Output format: "json" writes one document at the end of the crawl, "ndjson" (or "ndjson.gz")
+# streams one contributor-work record per line as each repository finishes.
+OUTPUT_FORMAT = os.getenv('FETCH_OUTPUT_FORMAT', 'json')
+# Where finished repositories and completed detail fetches are checkpointed, so an interrupted
+# crawl can be restarted with --resume. Cleared at the start of a fresh run and after a successful one.
+CHECKPOINT_DIR = os.getenv('FETCH_CHECKPOINT_DIR', '.fetch_checkpoint')
+# Local git mirrors. When set, commits, messages, changed files and patches are read from a bare
+# clone at <GIT_MIRROR_DIR>/<owner>/<repo>.git (cloned or updated as needed) instead of one API
+# request per commit, and the per-repo commit detail limit does not apply. With GIT_MIRROR_OFFLINE=1
+# the mirrors are used as they are and commit authors are resolved from their noreply emails only.
+GIT_MIRROR_DIR = os.getenv('GIT_MIRROR_DIR')
+GIT_MIRROR_OFFLINE = os.getenv('GIT_MIRROR_OFFLINE') == '1'
+# How commit details are fetched: "commit" makes one request per commit, "compare" fetches each run of
+# consecutive (linear, non-merge) commits with one compare request in patch format and splits it per commit.
+COMMIT_DETAIL_MODE = os.getenv('GITHUB_COMMIT_DETAIL_MODE', 'commit')
+# Longest run of commits fetched by one compare request. Longer runs risk GitHub's diff size limits.
+COMPARE_MAX_COMMITS_PER_REQUEST = 50
+# Lists are read lazily: issue pages stop once MAX_ISSUES_TO_DETAIL_PER_REPO issues are detailed.
+# Commits past the detail limit are still written (message and URL only) unless this is set to "0",
+# in which case the commit list also stops at the limit instead of paging through the whole history.
+LIST_UNDETAILED_COMMITS = os.getenv('FETCH_UNDETAILED_COMMITS', '1') != '0'
+# Patch filtering. Patches of paths matching PATCH_ELISION_GLOBS (lockfiles, generated, vendored and data files)
+# are left out of diff_patch, and longer patches are cut to MAX_PATCH_BYTES_PER_FILE, or dropped once a commit's
+# patches reach MAX_PATCH_BYTES_PER_COMMIT (0 = no cap). Each elided file is marked in files_changed.
+# FETCH_PATCH_SKIP_GLOBS adds comma-separated globs, and FETCH_PATCH_FILTER=0 keeps every patch whole.
+PATCH_FILTER_ENABLED = os.getenv('FETCH_PATCH_FILTER', '1') != '0'
+MAX_PATCH_BYTES_PER_FILE = int(os.getenv('FETCH_MAX_PATCH_BYTES_PER_FILE', '20000'))
+MAX_PATCH_BYTES_PER_COMMIT = int(os.getenv('FETCH_MAX_PATCH_BYTES_PER_COMMIT', '100000'))
+PATCH_ELISION_GLOBS: Dict[str, List[str]] = {
+    "lockfile": ["package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "pipfile.lock",
+                 "uv.lock", "pdm.lock", "conda-lock.yml", "cargo.lock", "gemfile.lock", "composer.lock", "go.sum", "manifest.toml"],
+    "generated": ["*.min.js", "*.min.css", "*.map", "*.bundle.js", "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*"],
+    "notebook": ["*.ipynb"],
+    "vendored": ["vendor/*", "*/vendor/*", "third_party/*", "*/third_party/*", "node_modules/*", "*/node_modules/*"],
+    "data": ["*.csv", "*.tsv", "*.svg", "*.geojson"],
+    "custom": [g.strip().lower() for g in os.getenv('FETCH_PATCH_SKIP_GLOBS', '').split(',') if g.strip()],
+}
+# Weekly commit and line counts per author, for the repository's whole history, from one /stats/contributors
+# request per repository. They are stored as each work's `weekly_activity`. GitHub answers 202 while it computes
+# the statistics, so the request is repeated up to CONTRIBUTOR_STATS_RETRIES times, CONTRIBUTOR_STATS_RETRY_SECONDS apart.
+FETCH_CONTRIBUTOR_STATS = os.getenv('GITHUB_CONTRIBUTOR_STATS', '1') != '0'
+CONTRIBUTOR_STATS_RETRIES = 5
+CONTRIBUTOR_STATS_RETRY_SECONDS = float(os.getenv('GITHUB_CONTRIBUTOR_STATS_RETRY_SECONDS', '3'))
+# Org discovery (--org): which of an organisation's repositories are crawled.
+ORG_INCLUDE_FORKS = False
+ORG_INCLUDE_ARCHIVED = False
+# Which commits get details when a repository has more than MAX_COMMITS_TO_DETAIL_PER_REPO (see COMMIT_SAMPLING_POLICIES):
+#   "recent"           the newest commits, in list order (the original behaviour)
+#   "per_author"       round robin over authors, newest first for each, so occasional authors get details too
+#   "time_stratified"  round robin over TIME_STRATA equal slices of the listed history, newest slice first
+# The other policies read the whole commit list first, and leave merge commits and bot-like authors for last.
+COMMIT_SAMPLING_POLICY = os.getenv('GITHUB_COMMIT_SAMPLING', 'recent')
+TIME_STRATA = 12
+# Optional date cutoff (ISO 8601). Commits dated before it, and issues last updated before it, are not fetched.
+FETCH_SINCE = os.getenv('FETCH_SINCE')
+# Request pacing. Below this fraction of a token's hourly budget, requests are spread evenly
+# over the time left until the budget resets instead of running it dry and stalling.
+RATE_LIMIT_PACING_FRACTION = 0.2
+# Per-token floor between requests, keeping under GitHub's secondary limit of 900 points/minute.
+MIN_REQUEST_INTERVAL_SECONDS = 60 / 900
+# Wait used for a secondary rate limit response that carries no Retry-After header.
+SECONDARY_RATE_LIMIT_WAIT_SECONDS = 60
+# Transient failures (5xx responses, network errors) are retried with exponential backoff and full jitter:
+# before retry n the wait is uniform in [0, min(MAX, BASE * 2**n)] seconds.
+TRANSIENT_RETRIES = int(os.getenv('GITHUB_TRANSIENT_RETRIES', '4'))
+RETRY_BACKOFF_BASE_SECONDS = 1.0
+RETRY_BACKOFF_MAX_SECONDS = 60.0
+# Requests that still fail after their retries are appended here, for `fetch.py --replay-dead-letters`.
+# Set to an empty string to disable.
+DEAD_LETTER_FILE = os.getenv('FETCH_DEAD_LETTER_FILE', 'fetch_dead_letters.jsonl')
 
 # --- Helper Functions (Keep the existing parse_github_url, make_github_request, fetch_paginated_data) ---
 # (Include the full code for parse_github_url, make_github_request, fetch_paginated_data here from the previous version)
@@ -40,34 +152,443 @@ def parse_github_url(url: str) -> Optional[Tuple[str, str]]:
         print(f"Error parsing URL '{url}': {e}")
         return None
 
+_thread_local = threading.local()
+
+def get_http_session() -> requests.Session:
+    """Returns a requests session private to the calling thread, so connections are reused."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+# --- Persistent Response Cache ---
+IMMUTABLE_URL_PATTERN = re.compile(r'/repos/[^/]+/[^/]+/(?:commits/[0-9a-fA-F]{40}|compare/[0-9a-fA-F]{40}\.\.\.[0-9a-fA-F]{40})$')
+CACHED_HEADER_NAMES = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+def response_cache_path(url: str, params: Optional[Dict], accept_header: str, token: Optional[str]) -> Optional[str]:
+    """
+    Returns the cache file path for a GET request, or None when caching is disabled.
+    What a response holds depends on who asks (private repositories), so entries are kept apart per set of
+    credentials: the token pool, whose tokens all stand in for each other, or else the token used.
+    """
+    if not HTTP_CACHE_DIR: return None
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    credentials = "\n".join(sorted(RATE_LIMITER.tokens)) if RATE_LIMITER.tokens else (token or "")
+    key = hashlib.sha256(f"{credentials}\n{accept_header}\n{full_url}".encode('utf-8')).hexdigest()
+    return os.path.join(HTTP_CACHE_DIR, key[:2], f"{key}.json")
+
+def load_cached_response(cache_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Loads a cache entry written by store_cached_response, if present and readable."""
+    if not cache_path or not os.path.exists(cache_path): return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"  Warning: Ignoring unreadable cache entry {cache_path}: {e}")
+        return None
+
+def store_cached_response(cache_path: Optional[str], response: requests.Response) -> None:
+    """Writes a successful response to the cache. The write is atomic so concurrent workers never see partial files."""
+    if not cache_path or response.status_code != 200: return
+    entry = {
+        "url": response.url,
+        "status_code": response.status_code,
+        "headers": {name: response.headers[name] for name in CACHED_HEADER_NAMES if name in response.headers},
+        "body": response.text,
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except IOError as e:
+        print(f"  Warning: Could not write cache entry {cache_path}: {e}")
+
+def response_from_cache(entry: Dict[str, Any]) -> requests.Response:
+    """Rebuilds a requests.Response from a cache entry so callers can't tell it apart from a live one."""
+    response = requests.Response()
+    response.status_code = entry["status_code"]
+    response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+    response._content = entry["body"].encode('utf-8')
+    response.encoding = 'utf-8'
+    response.url = entry.get("url")
+    return response
+
+# --- Fetch Metrics ---
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Minimum spacing between remaining-quota samples per token, so a long crawl keeps a bounded time series.
+QUOTA_SAMPLE_INTERVAL_SECONDS = 30
+ENDPOINT_TYPE_PATTERNS = (
+    ("org_repos", re.compile(r'/orgs/[^/]+/repos$')),
+    ("contributors", re.compile(r'/repos/[^/]+/[^/]+/contributors$')),
+    ("issue_list", re.compile(r'/repos/[^/]+/[^/]+/issues$')),
+    ("issue_detail", re.compile(r'/repos/[^/]+/[^/]+/issues/\d+$')),
+    ("commit_list", re.compile(r'/repos/[^/]+/[^/]+/commits$')),
+    ("commit_detail", re.compile(r'/repos/[^/]+/[^/]+/commits/[^/]+$')),
+    ("compare", re.compile(r'/repos/[^/]+/[^/]+/compare/[^/]+$')),
+    ("contributor_stats", re.compile(r'/repos/[^/]+/[^/]+/stats/contributors$')),
+    ("graphql", re.compile(r'/graphql$')),
+)
+
+def histogram_percentile(histogram: List[int], fraction: float, max_ms: float) -> Optional[float]:
+    """
+    Estimates a latency percentile from a LATENCY_BUCKETS_MS histogram: the upper bound of the bucket that holds it,
+    capped at the largest latency seen (which also stands in for the open-ended last bucket).
+    """
+    total = sum(histogram)
+    if not total: return None
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (None,), histogram):
+        cumulative += count
+        if cumulative >= fraction * total:
+            return round(float(max_ms if bound is None else min(bound, max_ms)), 1)
+    return round(max_ms, 1)
+
+def endpoint_type(url: str) -> str:
+    """Classifies an API URL into the endpoint types reported by FetchMetrics."""
+    path = urlparse(url).path.rstrip('/')
+    for name, pattern in ENDPOINT_TYPE_PATTERNS:
+        if pattern.search(path): return name
+    return "other"
+
+class FetchMetrics:
+    """
+    Thread-safe counters for a crawl: requests, latency histograms, bytes and cache hits per endpoint type,
+    retries, time spent waiting on rate limits, pages fetched, and remaining quota over time per token.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self.retries: Dict[str, int] = collections.Counter()
+        self.rate_limit_waits: Dict[str, Dict[str, float]] = {}
+        self.quota_samples: Dict[str, List[Tuple[float, int, int]]] = {}
+
+    def _endpoint(self, endpoint: str) -> Dict[str, Any]:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                "requests": 0, "status_codes": collections.Counter(), "bytes": 0,
+                "cache_hits": 0, "not_modified": 0, "network_errors": 0,
+                "latency_ms_sum": 0.0, "latency_ms_max": 0.0,
+                "latency_histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                "pages": 0, "items": 0,
+            }
+        return self.endpoints[endpoint]
+
+    def record_request(self, endpoint: str, status_code: Optional[int], latency_seconds: float, size: int = 0) -> None:
+        """Records one HTTP round trip (status_code None for a network error)."""
+        latency_ms = latency_seconds * 1000
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats["requests"] += 1
+            if status_code is None: stats["network_errors"] += 1
+            else: stats["status_codes"][str(status_code)] += 1
+            if status_code == 304: stats["not_modified"] += 1
+            stats["bytes"] += size
+            stats["latency_ms_sum"] += latency_ms
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+            stats["latency_histogram"][bucket] += 1
+
+    def record_cache_hit(self, endpoint: str) -> None:
+        """Records a response served from the on-disk cache without a request."""
+        with self._lock:
+            self._endpoint(endpoint)["cache_hits"] += 1
+
+    def record_page(self, endpoint: str, item_count: int) -> None:
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats["pages"] += 1
+            stats["items"] += item_count
+
+    def record_retry(self, endpoint: str, reason: str) -> None:
+        with self._lock:
+            self.retries[f"{endpoint}:{reason}"] += 1
+
+    def record_rate_limit_wait(self, token: Optional[str], resource: str, seconds: float) -> None:
+        with self._lock:
+            waits = self.rate_limit_waits.setdefault(f"{mask_token(token)}:{resource}", {"waits": 0, "seconds": 0.0})
+            waits["waits"] += 1
+            waits["seconds"] += seconds
+
+    def record_quota(self, token: Optional[str], resource: str, remaining: int, limit: int) -> None:
+        """Samples a token's remaining budget (at most every QUOTA_SAMPLE_INTERVAL_SECONDS, and whenever it runs out)."""
+        now = time.time()
+        with self._lock:
+            samples = self.quota_samples.setdefault(f"{mask_token(token)}:{resource}", [])
+            if not samples or remaining == 0 or now - samples[-1][0] >= QUOTA_SAMPLE_INTERVAL_SECONDS:
+                samples.append((now, remaining, limit))
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the metrics as a JSON-serialisable dict."""
+        with self._lock:
+            endpoints = {}
+            for name, stats in sorted(self.endpoints.items()):
+                timed = sum(stats["latency_histogram"])
+                endpoints[name] = {
+                    "requests": stats["requests"],
+                    "status_codes": dict(stats["status_codes"]),
+                    "network_errors": stats["network_errors"],
+                    "not_modified": stats["not_modified"],
+                    "cache_hits": stats["cache_hits"],
+                    "bytes": stats["bytes"],
+                    "latency_ms_mean": round(stats["latency_ms_sum"] / timed, 1) if timed else None,
+                    "latency_ms_max": round(stats["latency_ms_max"], 1),
+                    "latency_ms_p50": histogram_percentile(stats["latency_histogram"], 0.5, stats["latency_ms_max"]),
+                    "latency_ms_p95": histogram_percentile(stats["latency_histogram"], 0.95, stats["latency_ms_max"]),
+                    "latency_histogram_ms": {
+                        **{f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, stats["latency_histogram"])},
+                        f">{LATENCY_BUCKETS_MS[-1]}": stats["latency_histogram"][-1],
+                    },
+                    "pages": stats["pages"],
+                    "items": stats["items"],
+                }
+            return {
+                "elapsed_seconds": round(time.time() - self.started_at, 2),
+                "requests": sum(e["requests"] for e in endpoints.values()),
+                "bytes": sum(e["bytes"] for e in endpoints.values()),
+                "endpoints": endpoints,
+                "retries": dict(self.retries),
+                "rate_limit_waits": {k: {"waits": v["waits"], "seconds": round(v["seconds"], 2)} for k, v in self.rate_limit_waits.items()},
+                "remaining_quota": {
+                    key: [{"time": round(t - self.started_at, 1), "remaining": remaining, "limit": limit} for t, remaining, limit in samples]
+                    for key, samples in self.quota_samples.items()
+                },
+            }
+
+    def summary_lines(self) -> List[str]:
+        """Short human-readable summary of the report, one line per endpoint type."""
+        report = self.report()
+        lines = [f"{report['requests']} requests, {report['bytes'] / 1e6:.1f} MB in {report['elapsed_seconds']:.0f}s"]
+        for name, stats in report["endpoints"].items():
+            lines.append(
+                f"  {name}: {stats['requests']} requests, {stats['cache_hits']} cache hits, {stats['not_modified']} not modified, "
+                f"mean {stats['latency_ms_mean']} ms, p95 {stats['latency_ms_p95']} ms, max {stats['latency_ms_max']} ms"
+            )
+        waited = sum(w["seconds"] for w in report["rate_limit_waits"].values())
+        lines.append(f"  retries: {sum(report['retries'].values())}, rate-limit waiting: {waited:.1f}s")
+        return lines
+
+FETCH_METRICS = FetchMetrics()
+
+# --- Rate Limit Scheduler ---
+def mask_token(token: Optional[str]) -> str:
+    """Short printable identifier for a token."""
+    return f"...{token[-4:]}" if token else "unauthenticated"
+
+class RateLimitScheduler:
+    """
+    Paces GitHub requests from each token's remaining budget and reset time, honours Retry-After
+    and secondary rate limits, and spreads requests across a pool of tokens. Thread-safe.
+    """
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = list(tokens)
+        self._lock = threading.Lock()
+        self._state: Dict[Tuple[Optional[str], str], Dict[str, float]] = {}
+
+    def _bucket(self, token: Optional[str], resource: str) -> Dict[str, float]:
+        key = (token, resource)
+        if key not in self._state:
+            self._state[key] = {"remaining": -1, "limit": -1, "reset_at": 0.0, "blocked_until": 0.0, "next_slot": 0.0}
+        return self._state[key]
+
+    def _interval(self, bucket: Dict[str, float], now: float) -> float:
+        if bucket["remaining"] < 0 or bucket["limit"] <= 0: return MIN_REQUEST_INTERVAL_SECONDS # Budget not known yet
+        if bucket["remaining"] > bucket["limit"] * RATE_LIMIT_PACING_FRACTION: return MIN_REQUEST_INTERVAL_SECONDS
+        time_to_reset = max(0.0, bucket["reset_at"] - now)
+        return max(MIN_REQUEST_INTERVAL_SECONDS, time_to_reset / max(1, bucket["remaining"]))
+
+    def _ready_at(self, bucket: Dict[str, float], now: float) -> float:
+        ready_at = max(now, bucket["next_slot"], bucket["blocked_until"])
+        if bucket["remaining"] == 0 and bucket["reset_at"] > now:
+            ready_at = max(ready_at, bucket["reset_at"] + 1)
+        return ready_at
+
+    def acquire(self, token: Optional[str], resource: str = "core") -> Optional[str]:
+        """
+        Picks the token to use for the next request and blocks until that token may be used.
+        When there is a pool, whichever pool token is ready soonest is used, whatever token was asked for;
+        without one, the given token is used as is.
+        """
+        with self._lock:
+            now = time.time()
+            candidates = self.tokens or [token]
+            chosen = min(
+                candidates,
+                key=lambda t: (self._ready_at(self._bucket(t, resource), now), -self._bucket(t, resource)["remaining"])
+            )
+            bucket = self._bucket(chosen, resource)
+            ready_at = self._ready_at(bucket, now)
+            bucket["next_slot"] = ready_at + self._interval(bucket, now)
+            if bucket["remaining"] > 0: bucket["remaining"] -= 1
+        wait_time = ready_at - time.time()
+        if wait_time > 1:
+            print(f"  Rate limit pacing: waiting {wait_time:.1f}s for token {mask_token(chosen)} ({resource})...")
+        if wait_time > 0:
+            FETCH_METRICS.record_rate_limit_wait(chosen, resource, wait_time)
+            time.sleep(wait_time)
+        return chosen
+
+    def record_response(self, token: Optional[str], resource: str, response: requests.Response) -> bool:
+        """
+        Updates the token's budget from the rate-limit headers. Returns True if the response was
+        rejected by a primary or secondary rate limit, in which case the token is blocked until it may retry.
+        """
+        headers = response.headers
+        with self._lock:
+            bucket = self._bucket(token, resource)
+            now = time.time()
+            try:
+                if 'X-RateLimit-Remaining' in headers: bucket["remaining"] = int(headers['X-RateLimit-Remaining'])
+                if 'X-RateLimit-Limit' in headers: bucket["limit"] = int(headers['X-RateLimit-Limit'])
+                if 'X-RateLimit-Reset' in headers: bucket["reset_at"] = float(headers['X-RateLimit-Reset'])
+            except ValueError:
+                pass
+            if 'X-RateLimit-Remaining' in headers:
+                FETCH_METRICS.record_quota(token, resource, int(bucket["remaining"]), int(bucket["limit"]))
+            if response.status_code not in (403, 429): return False
+
+            retry_after = headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + int(retry_after))
+            elif bucket["remaining"] == 0:
+                bucket["blocked_until"] = max(bucket["blocked_until"], (bucket["reset_at"] or now + 60) + 5)
+            elif response.status_code == 429 or 'secondary rate limit' in response.text.lower():
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + SECONDARY_RATE_LIMIT_WAIT_SECONDS)
+            else:
+                return False # A plain 403 (permissions), not a rate limit
+            return True
+
+RATE_LIMITER = RateLimitScheduler(GITHUB_TOKENS)
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry (0-based)."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+class DeadLetterQueue:
+    """
+    Appends requests that still failed after their retries to a JSONL file, so a later
+    `fetch.py --replay-dead-letters` can retry just those instead of re-crawling everything. Thread-safe.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, url: str, params: Optional[Dict], accept_header: str, json_body: Optional[Dict], reason: str) -> None:
+        if not self.path: return
+        entry = {
+            "url": url, "params": params or None, "accept": accept_header, "json_body": json_body,
+            "endpoint": endpoint_type(url), "reason": reason,
+            "failed_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+                self.count += 1
+            except IOError as e:
+                print(f"  Warning: Could not record dead letter for {url}: {e}")
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Returns the recorded entries, oldest first, with repeats of the same request dropped."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not self.path or not os.path.exists(self.path): return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # A line cut short by a crash
+                key = json.dumps([entry.get("url"), entry.get("params"), entry.get("accept"), entry.get("json_body")], sort_keys=True)
+                entries.setdefault(key, entry)
+        return list(entries.values())
+
+DEAD_LETTERS = DeadLetterQueue(DEAD_LETTER_FILE)
+
+def use_dead_letter_file(path: str) -> None:
+    """Records (and replays) dead letters in `path` instead of DEAD_LETTER_FILE, for callers that keep their own."""
+    global DEAD_LETTER_FILE, DEAD_LETTERS
+    DEAD_LETTER_FILE = path
+    DEAD_LETTERS = DeadLetterQueue(path)
+
 def make_github_request(
     url: str,
     token: Optional[str],
     params: Optional[Dict] = None,
-    accept_header: str = "application/vnd.github+json" # Default media type
+    accept_header: str = "application/vnd.github+json", # Default media type
+    json_body: Optional[Dict] = None,
+    dead_letter: bool = True
 ) -> Optional[requests.Response]:
-    """Makes a request to the GitHub API with headers and error handling."""
+    """
+    Makes a request to the GitHub API with headers and error handling. Sends a POST when json_body is given (GraphQL).
+    5xx responses and network errors are retried up to TRANSIENT_RETRIES times with jittered exponential backoff.
+    If the request still fails (or stays rate limited), it is recorded in DEAD_LETTERS unless `dead_letter` is False,
+    for callers that have their own fallback.
+    """
     headers = {
         "Accept": accept_header, # Use the provided accept header
         "X-GitHub-Api-Version": GITHUB_API_VERSION,
     }
-    if token: headers["Authorization"] = f"Bearer {token}"
-    retries = 2
-    while retries >= 0:
+    resource = "graphql" if urlparse(url).path.rstrip('/').endswith('/graphql') else "core"
+    endpoint = endpoint_type(url)
+
+    cache_path = response_cache_path(url, params, accept_header, token) if json_body is None else None
+    cached_entry = load_cached_response(cache_path)
+    if cached_entry:
+        if IMMUTABLE_URL_PATTERN.search(urlparse(url).path):
+            FETCH_METRICS.record_cache_hit(endpoint)
+            return response_from_cache(cached_entry)
+        cached_headers = cached_entry.get("headers", {})
+        if cached_headers.get("ETag"): headers["If-None-Match"] = cached_headers["ETag"]
+        if cached_headers.get("Last-Modified"): headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+
+    rate_limit_retries = 2
+    attempt = 0 # Transient failures retried so far
+    def give_up(reason: str) -> None:
+        if dead_letter: DEAD_LETTERS.record(url, params, accept_header, json_body, reason)
+
+    while True:
+        request_token = RATE_LIMITER.acquire(token, resource)
+        headers.pop("Authorization", None)
+        if request_token: headers["Authorization"] = f"Bearer {request_token}"
+        request_started = time.perf_counter()
+        response = None
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=60)
-            if response.status_code == 403 and 'X-RateLimit-Remaining' in response.headers and int(response.headers['X-RateLimit-Remaining']) == 0:
-                if retries > 0:
-                    reset_time = int(response.headers.get('X-RateLimit-Reset', time.time() + 60))
-                    wait_time = max(0, reset_time - time.time()) + 5
-                    print(f"Rate limit hit requesting {url}. Waiting for {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                    retries -= 1
+            if json_body is None:
+                response = get_http_session().get(url, headers=headers, params=params, timeout=60)
+            else:
+                response = get_http_session().post(url, headers=headers, params=params, json=json_body, timeout=60)
+            FETCH_METRICS.record_request(endpoint, response.status_code, time.perf_counter() - request_started, len(response.content))
+            rate_limited = RATE_LIMITER.record_response(request_token, resource, response)
+            if response.status_code == 304 and cached_entry:
+                return response_from_cache(cached_entry)
+            if rate_limited:
+                if rate_limit_retries > 0:
+                    # The scheduler blocks this token until it may retry; another pool token may be used meanwhile
+                    print(f"Rate limit hit requesting {url} with token {mask_token(request_token)} (status {response.status_code}). Backing off...")
+                    FETCH_METRICS.record_retry(endpoint, "rate_limit")
+                    rate_limit_retries -= 1
                     continue
                 else:
                     print(f"Rate limit hit, and no retries left for {url}.")
+                    give_up("rate_limit")
                     response.raise_for_status() # Raise here to signal failure after retries
+            if response.status_code >= 500 and attempt < TRANSIENT_RETRIES:
+                delay = backoff_delay(attempt)
+                attempt += 1
+                print(f"Server Error ({response.status_code}) for URL: {url}. Retrying in {delay:.1f}s ({attempt}/{TRANSIENT_RETRIES})...")
+                FETCH_METRICS.record_retry(endpoint, "server_error")
+                time.sleep(delay)
+                continue
             response.raise_for_status()
+            store_cached_response(cache_path, response)
             return response
         except requests.exceptions.HTTPError as e:
             if response is not None:
@@ -79,84 +600,240 @@ def make_github_request(
                 elif status_code == 204: print(f"Info: No content (204) for URL: {url}"); return response
                 elif status_code == 409: print(f"Info: Conflict (409) for URL: {url}. Repo might be empty."); return None
                 elif status_code == 422: print(f"Error: Unprocessable Entity (422) for URL: {url}. Invalid input?"); return None
-                elif status_code >= 500: print(f"Server Error ({status_code}) for URL: {url}. Retrying might help later."); return None
+                elif status_code >= 500:
+                    print(f"Server Error ({status_code}) for URL: {url} persisted after {TRANSIENT_RETRIES} retries.")
+                    give_up(f"server_error_{status_code}")
+                    return None
                 else: print(f"HTTP Error fetching {url}: {e} (Status code: {status_code})")
             else: print(f"HTTP Error occurred before response object was created for {url}: {e}")
             return None
         except requests.exceptions.RequestException as e:
             print(f"Network Error fetching {url}: {e}")
-            if retries > 0:
-                print("Retrying after network error...")
-                time.sleep(5) # Wait before retrying network errors
-                retries -= 1
+            FETCH_METRICS.record_request(endpoint, None, time.perf_counter() - request_started)
+            if attempt < TRANSIENT_RETRIES:
+                delay = backoff_delay(attempt)
+                attempt += 1
+                print(f"Retrying after network error in {delay:.1f}s ({attempt}/{TRANSIENT_RETRIES})...")
+                FETCH_METRICS.record_retry(endpoint, "network_error")
+                time.sleep(delay)
                 continue
             else:
                 print("Network error persisted after retries.")
+                give_up("network_error")
                 return None
         except Exception as e:
             print(f"An unexpected error occurred during request to {url}: {e}")
             return None
-    return None
-
-def fetch_paginated_data(url: str, token: Optional[str], params: Optional[Dict] = None) -> Optional[List[Dict[str, Any]]]:
-    """Fetches paginated data from a GitHub API endpoint."""
-    all_data = []
-    page = 1
-    current_url = url
-    request_params = params.copy() if params else {}
-    request_params['page'] = page
 
-    while current_url:
-        print(f"  Fetching page {page} from {current_url.split('?')[0]}...")
-        response = make_github_request(current_url, token, request_params)
-        request_params = None
+def page_url(url: str, page: int) -> str:
+    """Returns `url` with its `page` query parameter set to `page`."""
+    parsed = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k != 'page']
+    query.append(('page', str(page)))
+    return urlunparse(parsed._replace(query=urlencode(query)))
 
-        if response is None: return None
-        if response.status_code == 204: break
+def parse_page_items(response: requests.Response, url: str) -> Optional[List[Dict[str, Any]]]:
+    """Returns the items on one page of results, [] when pagination should stop, or None if the page is an error."""
+    if response.status_code == 204: return []
+    try:
+        if not response.content:
+            print(f"  Warning: Received empty response body from {url}.")
+            return []
+        page_data = response.json()
+        if not isinstance(page_data, list):
+             print(f"  Warning: Expected a list but received type {type(page_data)} from {url}. Content: {response.text[:100]}...")
+             if isinstance(page_data, dict) and ('message' in page_data or 'errors' in page_data):
+                  print(f"  Error message detected, stopping pagination.")
+                  return None
+             return []
+        FETCH_METRICS.record_page(endpoint_type(url), len(page_data))
+        return page_data
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from {url}: {e}. Response text: {response.text[:200]}")
+        return None
 
+def iter_paginated_pages(url: str, token: Optional[str], params: Optional[Dict] = None) -> Iterator[Optional[List[Dict[str, Any]]]]:
+    """
+    Lazily fetches a paginated GitHub API endpoint, yielding each page's items in order, or None (and stopping)
+    when a page fails. Once the first page reveals the `last` page, up to MAX_CONCURRENT_PAGE_REQUESTS pages
+    are fetched ahead of the consumer; pages the consumer never asks for are never requested.
+    Endpoints without a `last` link are followed one `next` link at a time.
+    """
+    request_params = params.copy() if params else {}
+    request_params['page'] = 1
+
+    print(f"  Fetching page 1 from {url.split('?')[0]}...")
+    response = make_github_request(url, token, request_params)
+    if response is None:
+        yield None
+        return
+    page_items = parse_page_items(response, url)
+    yield page_items
+    if not page_items: return
+
+    if 'next' in response.links and 'last' in response.links:
+        last_url = response.links['last']['url']
         try:
-            if not response.content:
-                print(f"  Warning: Received empty response body from {current_url}.")
-                break
-            page_data = response.json()
-            if not isinstance(page_data, list):
-                 print(f"  Warning: Expected a list but received type {type(page_data)} from {current_url}. Content: {response.text[:100]}...")
-                 if isinstance(page_data, dict) and ('message' in page_data or 'errors' in page_data):
-                      print(f"  Error message detected, stopping pagination.")
-                      return None if not all_data else all_data
-                 break
-            if not page_data: break
-            all_data.extend(page_data)
-            if 'next' in response.links:
-                 current_url = response.links['next']['url']
-                 page += 1
-                 time.sleep(0.3)
-            else:
-                 current_url = None
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from {current_url or url}: {e}. Response text: {response.text[:200]}")
-            return all_data if all_data else None
-        except Exception as e:
-             print(f"Error processing page {page} from {current_url or url}: {e}")
-             return all_data if all_data else None
+            last_page = int(dict(parse_qsl(urlparse(last_url).query)).get('page', 1))
+        except ValueError:
+            last_page = 1
+        remaining_urls = iter([page_url(last_url, page) for page in range(2, last_page + 1)])
+        workers = max(1, min(MAX_CONCURRENT_PAGE_REQUESTS, last_page - 1))
+        print(f"  Fetching pages 2-{last_page} from {url.split('?')[0]} as needed ({workers} ahead)...")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='PageWorker')
+        try:
+            in_flight = collections.deque(
+                (u, executor.submit(make_github_request, u, token)) for u in itertools.islice(remaining_urls, workers)
+            )
+            while in_flight:
+                current_url, future = in_flight.popleft()
+                page_response = future.result()
+                next_url = next(remaining_urls, None)
+                if next_url: in_flight.append((next_url, executor.submit(make_github_request, next_url, token)))
+                page_items = parse_page_items(page_response, current_url) if page_response is not None else None
+                yield page_items
+                if not page_items: return
+        finally:
+            # The consumer may stop early; don't start pages it will never read
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        page = 1
+        while 'next' in response.links:
+            current_url = response.links['next']['url']
+            page += 1
+            print(f"  Fetching page {page} from {current_url.split('?')[0]}...")
+            response = make_github_request(current_url, token)
+            page_items = parse_page_items(response, current_url) if response is not None else None
+            yield page_items
+            if not page_items: return
+
+def iter_paginated_data(url: str, token: Optional[str], params: Optional[Dict] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily yields the items of a paginated endpoint, fetching pages only as they are consumed. Stops at the first failed page."""
+    for page_items in iter_paginated_pages(url, token, params):
+        if page_items is None: return
+        yield from page_items
+
+class PaginatedListing:
+    """
+    Lazily yields the items of a paginated endpoint, like iter_paginated_data, and records in `complete`
+    whether the last page was read. A consumer that stops early, or a failed page, leaves it False.
+    """
+    def __init__(self, url: str, token: Optional[str], params: Optional[Dict] = None):
+        self.pages = iter_paginated_pages(url, token, params)
+        self.complete = False
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for page_items in self.pages:
+            if page_items is None: return
+            yield from page_items
+        self.complete = True
+
+def fetch_paginated_data(url: str, token: Optional[str], params: Optional[Dict] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetches all pages of a paginated GitHub API endpoint. Returns None if the first page fails,
+    or the items fetched so far if a later page does.
+    """
+    all_data: List[Dict[str, Any]] = []
+    for page_number, page_items in enumerate(iter_paginated_pages(url, token, params), start=1):
+        if page_items is None: return all_data if page_number > 1 and all_data else None
+        all_data.extend(page_items)
     print(f"  Finished fetching paginated data, total items: {len(all_data)}")
     return all_data
 
 # --- Functions to Fetch Data (Keep the existing fetch_contributors_from_repo, fetch_repository_issues_list, fetch_issue_details, fetch_repository_commits, fetch_commit_details) ---
 # (Include the full code for these functions here from the previous version)
+def fetch_org_repositories(org: str, token: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Lists an organisation's repositories, leaving out forks, archived and empty repositories unless configured otherwise."""
+    repos_url = f"{API_BASE_URL}/orgs/{org}/repos"
+    print(f"Listing repositories of the {org} organisation...")
+    repos = fetch_paginated_data(repos_url, token, {"type": "all", "per_page": 100})
+    if repos is None: return None
+    return [
+        r for r in repos
+        if r.get('html_url') and r.get('size', 0) > 0
+        and (ORG_INCLUDE_FORKS or not r.get('fork'))
+        and (ORG_INCLUDE_ARCHIVED or not r.get('archived'))
+    ]
+
+def prioritise_repositories(repos: List[Dict[str, Any]]) -> List[str]:
+    """
+    Orders repositories for crawling: most recently pushed first, by day, and larger first among those pushed
+    on the same day (exact push times hardly ever tie). process_repositories starts repositories in this order,
+    so the most active ones finish first.
+    """
+    return [
+        r['html_url'] for r in sorted(
+            repos, key=lambda r: ((r.get('pushed_at') or '')[:len('YYYY-MM-DD')], r.get('size') or 0), reverse=True
+        )
+    ]
+
 def fetch_contributors_from_repo(owner: str, repo: str, token: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
     """Fetches the list of contributors for a specific repository."""
     contributors_url = f"{API_BASE_URL}/repos/{owner}/{repo}/contributors"
     print(f"Fetching contributors for {owner}/{repo}...")
     return fetch_paginated_data(contributors_url, token, {"per_page": 100, "anon": "false"})
 
-def fetch_repository_issues_list(owner: str, repo: str, token: Optional[str] = None, state: str = "closed") -> Optional[List[Dict[str, Any]]]:
-    """Fetches a list of issue summaries for a specific repository, filtering by state."""
+def fetch_contributor_stats(owner: str, repo: str, token: Optional[str] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Fetches weekly activity for every author from /stats/contributors, waiting out 202 responses while GitHub
+    computes it. Returns {login: {"author": user object, "weekly_activity": [...]}}, where each week with any
+    activity is {"week": "YYYY-MM-DD" (its Sunday), "commits", "additions", "deletions"}; quiet weeks are left out.
+    GitHub only reports the top 100 authors, and reports 0 additions/deletions for repositories with 10,000+ commits.
+    Returns None if the statistics are unavailable.
+    """
+    stats_url = f"{API_BASE_URL}/repos/{owner}/{repo}/stats/contributors"
+    print(f"Fetching contributor statistics for {owner}/{repo}...")
+    for attempt in range(CONTRIBUTOR_STATS_RETRIES + 1):
+        response = make_github_request(stats_url, token)
+        if response is None: return None
+        if response.status_code != 202: break
+        if attempt < CONTRIBUTOR_STATS_RETRIES:
+            print(f"  GitHub is still computing statistics for {owner}/{repo}; asking again in {CONTRIBUTOR_STATS_RETRY_SECONDS:.1f}s...")
+            time.sleep(CONTRIBUTOR_STATS_RETRY_SECONDS)
+    else:
+        print(f"  Warning: Contributor statistics for {owner}/{repo} were still being computed after {CONTRIBUTOR_STATS_RETRIES} retries.")
+        return None
+    if response.status_code == 204 or not response.content: return {} # Empty repository
+    try:
+        stats = response.json()
+    except json.JSONDecodeError as e:
+        print(f"  Error decoding contributor statistics for {owner}/{repo}: {e}")
+        return None
+    if not isinstance(stats, list): return None
+
+    stats_by_user: Dict[str, Dict[str, Any]] = {}
+    for entry in stats:
+        author = entry.get('author') or {}
+        if not author.get('login'): continue
+        stats_by_user[author['login']] = {
+            "author": author,
+            "weekly_activity": [
+                {
+                    "week": datetime.fromtimestamp(week['w'], tz=timezone.utc).date().isoformat(),
+                    "commits": week.get('c', 0), "additions": week.get('a', 0), "deletions": week.get('d', 0),
+                }
+                for week in entry.get('weeks', []) if week.get('w') is not None and (week.get('c') or week.get('a') or week.get('d'))
+            ],
+        }
+    return stats_by_user
+
+def issues_list_request(owner: str, repo: str, state: str, since: Optional[str]) -> Tuple[str, Dict[str, Any]]:
     issues_url = f"{API_BASE_URL}/repos/{owner}/{repo}/issues"
     params = {"state": state, "per_page": 100}
-    print(f"Fetching '{state}' issue summaries for {owner}/{repo}...")
+    if since: params["since"] = since
+    print(f"Fetching '{state}' issue summaries for {owner}/{repo}{f' updated since {since}' if since else ''}...")
+    return issues_url, params
+
+def fetch_repository_issues_list(owner: str, repo: str, token: Optional[str] = None, state: str = "closed", since: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Fetches a list of issue summaries for a specific repository, filtering by state (and optionally by `updated_at >= since`)."""
+    issues_url, params = issues_list_request(owner, repo, state, since)
     return fetch_paginated_data(issues_url, token, params)
 
+def iter_repository_issues(owner: str, repo: str, token: Optional[str] = None, state: str = "closed", since: Optional[str] = None) -> PaginatedListing:
+    """Like fetch_repository_issues_list, but yields summaries lazily, fetching pages only as they are consumed."""
+    issues_url, params = issues_list_request(owner, repo, state, since)
+    return PaginatedListing(issues_url, token, params)
+
 def fetch_issue_details(owner: str, repo: str, issue_number: int, token: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """Fetches detailed information for a single issue, requesting raw body."""
     issue_url = f"{API_BASE_URL}/repos/{owner}/{repo}/issues/{issue_number}"
@@ -164,31 +841,126 @@ def fetch_issue_details(owner: str, repo: str, issue_number: int, token: Optiona
     response = make_github_request(issue_url, token, accept_header=accept_header)
     if response and response.status_code == 200:
         try:
-            details = response.json()
-            time.sleep(0.5)
-            return details
+            return response.json()
         except json.JSONDecodeError as e:
             print(f"    Error decoding JSON for issue details #{issue_number}: {e}")
             return None
     else:
         return None
 
-def fetch_repository_commits(owner: str, repo: str, token: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
-    """Fetches commit summaries for a specific repository."""
+ISSUES_GRAPHQL_QUERY = """
+query($owner: String!, $name: String!, $pageSize: Int!, $cursor: String, $since: DateTime) {
+  repository(owner: $owner, name: $name) {
+    issues(first: $pageSize, after: $cursor, states: CLOSED,
+           orderBy: {field: CREATED_AT, direction: DESC}, filterBy: {since: $since}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        databaseId number title body url updatedAt stateReason
+        comments { totalCount }
+        labels(first: 50) { nodes { id name color description isDefault } }
+        assignees(first: 20) { nodes { login databaseId url avatarUrl } }
+      }
+    }
+  }
+}
+"""
+
+def graphql_issue_to_rest(node: Dict[str, Any], owner: str, repo: str) -> Dict[str, Any]:
+    """Converts a GraphQL issue node into the shape of the REST issue details used by process_repositories."""
+    assignees = [
+        {"login": a.get("login"), "id": a.get("databaseId"), "html_url": a.get("url"), "avatar_url": a.get("avatarUrl"), "type": "User"}
+        for a in (node.get("assignees") or {}).get("nodes", []) if a
+    ]
+    labels = [
+        {
+            "node_id": label.get("id"),
+            "url": f"{API_BASE_URL}/repos/{owner}/{repo}/labels/{quote(label.get('name') or '')}",
+            "name": label.get("name"),
+            "color": label.get("color"),
+            "default": label.get("isDefault"),
+            "description": label.get("description"),
+        }
+        for label in (node.get("labels") or {}).get("nodes", []) if label
+    ]
+    return {
+        "id": node.get("databaseId"),
+        "number": node.get("number"),
+        "html_url": node.get("url"),
+        "title": node.get("title"),
+        "body": node.get("body"),
+        "labels": labels,
+        "comments": (node.get("comments") or {}).get("totalCount", 0),
+        "state": "closed",
+        "state_reason": node["stateReason"].lower() if node.get("stateReason") else None,
+        "updated_at": node.get("updatedAt"),
+        "assignees": assignees,
+        "assignee": assignees[0] if assignees else None,
+    }
+
+def fetch_repository_issues_graphql(
+    owner: str, repo: str, token: str, since: Optional[str] = None, limit: Optional[int] = None,
+    listing: Optional[Dict[str, bool]] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetches closed issues with bodies, labels, comment counts and assignees through the GraphQL API,
+    up to `limit` issues (newest first). Returns REST-shaped issue details, or None if the first page fails.
+    If `listing` is given, listing["complete"] is set when every matching issue was returned.
+    """
+    print(f"Fetching closed issues with details via GraphQL for {owner}/{repo}{f' updated since {since}' if since else ''}...")
+    graphql_url = f"{API_BASE_URL}/graphql"
+    all_issues: List[Dict[str, Any]] = []
+    cursor = None
+    page = 1
+    while limit is None or len(all_issues) < limit:
+        page_size = GRAPHQL_ISSUES_PAGE_SIZE if limit is None else min(GRAPHQL_ISSUES_PAGE_SIZE, limit - len(all_issues))
+        variables = {"owner": owner, "name": repo, "pageSize": page_size, "cursor": cursor, "since": since}
+        print(f"  Fetching GraphQL issues page {page}...")
+        response = make_github_request(graphql_url, token, json_body={"query": ISSUES_GRAPHQL_QUERY, "variables": variables})
+        if response is None: return all_issues if all_issues else None
+        try:
+            payload = response.json()
+        except json.JSONDecodeError as e:
+            print(f"  Error decoding GraphQL response for {owner}/{repo}: {e}")
+            return all_issues if all_issues else None
+        if payload.get("errors"):
+            print(f"  GraphQL errors for {owner}/{repo}: {[err.get('message') for err in payload['errors']]}")
+            return all_issues if all_issues else None
+        issues_connection = ((payload.get("data") or {}).get("repository") or {}).get("issues")
+        if not issues_connection: break
+        all_issues.extend(graphql_issue_to_rest(node, owner, repo) for node in issues_connection.get("nodes", []) if node)
+        page_info = issues_connection.get("pageInfo") or {}
+        if not page_info.get("hasNextPage"):
+            if listing is not None: listing["complete"] = True
+            break
+        cursor = page_info.get("endCursor")
+        page += 1
+    print(f"  Finished fetching GraphQL issues, total items: {len(all_issues)}")
+    return all_issues
+
+def commits_list_request(owner: str, repo: str, since: Optional[str]) -> Tuple[str, Dict[str, Any]]:
     commits_url = f"{API_BASE_URL}/repos/{owner}/{repo}/commits"
     params = {"per_page": 100}
-    print(f"Fetching commit summaries for {owner}/{repo}...")
+    if since: params["since"] = since
+    print(f"Fetching commit summaries for {owner}/{repo}{f' since {since}' if since else ''}...")
+    return commits_url, params
+
+def fetch_repository_commits(owner: str, repo: str, token: Optional[str] = None, since: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Fetches commit summaries for a specific repository (optionally only commits dated at or after `since`)."""
+    commits_url, params = commits_list_request(owner, repo, since)
     return fetch_paginated_data(commits_url, token, params)
 
+def iter_repository_commits(owner: str, repo: str, token: Optional[str] = None, since: Optional[str] = None) -> PaginatedListing:
+    """Like fetch_repository_commits, but yields summaries lazily, fetching pages only as they are consumed."""
+    commits_url, params = commits_list_request(owner, repo, since)
+    return PaginatedListing(commits_url, token, params)
+
 def fetch_commit_details(owner: str, repo: str, commit_sha: str, token: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """Fetches detailed information for a single commit."""
     commit_url = f"{API_BASE_URL}/repos/{owner}/{repo}/commits/{commit_sha}"
     response = make_github_request(commit_url, token)
     if response and response.status_code == 200:
         try:
-            details = response.json()
-            time.sleep(0.5)
-            return details
+            return response.json()
         except json.JSONDecodeError as e:
             print(f"    Error decoding JSON for commit details {commit_sha}: {e}")
             return None
@@ -196,260 +968,1486 @@ def fetch_commit_details(owner: str, repo: str, commit_sha: str, token: Optional
         return None
 
 
-# --- MODIFIED FUNCTION ---
-def process_repositories(repo_urls: List[str], token: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+# --- Local Git Mirror Ingestion ---
+GIT_LOG_RECORD_START = "\x1e"
+GIT_LOG_FORMAT = "%x1e%H%x00%P%x00%an%x00%ae%x00%aI%x00%cI%x00%B%x00"
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+NOREPLY_EMAIL_PATTERN = re.compile(r'^(?:(\d+)\+)?([A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)@users\.noreply\.github\.com$', re.IGNORECASE)
+
+def run_git(args: List[str], timeout: Optional[int] = 3600) -> bool:
+    """Runs a git command, returning True on success."""
+    try:
+        result = subprocess.run(["git"] + args, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"  Error running git {' '.join(args[:3])}...: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"  git {' '.join(args[:3])}... failed: {result.stderr.strip()[:300]}")
+        return False
+    return True
+
+def ensure_git_mirror(owner: str, repo: str) -> Optional[str]:
+    """Returns the path of the repository's bare mirror under GIT_MIRROR_DIR, cloning or updating it unless offline."""
+    mirror_path = os.path.join(GIT_MIRROR_DIR, owner, f"{repo}.git")
+    if os.path.isdir(mirror_path):
+        if not GIT_MIRROR_OFFLINE:
+            print(f"Updating git mirror {mirror_path}...")
+            if not run_git(["-C", mirror_path, "remote", "update", "--prune"]):
+                print(f"  Warning: Could not update {mirror_path}. Using it as it is.")
+        return mirror_path
+    if GIT_MIRROR_OFFLINE:
+        print(f"Warning: No git mirror at {mirror_path} and offline mode is on. Falling back to the API for commits.")
+        return None
+    print(f"Cloning git mirror of {owner}/{repo} into {mirror_path}...")
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    if not run_git(["clone", "--mirror", "--quiet", f"https://github.com/{owner}/{repo}.git", mirror_path]):
+        shutil.rmtree(mirror_path, ignore_errors=True)
+        return None
+    return mirror_path
+
+def split_diff_header_paths(header: str) -> Tuple[str, str]:
+    """Splits the paths out of a 'diff --git a/X b/Y' line."""
+    paths = header[len("diff --git "):]
+    if paths.startswith("a/") and " b/" in paths:
+        old_path, new_path = paths[2:].split(" b/", 1)
+        return old_path, new_path
+    return paths, paths
+
+def parse_unified_diff(diff_lines: List[str]) -> List[Dict[str, Any]]:
     """
-    Fetches contributors, their assigned closed issues (with specific details up to a limit),
-    and detailed commit info (up to a limit per repo, excluding stats) for multiple repositories.
-    Merges the data. Returns a dictionary of unique contributors keyed by username.
+    Parses `git diff`/`git log -p`/patch-series output into file entries shaped like the `files` of the GitHub
+    commit API: filename, status, previous_filename (renames), additions, deletions and patch (hunks only, as
+    the API returns them).
+    Hunks are read by their line counts, so trailers after the last hunk (e.g. a patch signature) are ignored.
+    """
+    files: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    patch_lines: List[str] = []
+    old_remaining = new_remaining = 0
+
+    def finish_file():
+        if current is None: return
+        if patch_lines: current["patch"] = "\n".join(patch_lines)
+        files.append(current)
+
+    for line in diff_lines:
+        if line.startswith("diff --git "):
+            finish_file()
+            old_path, new_path = split_diff_header_paths(line)
+            current = {"filename": new_path, "status": "modified", "additions": 0, "deletions": 0}
+            if old_path != new_path: current["previous_filename"] = old_path
+            patch_lines = []
+            old_remaining = new_remaining = 0
+            continue
+        if current is None: continue
+        if old_remaining > 0 or new_remaining > 0:
+            patch_lines.append(line)
+            if line.startswith("-"):
+                old_remaining -= 1
+                current["deletions"] += 1
+            elif line.startswith("+"):
+                new_remaining -= 1
+                current["additions"] += 1
+            elif not line.startswith("\\"):
+                old_remaining -= 1
+                new_remaining -= 1
+        elif line.startswith("@@"):
+            hunk = HUNK_HEADER_PATTERN.match(line)
+            if not hunk: continue
+            patch_lines.append(line)
+            old_remaining = int(hunk.group(1)) if hunk.group(1) is not None else 1
+            new_remaining = int(hunk.group(2)) if hunk.group(2) is not None else 1
+        elif patch_lines:
+            if line.startswith("\\"): patch_lines.append(line) # "\ No newline at end of file" after the last hunk line
+        elif line.startswith("new file mode"):
+            current["status"] = "added"
+        elif line.startswith("deleted file mode"):
+            current["status"] = "removed"
+        elif line.startswith("rename from "):
+            current["status"] = "renamed"
+            current["previous_filename"] = line[len("rename from "):]
+        elif line.startswith("rename to "):
+            current["filename"] = line[len("rename to "):]
+        elif line.startswith("copy from "):
+            current["status"] = "copied"
+            current["previous_filename"] = line[len("copy from "):]
+        elif line.startswith("copy to "):
+            current["filename"] = line[len("copy to "):]
+        elif line.startswith("+++ ") and line[4:] != "/dev/null":
+            current["filename"] = line[6:] if line.startswith("+++ b/") else line[4:]
+    finish_file()
+    for f in files:
+        if f.get("status") != "renamed" and f.get("status") != "copied": f.pop("previous_filename", None)
+    return files
+
+def resolve_author_from_email(name: str, email: str) -> Optional[Dict[str, Any]]:
+    """Builds an API-style author object from a GitHub noreply email, or returns None if it isn't one."""
+    match = NOREPLY_EMAIL_PATTERN.match(email or "")
+    if not match: return None
+    user_id, login = match.group(1), match.group(2)
+    return {
+        "login": login,
+        "id": int(user_id) if user_id else None,
+        "html_url": f"https://github.com/{login}",
+        "avatar_url": f"https://avatars.githubusercontent.com/u/{user_id}?v=4" if user_id else f"https://github.com/{login}.png",
+        "type": "User",
+    }
+
+def iter_git_log_records(mirror_path: str, revision_args: List[str]):
+    """Streams (header fields, diff lines) for every commit printed by `git log -p` on the mirror."""
+    command = [
+        "git", "-c", "core.quotePath=false", "-C", mirror_path, "log", f"--format={GIT_LOG_FORMAT}",
+        "-p", "-M", "--diff-merges=first-parent", "--no-color", "--no-ext-diff",
+    ] + revision_args
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    record: List[str] = []
+    for line in process.stdout:
+        line = line.rstrip("\n")
+        if line.startswith(GIT_LOG_RECORD_START) and record:
+            yield parse_git_log_record(record)
+            record = []
+        record.append(line)
+    if record:
+        yield parse_git_log_record(record)
+    process.stdout.close()
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(f"git log failed for {mirror_path}: {stderr.strip()[:300]}")
+
+def parse_git_log_record(record_lines: List[str]) -> Tuple[List[str], List[str]]:
+    """Splits one commit's `git log` output into its NUL-separated header fields and its diff lines."""
+    text = "\n".join(record_lines)[len(GIT_LOG_RECORD_START):]
+    fields = text.split("\x00", 7)
+    diff_text = fields[7] if len(fields) > 7 else ""
+    return fields[:7], diff_text.lstrip("\n").split("\n") if diff_text.strip() else []
+
+def resolve_mirror_authors(owner: str, repo: str, commit_by_email: Dict[str, str], token: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
     """
-    all_contributors_map: Dict[str, Dict[str, Any]] = {}
+    Finds the GitHub account behind each author email by fetching one commit of theirs from the API
+    (`commit_by_email` maps a lowercased email to one of its commit SHAs). Costs one request per distinct
+    author, not per commit, and commit details are immutable, so the response cache answers them on later runs.
+    Returns email -> API author object for the emails linked to an account.
+    """
+    emails = sorted(commit_by_email)
+    if not emails: return {}
+    print(f"  Resolving the GitHub accounts of {len(emails)} commit authors...")
+    def fetch_author(email: Hashable) -> Optional[Dict[str, Any]]:
+        details = fetch_commit_details(owner, repo, commit_by_email[email], token)
+        author = (details or {}).get('author')
+        return author if isinstance(author, dict) else None
+    return {
+        email: author for email, author in zip(emails, fetch_details_concurrently(fetch_author, emails)) if author
+    }
 
-    for repo_url in repo_urls:
-        print(f"\n--- Processing repository: {repo_url} ---")
+def fetch_commits_from_git_mirror(
+    owner: str,
+    repo: str,
+    mirror_path: str,
+    token: Optional[str] = None,
+    since_sha: Optional[str] = None,
+    since_date: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Reads the default branch history from a local mirror. Returns commit summaries and a sha -> details map,
+    both in the shape of the GitHub commits API, so process_repositories can use them unchanged.
+    Commit authors are resolved from GitHub noreply emails, and the other author emails through
+    resolve_mirror_authors (skipped with GIT_MIRROR_OFFLINE). Comment counts aren't in git, so they are left unset.
+    """
+    revision_args = ["HEAD"]
+    if since_sha and run_git(["-C", mirror_path, "cat-file", "-e", f"{since_sha}^{{commit}}"], timeout=60):
+        revision_args = [f"{since_sha}..HEAD"]
+    elif since_date:
+        revision_args = [f"--since={since_date}", "HEAD"]
+
+    print(f"Reading commits for {owner}/{repo} from git mirror {mirror_path}...")
+    commit_summaries: List[Dict[str, Any]] = []
+    commit_details: Dict[str, Dict[str, Any]] = {}
+    unresolved_emails: Dict[str, str] = {} # Lowercased email -> its newest commit
+    for (sha, parents, author_name, author_email, author_date, committer_date, message), diff_lines in iter_git_log_records(mirror_path, revision_args):
+        author = resolve_author_from_email(author_name, author_email)
+        if author is None and author_email:
+            unresolved_emails.setdefault(author_email.lower(), sha)
+        commit_obj = {
+            "message": message.rstrip("\n"),
+            "author": {"name": author_name, "email": author_email, "date": author_date},
+            "committer": {"date": committer_date},
+            "comment_count": None,
+        }
+        commit_summaries.append({
+            "sha": sha,
+            "html_url": f"https://github.com/{owner}/{repo}/commit/{sha}",
+            "author": author,
+            "commit": commit_obj,
+            "parents": [{"sha": parent} for parent in parents.split()],
+        })
+        commit_details[sha] = {"sha": sha, "commit": commit_obj, "files": parse_unified_diff(diff_lines)}
+    print(f"  Read {len(commit_summaries)} commits from the git mirror.")
+
+    if unresolved_emails and not GIT_MIRROR_OFFLINE:
+        email_authors = resolve_mirror_authors(owner, repo, unresolved_emails, token)
+        for summary in commit_summaries:
+            if summary["author"] is None:
+                summary["author"] = email_authors.get((summary["commit"]["author"]["email"] or "").lower())
+    return commit_summaries, commit_details
+
+
+# --- Compare-Endpoint Batching ---
+PATCH_SERIES_FROM_PATTERN = re.compile(r'^From ([0-9a-f]{40}) Mon Sep 17 00:00:00 2001$', re.MULTILINE)
+
+def split_patch_series(patch_text: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Splits a `git format-patch` series (the compare endpoint's patch format) into commit SHA -> API-style files."""
+    starts = list(PATCH_SERIES_FROM_PATTERN.finditer(patch_text))
+    files_by_sha: Dict[str, List[Dict[str, Any]]] = {}
+    for i, match in enumerate(starts):
+        section = patch_text[match.end():starts[i + 1].start() if i + 1 < len(starts) else len(patch_text)]
+        lines = section.split("\n")
+        # The diff follows the "---" line that ends the commit message, after the diffstat
+        separator = next((n for n, line in enumerate(lines) if line == "---"), 0)
+        files_by_sha[match.group(1)] = parse_unified_diff(lines[separator:])
+    return files_by_sha
+
+def find_linear_commit_runs(commit_summaries: List[Dict[str, Any]], shas: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Groups `shas` into runs of consecutive single-parent commits, each commit's parent being the next (older) one.
+    Returns (base SHA, run SHAs newest first) for every run of two or more commits, at most
+    COMPARE_MAX_COMMITS_PER_REQUEST long. Merges, root commits and isolated commits are left out.
+    """
+    parents = {
+        c.get('sha'): [p.get('sha') for p in c.get('parents', []) if p.get('sha')]
+        for c in commit_summaries if c.get('sha')
+    }
+    wanted = set(shas)
+    runs: List[Tuple[str, List[str]]] = []
+    current: List[str] = []
+
+    def finish_run():
+        if len(current) >= 2:
+            runs.append((parents[current[-1]][0], list(current)))
+        current.clear()
+
+    for sha in shas:
+        commit_parents = parents.get(sha, [])
+        if len(commit_parents) != 1:
+            finish_run()
+            continue
+        if current and (parents[current[-1]][0] != sha or len(current) >= COMPARE_MAX_COMMITS_PER_REQUEST):
+            finish_run()
+        current.append(sha)
+        if commit_parents[0] not in wanted: finish_run() # The parent is the run's base, not part of it
+    finish_run()
+    return runs
+
+def fetch_commit_range_files(owner: str, repo: str, base: str, head: str, token: Optional[str] = None) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Fetches the changes of every commit in base...head with one compare request. Returns SHA -> API-style files."""
+    compare_url = f"{API_BASE_URL}/repos/{owner}/{repo}/compare/{base}...{head}"
+    # Commits a failed compare misses are fetched one by one, so the failure isn't dead-lettered
+    response = make_github_request(compare_url, token, accept_header="application/vnd.github.patch", dead_letter=False)
+    if response is None or response.status_code != 200: return None
+    return split_patch_series(response.text)
+
+def fetch_commit_details_by_compare(
+    owner: str,
+    repo: str,
+    commit_summaries: List[Dict[str, Any]],
+    shas: List[str],
+    token: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetches details for runs of consecutive commits in `shas` with one compare request per run, shaped like
+    the commit detail API (`commit` comes from the summary, so comment counts are kept). Commits outside a run,
+    or missing from a compare response, are left for the per-commit endpoint.
+    """
+    runs = find_linear_commit_runs(commit_summaries, shas)
+    if not runs: return {}
+    summaries_by_sha = {c['sha']: c for c in commit_summaries if c.get('sha')}
+    print(f"  Fetching details for {sum(len(run) for _, run in runs)} commits in {len(runs)} compare requests...")
+    results = fetch_details_concurrently(lambda run: fetch_commit_range_files(owner, repo, run[0], run[1][0], token), runs)
+    details: Dict[str, Dict[str, Any]] = {}
+    for (base, run), files_by_sha in zip(runs, results):
+        if files_by_sha is None:
+            print(f"    Compare request {base[:7]}...{run[0][:7]} failed. Falling back to per-commit details.")
+            continue
+        for sha in run:
+            if sha in files_by_sha:
+                summary = summaries_by_sha[sha]
+                details[sha] = {"sha": sha, "commit": summary.get('commit', {}), "files": files_by_sha[sha]}
+    return details
+
+
+# --- Concurrent Detail Fetching ---
+def fetch_details_concurrently(
+    fetch_func: Callable[[Hashable], Optional[Dict[str, Any]]],
+    keys: List[Hashable],
+    max_workers: int = MAX_CONCURRENT_DETAIL_REQUESTS
+) -> List[Optional[Dict[str, Any]]]:
+    """Runs fetch_func for every key on a bounded thread pool. Results keep the order of keys."""
+    if not keys: return []
+    workers = max(1, min(max_workers, len(keys)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='DetailWorker') as executor:
+        return list(executor.map(fetch_func, keys))
+
+def fetch_details_up_to_limit(
+    fetch_func: Callable[[Hashable], Optional[Dict[str, Any]]],
+    keys: Iterable[Hashable],
+    limit: Optional[int],
+    label: str
+) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Fetches details for keys (in order) until `limit` fetches have succeeded, or all keys are used.
+    Failed fetches are topped up with the next keys, matching the old one-at-a-time behaviour.
+    `keys` may be a lazy iterator; only as many keys as needed are taken from it.
+    Returns a dict of key -> details for the successful fetches.
+    """
+    details: Dict[Hashable, Dict[str, Any]] = {}
+    key_iterator = iter(keys)
+    while limit is None or len(details) < limit:
+        batch = list(itertools.islice(key_iterator, None if limit is None else limit - len(details)))
+        if not batch: break
+        print(f"  Fetching details for {len(batch)} {label}s ({len(details)} fetched so far, up to {MAX_CONCURRENT_DETAIL_REQUESTS} in parallel)...")
+        for key, result in zip(batch, fetch_details_concurrently(fetch_func, batch)):
+            if result:
+                details[key] = result
+            else:
+                print(f"    Failed to fetch details for {label} {key} or it's not accessible/found.")
+    if limit is not None and len(details) >= limit:
+        print(f"  Reached {label} detail limit ({limit}). Skipping detail fetch for any remaining {label}s.")
+    return details
+
+
+# --- Incremental Crawl Watermarks ---
+def load_watermarks(path: str) -> Dict[str, Dict[str, Any]]:
+    """Loads per-repo watermarks keyed by canonical repository URL. Returns {} if the file is missing or invalid."""
+    if not path or not os.path.exists(path): return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            watermarks = json.load(f)
+        return watermarks if isinstance(watermarks, dict) else {}
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Warning: Could not read watermarks file '{path}': {e}. Doing a full crawl.")
+        return {}
+
+def save_watermarks(path: str, watermarks: Dict[str, Dict[str, Any]]) -> None:
+    """Writes per-repo watermarks to disk."""
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f, indent=2, ensure_ascii=False)
+        print(f"Saved watermarks for {len(watermarks)} repositories to {path}")
+    except IOError as e:
+        print(f"Error saving watermarks file '{path}': {e}")
+
+def update_watermark(
+    watermark: Dict[str, Any],
+    commits_list: Optional[List[Dict[str, Any]]],
+    issues_list: Optional[List[Dict[str, Any]]],
+    commits_complete: bool = True,
+    issues_complete: bool = True
+) -> Dict[str, Any]:
+    """
+    Advances a repo watermark past the newest commit and the latest issue update seen in this run.
+    A list that wasn't read to the end (stopped at a detail limit, or a page failed) leaves its part of the
+    watermark where it was, since the unread entries may be older than the ones read.
+    """
+    updated = dict(watermark)
+    if commits_list and commits_complete:
+        newest_commit = commits_list[0] # The commits endpoint lists newest first
+        commit_obj = newest_commit.get('commit') or {}
+        commit_date = (commit_obj.get('committer') or {}).get('date') or (commit_obj.get('author') or {}).get('date')
+        if newest_commit.get('sha') and commit_date:
+            updated["last_commit_sha"] = newest_commit['sha']
+            updated["last_commit_date"] = commit_date
+    if issues_list and issues_complete:
+        issue_updates = [i['updated_at'] for i in issues_list if i.get('updated_at')]
+        if issue_updates:
+            updated["last_issue_updated_at"] = max([updated.get("last_issue_updated_at") or ""] + issue_updates)
+    return updated
+
+
+# --- Checkpoints ---
+class CrawlCheckpoint:
+    """
+    Stores the fetched activity of finished repositories, and each detail response as soon as it arrives,
+    so an interrupted crawl can skip completed work when resumed. Thread-safe.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _repo_dir(self, repo_url: str) -> str:
         parsed_info = parse_github_url(repo_url)
-        if not parsed_info: continue
-        owner, repo = parsed_info
-        canonical_repo_url = f"https://github.com/{owner}/{repo}"
-
-        # Step 1: Fetch Contributors (remains the same)
-        repo_contributors = fetch_contributors_from_repo(owner, repo, token)
-        if repo_contributors is None: repo_contributors = []
-        for contributor_data in repo_contributors:
-            required_keys = ['login', 'id', 'html_url', 'avatar_url']
-            if not all(k in contributor_data for k in required_keys) or contributor_data.get('type') != 'User': continue
-            username = contributor_data['login']
-            if not username: continue
-
-            if username not in all_contributors_map:
-                all_contributors_map[username] = {
-                    "id": contributor_data['id'],
-                    "username": username,
-                    "url": contributor_data['html_url'],
-                    "avatar_url": contributor_data['avatar_url'],
-                    "works": []
-                 }
-            all_contributors_map[username].setdefault('works', [])
-
-        # --- Step 2: Fetch and Process Closed Issues (with Specific Details) ---
-        repo_closed_issues_list = fetch_repository_issues_list(owner, repo, token, state="closed")
-        issues_assigned_to_user_in_repo: Dict[str, List[Dict]] = {}
-        assignee_details_cache: Dict[str, Dict] = {}
-        issues_detailed_count = 0
-
-        if repo_closed_issues_list:
-            limit_str = f"{MAX_ISSUES_TO_DETAIL_PER_REPO}" if MAX_ISSUES_TO_DETAIL_PER_REPO is not None else "all"
-            print(f"Processing {len(repo_closed_issues_list)} fetched closed issue summaries. Fetching details (limit per repo: {limit_str})...")
-
-            for issue_summary_data in repo_closed_issues_list:
-                if 'pull_request' in issue_summary_data: continue
-                if issue_summary_data.get('state') != 'closed': continue
-
-                issue_number = issue_summary_data.get('number')
-                if not issue_number:
-                    print(f"  Warning: Skipping issue summary without a number: {issue_summary_data.get('url')}")
-                    continue
+        name = "__".join(parsed_info) if parsed_info else hashlib.sha256(repo_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def clear(self) -> None:
+        """Removes all checkpoint data."""
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def discard(self, repo_url: str) -> None:
+        """Removes a repository's checkpoint once its results are safely written elsewhere."""
+        repo_dir = self._repo_dir(repo_url)
+        if os.path.isdir(repo_dir):
+            shutil.rmtree(repo_dir)
+
+    def load_activity(self, repo_url: str) -> Optional[Dict[str, Any]]:
+        """Returns the saved fetch-stage result for a finished repository, if any."""
+        path = os.path.join(self._repo_dir(repo_url), "activity.json")
+        if not os.path.exists(path): return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                activity = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"  Warning: Ignoring unreadable checkpoint {path}: {e}")
+            return None
+        activity["refetched_issue_urls"] = set(activity.get("refetched_issue_urls", []))
+        return activity
 
-                should_fetch_details = (
-                    MAX_ISSUES_TO_DETAIL_PER_REPO is None or
-                    issues_detailed_count < MAX_ISSUES_TO_DETAIL_PER_REPO
-                )
+    def save_activity(self, activity: Dict[str, Any]) -> None:
+        """Saves a repository's fetch-stage result; its individual detail checkpoints are then no longer needed."""
+        repo_dir = self._repo_dir(activity["repository_url"])
+        serializable = dict(activity, refetched_issue_urls=sorted(activity["refetched_issue_urls"]))
+        try:
+            os.makedirs(repo_dir, exist_ok=True)
+            temp_path = os.path.join(repo_dir, "activity.json.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(serializable, f, ensure_ascii=False)
+            os.replace(temp_path, os.path.join(repo_dir, "activity.json"))
+            for name in os.listdir(repo_dir):
+                if name.startswith("details-"): os.remove(os.path.join(repo_dir, name))
+        except IOError as e:
+            print(f"  Warning: Could not write checkpoint for {activity['repository_url']}: {e}")
+
+    def load_details(self, repo_url: str, kind: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the detail responses of one kind ("commit"/"issue") already fetched for a repository, keyed by str(key)."""
+        path = os.path.join(self._repo_dir(repo_url), f"details-{kind}.jsonl")
+        details: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(path): return details
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # A line cut short by the interruption
+                details[entry["key"]] = entry["data"]
+        return details
+
+    def record_detail(self, repo_url: str, kind: str, key: Hashable, data: Dict[str, Any]) -> None:
+        """Appends one fetched detail response to the repository's checkpoint."""
+        repo_dir = self._repo_dir(repo_url)
+        line = json.dumps({"key": str(key), "data": data}, ensure_ascii=False)
+        with self._lock:
+            try:
+                os.makedirs(repo_dir, exist_ok=True)
+                with open(os.path.join(repo_dir, f"details-{kind}.jsonl"), 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+            except IOError as e:
+                print(f"  Warning: Could not checkpoint {kind} details for {key}: {e}")
+
+    def checkpointed_fetcher(
+        self, repo_url: str, kind: str, fetch_func: Callable[[Hashable], Optional[Dict[str, Any]]]
+    ) -> Callable[[Hashable], Optional[Dict[str, Any]]]:
+        """Wraps a detail fetch function so checkpointed results are reused and new ones are recorded."""
+        saved_details = self.load_details(repo_url, kind)
+        if saved_details:
+            print(f"  Resuming with {len(saved_details)} checkpointed {kind} details for {repo_url}.")
+
+        def fetch(key: Hashable) -> Optional[Dict[str, Any]]:
+            if str(key) in saved_details: return saved_details[str(key)]
+            data = fetch_func(key)
+            if data: self.record_detail(repo_url, kind, key, data)
+            return data
+        return fetch
+
+
+# --- Simplified Issue and Commit Entries ---
+def user_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    """The id/url/avatar_url kept for a contributor found through an issue assignee or commit author."""
+    return {"id": user.get('id'), "url": user.get('html_url'), "avatar_url": user.get('avatar_url')}
+
+def weekly_activity_by_author(
+    contributor_stats: Optional[Dict[str, Dict[str, Any]]],
+    author_details: Dict[str, Dict[str, Any]]
+) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    The weekly series of each (non-bot) author in fetch_contributor_stats' result, by login, or None without
+    statistics. Authors missing from `author_details` are added to it, so they can become contributors.
+    """
+    if contributor_stats is None: return None
+    weekly_activity: Dict[str, List[Dict[str, Any]]] = {}
+    for login, user_stats in contributor_stats.items():
+        if user_stats["author"].get('type', 'User') != 'User': continue
+        weekly_activity[login] = user_stats["weekly_activity"]
+        author_details.setdefault(login, user_profile(user_stats["author"]))
+    print(f"Read weekly activity for {len(weekly_activity)} authors.")
+    return weekly_activity
+
+def changed_weekly_activity(
+    weekly_activity_by_user: Optional[Dict[str, List[Dict[str, Any]]]],
+    watermark: Dict[str, Any]
+) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Drops the series that match the digests the last run stored in a repo watermark, and stores the digests of
+    this run's series there. Statistics cover the whole history, so an unchanged series would only produce a
+    record (resetting summaries downstream) for nothing new.
+    """
+    if weekly_activity_by_user is None: return None
+    previous_digests = watermark.get("weekly_activity_digests") or {}
+    digests = {
+        login: hashlib.sha1(json.dumps(series, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        for login, series in weekly_activity_by_user.items()
+    }
+    watermark["weekly_activity_digests"] = digests
+    return {login: series for login, series in weekly_activity_by_user.items() if previous_digests.get(login) != digests[login]}
+
+def simplify_issue(detailed_issue_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The simplified issue object stored in a contributor's work."""
+    return {
+        "html_url": detailed_issue_data.get("html_url"),
+        "number": detailed_issue_data.get("number"),
+        "title": detailed_issue_data.get("title"),
+        "body": detailed_issue_data.get("body"), # Raw markdown body
+        "labels": detailed_issue_data.get("labels", []), # List of label objects
+        "comments": detailed_issue_data.get("comments", 0), # Integer count of comments
+        "state_reason": detailed_issue_data.get("state_reason") # e.g., "completed", "not_planned"
+    }
 
-                if not should_fetch_details:
-                     if issues_detailed_count == MAX_ISSUES_TO_DETAIL_PER_REPO:
-                          print(f"  Reached issue detail limit ({MAX_ISSUES_TO_DETAIL_PER_REPO}). Skipping detail fetch for remaining issues in {owner}/{repo}.")
-                          issues_detailed_count += 1
-                     continue
-
-                print(f"  [{issues_detailed_count + 1}/{limit_str}] Fetching details for issue #{issue_number}...")
-                detailed_issue_data = fetch_issue_details(owner, repo, issue_number, token)
-
-                if detailed_issue_data:
-                    issues_detailed_count += 1
-
-                    # *** START MODIFICATION: Create simplified issue object ***
-                    simplified_issue_data = {
-                        "html_url": detailed_issue_data.get("html_url"),
-                        "number": detailed_issue_data.get("number"),
-                        "title": detailed_issue_data.get("title"),
-                        "body": detailed_issue_data.get("body"), # Raw markdown body
-                        "labels": detailed_issue_data.get("labels", []), # List of label objects
-                        "comments": detailed_issue_data.get("comments", 0), # Integer count of comments
-                        "state_reason": detailed_issue_data.get("state_reason") # e.g., "completed", "not_planned"
-                    }
-                    # *** END MODIFICATION ***
-
-                    # Use the simplified object from now on
-                    issue_data_to_store = simplified_issue_data
-                    issue_id_for_dedup = detailed_issue_data.get("id") # Still use original ID for de-duplication check
-
-                    assignees_list = detailed_issue_data.get('assignees', [])
-                    if not assignees_list and detailed_issue_data.get('assignee'):
-                        assignees_list = [detailed_issue_data['assignee']]
-
-                    if not assignees_list:
-                        continue
-
-                    for assignee in assignees_list:
-                        if assignee and isinstance(assignee, dict) and 'login' in assignee and assignee.get('type') == 'User':
-                            assignee_username = assignee['login']
-                            if not assignee_username: continue
-
-                            if assignee_username not in issues_assigned_to_user_in_repo:
-                                issues_assigned_to_user_in_repo[assignee_username] = []
-
-                            # Avoid adding duplicate issues (check by original ID)
-                            if not any(i.get('original_id_temp') == issue_id_for_dedup for i in issues_assigned_to_user_in_repo[assignee_username]):
-                                # Temporarily add original id for check, then remove if desired, or keep simplified structure
-                                # We'll store the simplified structure directly
-                                issues_assigned_to_user_in_repo[assignee_username].append(issue_data_to_store)
-
-
-                            if assignee_username not in all_contributors_map and assignee_username not in assignee_details_cache:
-                                assignee_details_cache[assignee_username] = {
-                                    "id": assignee.get('id'),
-                                    "url": assignee.get('html_url'),
-                                    "avatar_url": assignee.get('avatar_url')
-                                }
-                else:
-                    print(f"    Failed to fetch details for issue #{issue_number} or it's not accessible/found.")
+def issue_user_assignees(detailed_issue_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The issue's assignees that are users (not bots) with a login."""
+    assignees_list = detailed_issue_data.get('assignees', [])
+    if not assignees_list and detailed_issue_data.get('assignee'):
+        assignees_list = [detailed_issue_data['assignee']]
+    return [
+        assignee for assignee in assignees_list or []
+        if assignee and isinstance(assignee, dict) and assignee.get('login') and assignee.get('type') == 'User'
+    ]
+
+def commit_message_summary(commit_message: str) -> str:
+    """The first line of a commit message, cut to COMMIT_MESSAGE_MAX_LEN characters."""
+    summary = commit_message.split('\n', 1)[0]
+    if len(summary) > COMMIT_MESSAGE_MAX_LEN:
+         summary = summary[:COMMIT_MESSAGE_MAX_LEN - 3] + '...'
+    return summary
+
+def simplify_commit(commit_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The simplified commit object stored in a contributor's work, from a commit list entry (or commit details)."""
+    commit_message = commit_data.get('commit', {}).get('message', 'No commit message')
+    return {
+        "sha": commit_data.get('sha'),
+        "url": commit_data.get('html_url'),
+        "message": commit_message_summary(commit_message),
+        "files_changed": None,
+        "comment_count": None,
+        "diff_patch": None
+    }
+
+HUNK_RANGE_PATTERN = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$')
+
+def patch_elision_reason(path: str) -> Optional[str]:
+    """The PATCH_ELISION_GLOBS category a path falls in (matched on the full path and the file name), or None."""
+    path = path.lower()
+    name = path.rsplit('/', 1)[-1]
+    for reason, globs in PATCH_ELISION_GLOBS.items():
+        if any(fnmatch.fnmatchcase(path, g) or fnmatch.fnmatchcase(name, g) for g in globs):
+            return reason
+    return None
+
+def truncate_patch(patch: str, max_bytes: int) -> str:
+    """
+    Cuts a file patch to at most max_bytes (UTF-8) at a line boundary. The hunk that is cut short gets
+    its header counts rewritten to the lines kept, so the result still parses as a unified diff.
+    """
+    kept: List[str] = []
+    size = 0
+    hunk_index, hunk_old, hunk_new = -1, 0, 0
+    for line in patch.split("\n"):
+        size += len(line.encode('utf-8')) + 1
+        if size > max_bytes: break
+        if line.startswith("@@"):
+            hunk_index, hunk_old, hunk_new = len(kept), 0, 0
+        elif line.startswith("+"): hunk_new += 1
+        elif line.startswith("-"): hunk_old += 1
+        elif not line.startswith("\\"):
+            hunk_old += 1
+            hunk_new += 1
+        kept.append(line)
+    else:
+        return patch
+    if hunk_index >= 0:
+        header = HUNK_RANGE_PATTERN.match(kept[hunk_index])
+        if hunk_index == len(kept) - 1 or not header:
+            del kept[hunk_index:]
         else:
-            print(f"No closed issue summaries found or fetch failed for {owner}/{repo}.")
-
-
-        # --- Step 3: Fetch and Process Commits (remains the same) ---
-        repo_commits_list = fetch_repository_commits(owner, repo, token)
-        commits_authored_by_user_in_repo: Dict[str, List[Dict]] = {}
-        author_details_cache: Dict[str, Dict] = {} # Cache details for users found only via commits
-        commits_detailed_count = 0
-
-        if repo_commits_list:
-            limit_str_commits = f"{MAX_COMMITS_TO_DETAIL_PER_REPO}" if MAX_COMMITS_TO_DETAIL_PER_REPO is not None else "all"
-            print(f"Processing {len(repo_commits_list)} fetched commit summaries. Fetching details (limit per repo: {limit_str_commits})...")
-            for commit_summary_data in repo_commits_list:
-                commit_sha = commit_summary_data.get('sha')
-                if not commit_sha: continue
-
-                commit_author_info = commit_summary_data.get('author')
-                if not commit_author_info or not isinstance(commit_author_info, dict) \
-                   or 'login' not in commit_author_info or commit_author_info.get('type') != 'User':
-                   continue
-
-                author_username = commit_author_info['login']
-                if not author_username: continue
-
-                commit_message = commit_summary_data.get('commit', {}).get('message', 'No commit message')
-                commit_message_summary = commit_message.split('\n', 1)[0]
-                if len(commit_message_summary) > COMMIT_MESSAGE_MAX_LEN:
-                     commit_message_summary = commit_message_summary[:COMMIT_MESSAGE_MAX_LEN - 3] + '...'
-
-                simplified_commit = {
-                    "sha": commit_sha,
-                    "url": commit_summary_data.get('html_url'),
-                    "message": commit_message_summary,
-                    "files_changed": None,
-                    "comment_count": None,
-                    "diff_patch": None
-                }
-                if not simplified_commit["url"]: continue
+            kept[hunk_index] = f"@@ -{header.group(1)},{hunk_old} +{header.group(2)},{hunk_new} @@{header.group(3)}"
+    return "\n".join(kept)
 
-                should_fetch_details = (
-                    MAX_COMMITS_TO_DETAIL_PER_REPO is None or
-                    commits_detailed_count < MAX_COMMITS_TO_DETAIL_PER_REPO
-                )
-                detailed_commit_data = None
-                if should_fetch_details:
-                    print(f"  [{commits_detailed_count + 1}/{limit_str_commits}] Fetching details for commit {commit_sha[:7]} by {author_username}...")
-                    detailed_commit_data = fetch_commit_details(owner, repo, commit_sha, token)
-                    if detailed_commit_data:
-                         commits_detailed_count += 1
-                    else:
-                         print(f"    Failed to fetch details for commit {commit_sha[:7]}.")
-
-                if detailed_commit_data:
-                    files = detailed_commit_data.get('files', [])
-                    commit_details_commit_obj = detailed_commit_data.get('commit', {})
-                    comment_count = commit_details_commit_obj.get('comment_count', 0) if commit_details_commit_obj else 0
-
-                    simplified_commit["comment_count"] = comment_count
-                    simplified_commit["files_changed"] = [
-                        {"filename": f.get('filename'), "status": f.get('status')}
-                        for f in files if f.get('filename')
-                    ] if files else []
-
-                    combined_patch = ""
-                    if files:
-                         for f in files:
-                             if f and 'patch' in f and isinstance(f.get('patch'), str) and f['patch']:
-                                 combined_patch += f"--- File: {f.get('filename', 'Unknown')} ---\n"
-                                 combined_patch += f['patch']
-                                 combined_patch += "\n\n"
-                    simplified_commit["diff_patch"] = combined_patch.strip() if combined_patch else None
-
-                if author_username not in commits_authored_by_user_in_repo:
-                    commits_authored_by_user_in_repo[author_username] = []
-                if not any(c['sha'] == simplified_commit['sha'] for c in commits_authored_by_user_in_repo[author_username]):
-                     commits_authored_by_user_in_repo[author_username].append(simplified_commit)
-
-                if author_username not in all_contributors_map and author_username not in author_details_cache:
-                     author_details_cache[author_username] = {
-                         "id": commit_author_info.get('id'),
-                         "url": commit_author_info.get('html_url'),
-                         "avatar_url": commit_author_info.get('avatar_url')
-                     }
+def filter_patch(path: str, patch: str, commit_bytes_kept: int) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Applies the patch filter to one file's patch, given how many patch bytes the commit has kept so far.
+    Returns the patch to keep (None to leave it out) and, if anything was elided, the note for its
+    files_changed entry: {"patch_elided": reason, "patch_bytes": original size}.
+    """
+    if not PATCH_FILTER_ENABLED: return patch, None
+    patch_bytes = len(patch.encode('utf-8'))
+    reason = patch_elision_reason(path)
+    if reason: return None, {"patch_elided": reason, "patch_bytes": patch_bytes}
+
+    limits = [MAX_PATCH_BYTES_PER_FILE] if MAX_PATCH_BYTES_PER_FILE > 0 else []
+    if MAX_PATCH_BYTES_PER_COMMIT > 0: limits.append(MAX_PATCH_BYTES_PER_COMMIT - commit_bytes_kept)
+    if not limits or patch_bytes <= min(limits): return patch, None
+    truncated = truncate_patch(patch, min(limits)) if min(limits) > 0 else ""
+    if not truncated: return None, {"patch_elided": "too_large", "patch_bytes": patch_bytes}
+    return truncated, {"patch_elided": "truncated", "patch_bytes": patch_bytes}
+
+def apply_commit_details(simplified_commit: Dict[str, Any], detailed_commit_data: Dict[str, Any]) -> None:
+    """
+    Fills in a simplified commit's comment count, changed files and combined patch from its details.
+    Patches go through filter_patch; the files_changed entry of a file whose patch was dropped or cut says so.
+    Each entry keeps the file's additions/deletions, which count the whole patch even when diff_patch doesn't.
+    """
+    files = detailed_commit_data.get('files', [])
+    commit_details_commit_obj = detailed_commit_data.get('commit', {})
+    comment_count = commit_details_commit_obj.get('comment_count', 0) if commit_details_commit_obj else 0
+
+    simplified_commit["comment_count"] = comment_count
+    files_changed: List[Dict[str, Any]] = []
+    combined_patch = ""
+    commit_bytes_kept = 0
+    for f in files or []:
+        if not f: continue
+        entry = {"filename": f.get('filename'), "status": f.get('status')} if f.get('filename') else None
+        if entry:
+            if isinstance(f.get('additions'), int) and isinstance(f.get('deletions'), int):
+                entry["additions"], entry["deletions"] = f['additions'], f['deletions']
+            files_changed.append(entry)
+        if not isinstance(f.get('patch'), str) or not f['patch']: continue
+        patch, elided = filter_patch(f.get('filename') or '', f['patch'], commit_bytes_kept)
+        if elided and entry: entry.update(elided)
+        if patch is None: continue
+        commit_bytes_kept += len(patch.encode('utf-8'))
+        combined_patch += f"--- File: {f.get('filename', 'Unknown')} ---\n"
+        combined_patch += patch
+        combined_patch += "\n\n"
+    simplified_commit["files_changed"] = files_changed
+    simplified_commit["diff_patch"] = combined_patch.strip() if combined_patch else None
+
+
+# --- Commit Detail Sampling ---
+BOT_LOGIN_PATTERN = re.compile(r'(\[bot\]|-bot)$|^bot-', re.IGNORECASE)
+
+def parse_iso_timestamp(value: Optional[str]) -> Optional[float]:
+    if not value: return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+def sample_recent(candidates: List[Dict[str, Any]]) -> List[str]:
+    """Newest first, in list order."""
+    return [c["sha"] for c in candidates]
+
+def sample_per_author(candidates: List[Dict[str, Any]]) -> List[str]:
+    """One commit per author in turn (authors in order of their newest commit), newest first for each author."""
+    shas_by_author: Dict[str, List[str]] = {}
+    for c in candidates:
+        shas_by_author.setdefault(c["author"], []).append(c["sha"])
+    return [sha for turn in itertools.zip_longest(*shas_by_author.values()) for sha in turn if sha]
+
+def sample_time_stratified(candidates: List[Dict[str, Any]]) -> List[str]:
+    """One commit per time slice in turn (newest slice first), newest first within each slice."""
+    timestamps = [c["timestamp"] for c in candidates if c["timestamp"] is not None]
+    if len(timestamps) < 2: return sample_recent(candidates)
+    oldest, newest = min(timestamps), max(timestamps)
+    span = (newest - oldest) or 1.0
+    strata: List[List[str]] = [[] for _ in range(TIME_STRATA)]
+    for c in candidates:
+        timestamp = c["timestamp"] if c["timestamp"] is not None else newest
+        strata[min(TIME_STRATA - 1, int((newest - timestamp) / span * TIME_STRATA))].append(c["sha"])
+    return [sha for turn in itertools.zip_longest(*strata) for sha in turn if sha]
+
+# Policy name -> function ordering detail candidates (dicts with sha, author, timestamp, is_merge, is_bot) by priority
+COMMIT_SAMPLING_POLICIES: Dict[str, Callable[[List[Dict[str, Any]]], List[str]]] = {
+    "recent": sample_recent,
+    "per_author": sample_per_author,
+    "time_stratified": sample_time_stratified,
+}
+
+def order_commits_for_details(candidates: List[Dict[str, Any]], policy: str) -> List[str]:
+    """
+    Orders commit SHAs by detail priority under a sampling policy. Except for "recent", ordinary commits
+    come before merges and bot-like authors, which are sampled the same way after them.
+    """
+    sample = COMMIT_SAMPLING_POLICIES[policy]
+    if policy == "recent": return sample(candidates)
+    preferred = [c for c in candidates if not c["is_merge"] and not c["is_bot"]]
+    deferred = [c for c in candidates if c["is_merge"] or c["is_bot"]]
+    return sample(preferred) + sample(deferred)
+
+
+# --- Per-Repository Fetch Stage ---
+def fetch_repository_activity(
+    repo_url: str,
+    token: Optional[str] = None,
+    watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
+    checkpoint: Optional[CrawlCheckpoint] = None,
+    sampling_policy: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetches one repository's contributors, closed issues and commits (with details up to the per-repo limits).
+    Reads no shared crawl state, so repositories can be fetched in parallel; merge_repository_activity
+    folds the result into the contributor map. `watermarks` (read only) turns on incremental fetching.
+    With a `checkpoint`, a previously finished result is reused and detail fetches are recorded as they complete.
+    `sampling_policy` picks which commits get details (default COMMIT_SAMPLING_POLICY).
+    Returns None if the URL can't be parsed.
+    """
+    print(f"\n--- Processing repository: {repo_url} ---")
+    parsed_info = parse_github_url(repo_url)
+    if not parsed_info: return None
+    owner, repo = parsed_info
+    canonical_repo_url = f"https://github.com/{owner}/{repo}"
+    if checkpoint:
+        saved_activity = checkpoint.load_activity(canonical_repo_url)
+        if saved_activity:
+            print(f"Resuming: using checkpointed results for {owner}/{repo}.")
+            return saved_activity
+    repo_watermark = watermarks.get(canonical_repo_url) if watermarks is not None else None
+    is_incremental = bool(repo_watermark)
+    if is_incremental:
+        print(f"Incremental crawl: last commit {repo_watermark.get('last_commit_sha', 'n/a')[:7]} ({repo_watermark.get('last_commit_date')}), last issue update {repo_watermark.get('last_issue_updated_at')}")
+
+    # Step 1: Fetch Contributors (added to the contributor map by merge_repository_activity)
+    repo_contributors = fetch_contributors_from_repo(owner, repo, token)
+    if repo_contributors is None: repo_contributors = []
+
+    fetch_issue = lambda number: fetch_issue_details(owner, repo, number, token)
+    fetch_commit = lambda sha: fetch_commit_details(owner, repo, sha, token)
+    if checkpoint:
+        fetch_issue = checkpoint.checkpointed_fetcher(canonical_repo_url, "issue", fetch_issue)
+        fetch_commit = checkpoint.checkpointed_fetcher(canonical_repo_url, "commit", fetch_commit)
+
+    # --- Step 2: Fetch and Process Closed Issues (with Specific Details) ---
+    issue_since = max(filter(None, [repo_watermark.get("last_issue_updated_at") if is_incremental else None, FETCH_SINCE]), default=None)
+    use_graphql_issues = ISSUE_FETCH_MODE == "graphql" and bool(token)
+    if ISSUE_FETCH_MODE == "graphql" and not token:
+        print("Warning: GraphQL issue mode needs a token. Falling back to the REST issue endpoints.")
+    issue_listing = {"complete": False}
+    if use_graphql_issues:
+        # Issues come back with full details, already capped at the per-repo detail limit
+        repo_closed_issues_list = fetch_repository_issues_graphql(
+            owner, repo, token, since=issue_since, limit=MAX_ISSUES_TO_DETAIL_PER_REPO, listing=issue_listing
+        ) or []
+        issue_summaries: Iterable[Dict[str, Any]] = repo_closed_issues_list
+    else:
+        # Read lazily, so listing stops once enough issues have been detailed
+        repo_closed_issues_list = [] # Summaries read so far
+        issue_summaries = iter_repository_issues(owner, repo, token, state="closed", since=issue_since)
+    refetched_issue_urls = set() # Issues detailed in this run; their older copies are replaced
+    issues_assigned_to_user_in_repo: Dict[str, List[Dict]] = {}
+    assigned_issue_keys: Set[Tuple[str, Any]] = set() # (assignee, issue id) pairs already added
+    assignee_details_cache: Dict[str, Dict] = {}
+
+    issue_numbers_to_detail: List[int] = []
+    def iter_issue_numbers_to_detail() -> Iterator[int]:
+        for issue_summary_data in issue_summaries:
+            if not use_graphql_issues: repo_closed_issues_list.append(issue_summary_data)
+            if 'pull_request' in issue_summary_data: continue
+            if issue_summary_data.get('state') != 'closed': continue
+
+            issue_number = issue_summary_data.get('number')
+            if not issue_number:
+                print(f"  Warning: Skipping issue summary without a number: {issue_summary_data.get('url')}")
+                continue
+            issue_numbers_to_detail.append(issue_number)
+            yield issue_number
+
+    limit_str = f"{MAX_ISSUES_TO_DETAIL_PER_REPO}" if MAX_ISSUES_TO_DETAIL_PER_REPO is not None else "all"
+    print(f"Processing closed issue summaries as they are fetched. Fetching details (limit per repo: {limit_str})...")
+    if use_graphql_issues:
+        collections.deque(iter_issue_numbers_to_detail(), maxlen=0)
+        detailed_issues = {issue['number']: issue for issue in repo_closed_issues_list if issue.get('number')}
+    else:
+        detailed_issues = fetch_details_up_to_limit(
+            fetch_issue,
+            iter_issue_numbers_to_detail(), MAX_ISSUES_TO_DETAIL_PER_REPO, "issue"
+        )
+        issue_listing["complete"] = issue_summaries.complete
+
+    if repo_closed_issues_list:
+        print(f"Read {len(repo_closed_issues_list)} closed issue summaries.")
+        refetched_issue_urls.update(d.get("html_url") for d in detailed_issues.values() if d.get("html_url"))
+
+        for issue_number in issue_numbers_to_detail:
+            detailed_issue_data = detailed_issues.get(issue_number)
+            if detailed_issue_data:
+                issue_data_to_store = simplify_issue(detailed_issue_data)
+                issue_id_for_dedup = detailed_issue_data.get("id") # Still use original ID for de-duplication check
+
+                for assignee in issue_user_assignees(detailed_issue_data):
+                    assignee_username = assignee['login']
+
+                    if assignee_username not in issues_assigned_to_user_in_repo:
+                        issues_assigned_to_user_in_repo[assignee_username] = []
+
+                    # Avoid adding duplicate issues (check by original ID)
+                    if (assignee_username, issue_id_for_dedup) not in assigned_issue_keys:
+                        assigned_issue_keys.add((assignee_username, issue_id_for_dedup))
+                        issues_assigned_to_user_in_repo[assignee_username].append(issue_data_to_store)
+
+                    if assignee_username not in assignee_details_cache:
+                        assignee_details_cache[assignee_username] = user_profile(assignee)
+    else:
+        print(f"No closed issue summaries found or fetch failed for {owner}/{repo}.")
+
+
+    # --- Step 3: Fetch and Process Commits (remains the same) ---
+    commit_since = max(filter(None, [repo_watermark.get("last_commit_date") if is_incremental else None, FETCH_SINCE]), default=None)
+    mirror_path = ensure_git_mirror(owner, repo) if GIT_MIRROR_DIR else None
+    mirror_commit_details: Optional[Dict[str, Dict[str, Any]]] = None
+    if mirror_path:
+        # Details for every commit come from the local clone, so the detail limit doesn't apply
+        mirror_commits, mirror_commit_details = fetch_commits_from_git_mirror(
+            owner, repo, mirror_path, token,
+            since_sha=repo_watermark.get("last_commit_sha") if is_incremental else None,
+            since_date=commit_since
+        )
+        commit_summaries: Iterable[Dict[str, Any]] = mirror_commits
+        commit_pages: Optional[PaginatedListing] = None
+    else:
+        commit_summaries = commit_pages = iter_repository_commits(owner, repo, token, since=commit_since)
+    commit_listing = {"complete": commit_pages is None} # The mirror's log is always read in full
+    if is_incremental:
+        # `since` is inclusive, so stop at the last commit already stored; everything after it was read before
+        last_seen_sha = repo_watermark.get("last_commit_sha")
+        def iter_commits_until_last_seen(commits: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for commit_summary_data in commits:
+                if last_seen_sha and commit_summary_data.get('sha') == last_seen_sha:
+                    commit_listing["complete"] = True
+                    return
+                yield commit_summary_data
+        commit_summaries = iter_commits_until_last_seen(commit_summaries)
+    repo_commits_list: List[Dict[str, Any]] = [] # Summaries read so far
+    commits_authored_by_user_in_repo: Dict[str, List[Dict]] = {}
+    integrated_commit_shas: Set[str] = set()
+    author_details_cache: Dict[str, Dict] = {} # Cache details for users found only via commits
+
+    commits_to_integrate: List[Tuple[Dict[str, Any], str, Dict[str, Any]]] = []
+    detail_candidates: List[Dict[str, Any]] = []
+    def iter_commit_shas_to_integrate() -> Iterator[str]:
+        for commit_summary_data in commit_summaries:
+            repo_commits_list.append(commit_summary_data)
+            commit_sha = commit_summary_data.get('sha')
+            if not commit_sha: continue
+
+            commit_author_info = commit_summary_data.get('author')
+            if not commit_author_info or not isinstance(commit_author_info, dict) \
+               or 'login' not in commit_author_info or commit_author_info.get('type') != 'User':
+               continue
+
+            author_username = commit_author_info['login']
+            if not author_username: continue
+
+            simplified_commit = simplify_commit(commit_summary_data)
+            if not simplified_commit["url"]: continue
+            commits_to_integrate.append((simplified_commit, author_username, commit_author_info))
+            detail_candidates.append({
+                "sha": commit_sha,
+                "author": author_username,
+                "timestamp": parse_iso_timestamp(((commit_summary_data.get('commit') or {}).get('author') or {}).get('date')),
+                "is_merge": len(commit_summary_data.get('parents') or []) > 1,
+                "is_bot": bool(BOT_LOGIN_PATTERN.search(author_username)),
+            })
+            yield commit_sha
+
+    limit_str_commits = f"{MAX_COMMITS_TO_DETAIL_PER_REPO}" if MAX_COMMITS_TO_DETAIL_PER_REPO is not None else "all"
+    print(f"Processing commit summaries as they are fetched. Fetching details (limit per repo: {limit_str_commits})...")
+    candidate_shas = iter_commit_shas_to_integrate()
+    sampling_policy = sampling_policy or COMMIT_SAMPLING_POLICY
+    if mirror_commit_details is None and MAX_COMMITS_TO_DETAIL_PER_REPO is not None and sampling_policy != "recent":
+        # Sampling needs every candidate up front, so the commit list is read in full before any details
+        collections.deque(candidate_shas, maxlen=0)
+        candidate_shas = iter(order_commits_for_details(detail_candidates, sampling_policy))
+        print(f"Ordered {len(detail_candidates)} commits for details with the '{sampling_policy}' sampling policy.")
+    if mirror_commit_details is not None:
+        collections.deque(candidate_shas, maxlen=0)
+        detailed_commits = mirror_commit_details
+    else:
+        detailed_commits = {}
+        if COMMIT_DETAIL_MODE == "compare":
+            # Runs of consecutive commits within the limit come from compare requests; the rest fall through below
+            first_shas = list(itertools.islice(candidate_shas, MAX_COMMITS_TO_DETAIL_PER_REPO))
+            saved_details = checkpoint.load_details(canonical_repo_url, "commit") if checkpoint else {}
+            detailed_commits = {sha: saved_details[sha] for sha in first_shas if sha in saved_details}
+            compared = fetch_commit_details_by_compare(
+                owner, repo, repo_commits_list, [sha for sha in first_shas if sha not in detailed_commits], token
+            )
+            for sha, details in compared.items():
+                if checkpoint: checkpoint.record_detail(canonical_repo_url, "commit", sha, details)
+            detailed_commits.update(compared)
+            candidate_shas = itertools.chain(first_shas, candidate_shas)
+        remaining_limit = None if MAX_COMMITS_TO_DETAIL_PER_REPO is None else MAX_COMMITS_TO_DETAIL_PER_REPO - len(detailed_commits)
+        detailed_commits.update(fetch_details_up_to_limit(
+            fetch_commit,
+            (sha for sha in candidate_shas if sha not in detailed_commits),
+            remaining_limit, "commit"
+        ))
+    if LIST_UNDETAILED_COMMITS:
+        collections.deque(candidate_shas, maxlen=0) # Read the rest of the list; those commits are kept without details
+    if commit_pages is not None and commit_pages.complete:
+        commit_listing["complete"] = True
+    if is_incremental:
+        print(f"Found {len(repo_commits_list)} new commits since the last crawl.")
+
+    if repo_commits_list:
+        print(f"Read {len(repo_commits_list)} commit summaries.")
+        for simplified_commit, author_username, commit_author_info in commits_to_integrate:
+            detailed_commit_data = detailed_commits.get(simplified_commit["sha"])
+            if detailed_commit_data:
+                apply_commit_details(simplified_commit, detailed_commit_data)
+
+            if author_username not in commits_authored_by_user_in_repo:
+                commits_authored_by_user_in_repo[author_username] = []
+            if simplified_commit['sha'] not in integrated_commit_shas:
+                 integrated_commit_shas.add(simplified_commit['sha'])
+                 commits_authored_by_user_in_repo[author_username].append(simplified_commit)
+
+            if author_username not in author_details_cache:
+                 author_details_cache[author_username] = user_profile(commit_author_info)
+    else:
+         print(f"No commit summaries found or fetch failed for {owner}/{repo}.")
+
+    contributor_stats = fetch_contributor_stats(owner, repo, token) if FETCH_CONTRIBUTOR_STATS else None
+    weekly_activity_by_user = weekly_activity_by_author(contributor_stats, author_details_cache)
+    watermark = update_watermark(
+        repo_watermark or {}, repo_commits_list, repo_closed_issues_list,
+        commits_complete=commit_listing["complete"], issues_complete=issue_listing["complete"]
+    )
+    weekly_activity_by_user = changed_weekly_activity(weekly_activity_by_user, watermark)
+
+    activity = {
+        "repository_url": canonical_repo_url,
+        "owner": owner,
+        "repo": repo,
+        "is_incremental": is_incremental,
+        "contributors": repo_contributors,
+        "issues_by_user": issues_assigned_to_user_in_repo,
+        "commits_by_user": commits_authored_by_user_in_repo,
+        "assignee_details": assignee_details_cache,
+        "author_details": author_details_cache,
+        "refetched_issue_urls": refetched_issue_urls,
+        "weekly_activity_by_user": weekly_activity_by_user,
+        "watermark": watermark,
+    }
+    if checkpoint: checkpoint.save_activity(activity)
+    return activity
+
+
+# --- Contributor Graph ---
+class CommitRecord:
+    """A simplified commit as stored in a contributor's work."""
+    FIELDS = ("sha", "url", "message", "files_changed", "comment_count", "diff_patch")
+    __slots__ = FIELDS
+
+    def __init__(self, data: Dict[str, Any]):
+        for field in self.FIELDS:
+            setattr(self, field, data.get(field))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class IssueRecord:
+    """A simplified issue as stored in a contributor's work."""
+    FIELDS = ("html_url", "number", "title", "body", "labels", "comments", "state_reason")
+    __slots__ = FIELDS
+
+    def __init__(self, data: Dict[str, Any]):
+        for field in self.FIELDS:
+            setattr(self, field, data.get(field))
+
+    @staticmethod
+    def key(number: Optional[int], html_url: Optional[str]) -> Hashable:
+        """Identifies an issue within its repository by number, which survives transfers and renames; else by URL."""
+        if number is None and html_url:
+            match = ISSUE_NUMBER_PATTERN.search(html_url)
+            if match: number = int(match.group(1))
+        return number if number is not None else html_url
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+ISSUE_NUMBER_PATTERN = re.compile(r'/(?:issues|pull)/(\d+)$')
+
+class WorkRecord:
+    """
+    A contributor's work in one repository. Issues are indexed by IssueRecord.key and commits by SHA, in output order.
+    `weekly_activity` is the contributor's weekly series from /stats/contributors, or None if it wasn't fetched.
+    """
+    __slots__ = ("repository_url", "issues", "commits", "weekly_activity")
+
+    def __init__(self, repository_url: str):
+        self.repository_url = repository_url
+        self.issues: Dict[Hashable, IssueRecord] = {}
+        self.commits: Dict[str, CommitRecord] = {}
+        self.weekly_activity: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WorkRecord":
+        work = cls(data.get("repository_url"))
+        work.replace(data.get("issues", []), data.get("commits", []))
+        work.weekly_activity = data.get("weekly_activity")
+        return work
+
+    def replace(self, issues: List[Dict[str, Any]], commits: List[Dict[str, Any]]) -> None:
+        """Replaces the stored activity. The first copy of a duplicated issue or commit wins."""
+        self.issues = {}
+        self.commits = {}
+        for issue in issues:
+            self.issues.setdefault(IssueRecord.key(issue.get("number"), issue.get("html_url")), IssueRecord(issue))
+        for commit in commits:
+            self.commits.setdefault(commit.get("sha"), CommitRecord(commit))
+
+    def merge(self, issues: List[Dict[str, Any]], commits: List[Dict[str, Any]]) -> None:
+        """Puts newly fetched activity in front of the stored activity. New items replace old ones with the same key."""
+        stored_issues, stored_commits = self.issues, self.commits
+        self.replace(issues, commits)
+        for key, issue in stored_issues.items():
+            self.issues.setdefault(key, issue)
+        for sha, commit in stored_commits.items():
+            self.commits.setdefault(sha, commit)
+
+    def to_dict(self) -> Dict[str, Any]:
+        work = {
+            "repository_url": self.repository_url,
+            "issues": [issue.to_dict() for issue in self.issues.values()],
+            "commits": [commit.to_dict() for commit in self.commits.values()]
+        }
+        if self.weekly_activity is not None: work["weekly_activity"] = self.weekly_activity
+        return work
+
+class ContributorRecord:
+    """A contributor and their works, indexed by repository URL."""
+    __slots__ = ("id", "username", "url", "avatar_url", "works")
+
+    def __init__(self, id: Any, username: str, url: Optional[str], avatar_url: Optional[str]):
+        self.id = id
+        self.username = username
+        self.url = url
+        self.avatar_url = avatar_url
+        self.works: Dict[str, WorkRecord] = {}
+
+    def to_dict(self, works: Optional[List[WorkRecord]] = None) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "username": self.username,
+            "url": self.url,
+            "avatar_url": self.avatar_url,
+            "works": [work.to_dict() for work in (self.works.values() if works is None else works)]
+        }
+
+class ContributorGraph:
+    """
+    In-memory contributor graph built up by process_repositories. Contributors are indexed by username and
+    works by repository URL, with a reverse index from each repository to the contributors who have work
+    there, so merging a repository is linear in its own activity.
+    """
+    def __init__(self):
+        self.contributors: Dict[str, ContributorRecord] = {}
+        self.repository_contributors: Dict[str, Set[str]] = collections.defaultdict(set)
+
+    @classmethod
+    def from_contributors_map(cls, contributors_map: Dict[str, Dict[str, Any]]) -> "ContributorGraph":
+        """Builds a graph from a contributor map as returned by process_repositories (or loaded from its output)."""
+        graph = cls()
+        for username, entry in contributors_map.items():
+            contributor = graph.add_contributor(username, entry.get("id"), entry.get("url"), entry.get("avatar_url"))
+            for work_data in entry.get("works", []):
+                work = WorkRecord.from_dict(work_data)
+                contributor.works[work.repository_url] = work
+                graph.repository_contributors[work.repository_url].add(username)
+        return graph
+
+    def add_contributor(self, username: str, id: Any, url: Optional[str], avatar_url: Optional[str]) -> ContributorRecord:
+        """Adds a contributor if they aren't in the graph yet, and returns their record."""
+        contributor = self.contributors.get(username)
+        if contributor is None:
+            contributor = self.contributors[username] = ContributorRecord(id, username, url, avatar_url)
+        return contributor
+
+    def get_or_create_work(self, username: str, repository_url: str) -> Tuple[WorkRecord, bool]:
+        """Returns the contributor's work in a repository and whether it was just created."""
+        works = self.contributors[username].works
+        work = works.get(repository_url)
+        if work is not None:
+            return work, False
+        work = works[repository_url] = WorkRecord(repository_url)
+        self.repository_contributors[repository_url].add(username)
+        return work, True
+
+    def remove_issues(self, repository_url: str, issue_urls: Set[str]) -> None:
+        """Drops the given issues from every contributor's work in a repository, matching them by IssueRecord.key."""
+        keys = {IssueRecord.key(None, url) for url in issue_urls}
+        for username in self.repository_contributors.get(repository_url, ()):
+            issues = self.contributors[username].works[repository_url].issues
+            for key in keys:
+                issues.pop(key, None)
+
+    def to_contributors_map(self) -> Dict[str, Dict[str, Any]]:
+        return {username: contributor.to_dict() for username, contributor in self.contributors.items()}
+
+
+# --- Merge Stage ---
+def merge_repository_activity(
+    graph: ContributorGraph,
+    activity: Dict[str, Any],
+    keep_works: bool = True,
+    build_records: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Merges one repository's fetched activity into the contributor graph (Steps 1 and 4 of the crawl).
+    Merging results in the order of the input URLs gives the same graph as a serial crawl.
+    Returns the repository's contributor-work records (a contributor entry whose `works` holds just this repo),
+    or an empty list with `build_records=False`, for callers that only want the graph.
+    """
+    canonical_repo_url = activity["repository_url"]
+    owner, repo = activity["owner"], activity["repo"]
+    is_incremental = activity["is_incremental"]
+    repo_contributors = activity["contributors"]
+    issues_assigned_to_user_in_repo = activity["issues_by_user"]
+    commits_authored_by_user_in_repo = activity["commits_by_user"]
+    assignee_details_cache = activity["assignee_details"]
+    author_details_cache = activity["author_details"]
+    refetched_issue_urls = activity["refetched_issue_urls"]
+    weekly_activity_by_user = activity.get("weekly_activity_by_user") # None without statistics (and in older checkpoints)
+
+    # Step 1: Add the repository's contributors
+    for contributor_data in repo_contributors:
+        required_keys = ['login', 'id', 'html_url', 'avatar_url']
+        if not all(k in contributor_data for k in required_keys) or contributor_data.get('type') != 'User': continue
+        username = contributor_data['login']
+        if not username: continue
+        graph.add_contributor(username, contributor_data['id'], contributor_data['html_url'], contributor_data['avatar_url'])
+
+    # --- Step 4: Integrate Issues and Commits into Contributor Works ---
+    involved_users_in_repo = set()
+    if repo_contributors: involved_users_in_repo.update(c['login'] for c in repo_contributors if c.get('login'))
+    involved_users_in_repo.update(issues_assigned_to_user_in_repo.keys())
+    involved_users_in_repo.update(commits_authored_by_user_in_repo.keys())
+    involved_users_in_repo.update(weekly_activity_by_user or {})
+
+    print(f"Integrating activities for {len(involved_users_in_repo)} users in {owner}/{repo}...")
+
+    if is_incremental and refetched_issue_urls:
+        # Re-fetched issues may have changed assignees, so drop every stored copy before re-adding
+        graph.remove_issues(canonical_repo_url, set(refetched_issue_urls))
+
+    repo_work_records: List[Dict[str, Any]] = []
+    for username in sorted(involved_users_in_repo):
+        if username not in graph.contributors:
+            details = assignee_details_cache.get(username) or author_details_cache.get(username)
+            if details and (details.get('id') or details.get('url')):
+                print(f"Adding contributor '{username}' based on activity in {owner}/{repo}.")
+                graph.add_contributor(username, details.get('id'), details.get('url'), details.get('avatar_url'))
+            else:
+                print(f"Warning: Skipping user '{username}' found via activity in {owner}/{repo} as details couldn't be retrieved or cached.")
+                continue
+
+        # Get the simplified issues and commits for THIS user in THIS repo
+        user_issues_in_repo = issues_assigned_to_user_in_repo.get(username, []) # This now contains simplified issue objects
+        user_commits_in_repo = commits_authored_by_user_in_repo.get(username, [])
+        user_weekly_activity = (weekly_activity_by_user or {}).get(username)
+        if not user_issues_in_repo and not user_commits_in_repo and not user_weekly_activity:
+            continue
+
+        if not keep_works:
+            repo_work_entry = WorkRecord(canonical_repo_url)
+            repo_work_entry.replace(user_issues_in_repo, user_commits_in_repo)
         else:
-             print(f"No commit summaries found or fetch failed for {owner}/{repo}.")
-
-        # --- Step 4: Integrate Issues and Commits into Contributor Works ---
-        involved_users_in_repo = set()
-        if repo_contributors: involved_users_in_repo.update(c['login'] for c in repo_contributors if c.get('login'))
-        involved_users_in_repo.update(issues_assigned_to_user_in_repo.keys())
-        involved_users_in_repo.update(commits_authored_by_user_in_repo.keys())
-
-        print(f"Integrating activities for {len(involved_users_in_repo)} users in {owner}/{repo}...")
-
-        for username in involved_users_in_repo:
-            if username not in all_contributors_map:
-                details = assignee_details_cache.get(username) or author_details_cache.get(username)
-                if details and (details.get('id') or details.get('url')):
-                    print(f"Adding contributor '{username}' based on activity in {owner}/{repo}.")
-                    all_contributors_map[username] = {
-                        "id": details.get('id'),
-                        "username": username,
-                        "url": details.get('url'),
-                        "avatar_url": details.get('avatar_url'),
-                        "works": []
-                    }
-                else:
-                    print(f"Warning: Skipping user '{username}' found via activity in {owner}/{repo} as details couldn't be retrieved or cached.")
-                    continue
+            repo_work_entry, created = graph.get_or_create_work(username, canonical_repo_url)
+            if is_incremental and not created:
+                # Keep what earlier runs stored and add the new activity in front of it
+                repo_work_entry.merge(user_issues_in_repo, user_commits_in_repo)
+            else:
+                # Overwrite with potentially newer data from this run
+                repo_work_entry.replace(user_issues_in_repo, user_commits_in_repo)
+        if user_weekly_activity is not None:
+            # The statistics always cover the whole history, so they replace the stored series
+            repo_work_entry.weekly_activity = user_weekly_activity
 
-            contributor_works = all_contributors_map[username].setdefault('works', [])
+        if build_records:
+            repo_work_records.append(graph.contributors[username].to_dict(works=[repo_work_entry]))
 
-            # Get the simplified issues and commits for THIS user in THIS repo
-            user_issues_in_repo = issues_assigned_to_user_in_repo.get(username, []) # This now contains simplified issue objects
-            user_commits_in_repo = commits_authored_by_user_in_repo.get(username, [])
+    return repo_work_records
 
-            if user_issues_in_repo or user_commits_in_repo:
-                repo_work_entry = next((work for work in contributor_works if work.get("repository_url") == canonical_repo_url), None)
 
-                if repo_work_entry is None:
-                    repo_work_entry = {
-                        "repository_url": canonical_repo_url,
-                        "issues": user_issues_in_repo, # Store the list of simplified issue objects
-                        "commits": user_commits_in_repo
-                    }
-                    contributor_works.append(repo_work_entry)
-                else:
-                    # Update existing entry - overwrite with potentially newer data from this run
-                    repo_work_entry["issues"] = user_issues_in_repo # Update with simplified issues
-                    repo_work_entry["commits"] = user_commits_in_repo
+# --- MODIFIED FUNCTION ---
+def process_repositories(
+    repo_urls: List[str],
+    token: Optional[str] = None,
+    existing_contributors: Optional[Dict[str, Dict[str, Any]]] = None,
+    watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
+    on_repository_done: Optional[Callable[[str, List[Dict[str, Any]], Set[str]], None]] = None,
+    keep_works: bool = True,
+    checkpoint: Optional[CrawlCheckpoint] = None,
+    sampling_policy: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetches contributors, their assigned closed issues (with specific details up to a limit),
+    and detailed commit info (up to a limit per repo, excluding stats) for multiple repositories.
+    Merges the data in a ContributorGraph. Returns a dictionary of unique contributors keyed by username.
+    Up to MAX_CONCURRENT_REPOSITORIES repositories are fetched at once, and no more than REPOSITORY_WINDOW
+    are started ahead of the one being merged; their results are merged in the order of `repo_urls`.
+
+    For incremental crawls, pass the contributor map from a previous run as `existing_contributors`
+    together with the per-repo `watermarks` dict. Repos with a watermark only fetch commits and issues
+    newer than it, and the results are merged into the existing works instead of replacing them.
+    `watermarks` is updated in place with the new high-water marks.
+
+    If `on_repository_done` is given, it is called after each repository with the canonical repo URL,
+    that repo's contributor-work records (a contributor entry whose `works` holds just this repo) and
+    the URLs of the issues an incremental run re-fetched, whose stored copies the records supersede.
+    With `keep_works=False` the works are not accumulated in the returned map, so memory stays flat
+    when the records are streamed out by the callback.
+
+    With a `checkpoint`, each repository's fetched results are saved when it finishes and reused
+    by a later run on the same checkpoint, so an interrupted crawl can be resumed.
+
+    `sampling_policy` names the COMMIT_SAMPLING_POLICIES entry that decides which commits get details
+    when a repository has more than MAX_COMMITS_TO_DETAIL_PER_REPO (default COMMIT_SAMPLING_POLICY).
+    """
+    sampling_policy = sampling_policy or COMMIT_SAMPLING_POLICY
+    if sampling_policy not in COMMIT_SAMPLING_POLICIES:
+        raise ValueError(f"Unknown commit sampling policy '{sampling_policy}'; choose from {', '.join(COMMIT_SAMPLING_POLICIES)}.")
+    graph = ContributorGraph.from_contributors_map(existing_contributors or {})
+    if watermarks is None: watermarks = {}
+    fetch_watermarks = watermarks if existing_contributors is not None else None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REPOSITORIES, thread_name_prefix='RepoWorker') as executor:
+        remaining_urls = iter(repo_urls)
+        pending = collections.deque()
+        def submit_up_to_window():
+            # Repositories finished ahead of the one being merged wait in memory, so only a few may run ahead
+            for repo_url in itertools.islice(remaining_urls, REPOSITORY_WINDOW - len(pending)):
+                pending.append(executor.submit(fetch_repository_activity, repo_url, token, fetch_watermarks, checkpoint, sampling_policy))
+        try:
+            # Merge in input order (not completion order) so the result matches a serial crawl
+            submit_up_to_window()
+            while pending:
+                activity = pending.popleft().result()
+                submit_up_to_window()
+                if activity is None: continue
+                # The records are copies of the merged works; only build them if something will consume them
+                repo_work_records = merge_repository_activity(
+                    graph, activity, keep_works, build_records=on_repository_done is not None or not keep_works
+                )
+                watermarks[activity["repository_url"]] = activity["watermark"]
+                if on_repository_done:
+                    refetched_issue_urls = set(activity["refetched_issue_urls"]) if activity["is_incremental"] else set()
+                    on_repository_done(activity["repository_url"], repo_work_records, refetched_issue_urls)
+        except BaseException:
+            # Don't start repositories that haven't begun; finished work is already checkpointed
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return graph.to_contributors_map()
+
+
+# --- Dead-Letter Replay ---
+DEAD_LETTER_REPO_PATTERN = re.compile(r'/repos/([^/]+)/([^/]+)(?:/|$)')
+
+def dead_letter_repository(entry: Dict[str, Any]) -> Optional[str]:
+    """The canonical URL of the repository a dead-lettered request belongs to, if it can be told."""
+    match = DEAD_LETTER_REPO_PATTERN.search(urlparse(entry.get("url", "")).path)
+    if match: return f"https://github.com/{match.group(1)}/{match.group(2)}"
+    variables = (entry.get("json_body") or {}).get("variables") or {} # GraphQL issue pages
+    if variables.get("owner") and variables.get("name"): return f"https://github.com/{variables['owner']}/{variables['name']}"
+    return None
 
-    return all_contributors_map
+def fetch_dead_letter_details(entries: List[Dict[str, Any]], token: Optional[str]) -> List[Optional[Dict[str, Any]]]:
+    """Re-requests dead-lettered detail requests concurrently. Results keep the order of entries."""
+    def fetch(index: int) -> Optional[Dict[str, Any]]:
+        entry = entries[index]
+        response = make_github_request(entry["url"], token, params=entry.get("params"), accept_header=entry.get("accept") or "application/vnd.github+json")
+        if not response or response.status_code != 200: return None
+        try:
+            return response.json()
+        except json.JSONDecodeError as e:
+            print(f"    Error decoding JSON for {entry['url']}: {e}")
+            return None
+    return fetch_details_concurrently(fetch, list(range(len(entries))))
+
+def replay_dead_letters(
+    graph: ContributorGraph,
+    entries: List[Dict[str, Any]],
+    token: Optional[str] = None,
+    watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
+    keep_works: bool = True
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Retries the requests of a dead-letter file and merges what they return into the contributor graph.
+    A failed commit or issue detail request is retried on its own, and the commit or issue is merged into
+    its author's or assignees' works; failed contributor statistics are fetched again on their own. Any other failure (a list page, the contributor list, a GraphQL page)
+    left its repository incomplete, so that repository is crawled again in full and its watermark updated.
+    Requests that fail again are dead-lettered anew by make_github_request.
+    Returns the contributor-work records that changed, and the entries that belong to no repository.
+    """
+    repos_to_recrawl: List[str] = []
+    detail_entries: Dict[str, List[Dict[str, Any]]] = collections.defaultdict(list)
+    unattributed: List[Dict[str, Any]] = []
+    for entry in entries:
+        repo_url = dead_letter_repository(entry)
+        if not repo_url:
+            unattributed.append(entry)
+        elif entry.get("endpoint") in ("commit_detail", "issue_detail", "contributor_stats"):
+            detail_entries[repo_url].append(entry)
+        elif repo_url not in repos_to_recrawl:
+            repos_to_recrawl.append(repo_url)
+
+    records: List[Dict[str, Any]] = []
+    for repo_url in repos_to_recrawl:
+        print(f"\nRe-crawling {repo_url}, which had failed list requests...")
+        activity = fetch_repository_activity(repo_url, token)
+        if activity is None: continue
+        records.extend(merge_repository_activity(graph, activity, keep_works))
+        if watermarks is not None: watermarks[activity["repository_url"]] = activity["watermark"]
+
+    for repo_url, repo_entries in detail_entries.items():
+        if repo_url in repos_to_recrawl: continue # Already fetched in full
+        owner, repo = parse_github_url(repo_url)
+        print(f"\nRetrying {len(repo_entries)} failed detail requests for {owner}/{repo}...")
+        issues_by_user: Dict[str, List[Dict[str, Any]]] = {}
+        commits_by_user: Dict[str, List[Dict[str, Any]]] = {}
+        user_details: Dict[str, Dict[str, Any]] = {}
+        refetched_issue_urls: Set[str] = set()
+        retry_stats = any(entry["endpoint"] == "contributor_stats" for entry in repo_entries)
+        repo_entries = [entry for entry in repo_entries if entry["endpoint"] != "contributor_stats"]
+        weekly_activity_by_user = weekly_activity_by_author(fetch_contributor_stats(owner, repo, token), user_details) if retry_stats else None
+        if watermarks is not None and repo_url in watermarks:
+            weekly_activity_by_user = changed_weekly_activity(weekly_activity_by_user, watermarks[repo_url])
+        for entry, details in zip(repo_entries, fetch_dead_letter_details(repo_entries, token)):
+            if not details: continue
+            if entry["endpoint"] == "issue_detail":
+                if details.get("html_url"): refetched_issue_urls.add(details["html_url"])
+                if details.get("state") != "closed" or 'pull_request' in details: continue
+                for assignee in issue_user_assignees(details):
+                    issues_by_user.setdefault(assignee['login'], []).append(simplify_issue(details))
+                    user_details.setdefault(assignee['login'], user_profile(assignee))
+            else:
+                author = details.get('author')
+                if not isinstance(author, dict) or not author.get('login') or author.get('type') != 'User': continue
+                simplified_commit = simplify_commit(details)
+                apply_commit_details(simplified_commit, details)
+                commits_by_user.setdefault(author['login'], []).append(simplified_commit)
+                user_details.setdefault(author['login'], user_profile(author))
+
+        # Merged like an incremental crawl: replayed items replace their stored copies
+        records.extend(merge_repository_activity(graph, {
+            "repository_url": repo_url, "owner": owner, "repo": repo, "is_incremental": True,
+            "contributors": [], "issues_by_user": issues_by_user, "commits_by_user": commits_by_user,
+            "assignee_details": user_details, "author_details": {}, "refetched_issue_urls": refetched_issue_urls,
+            "weekly_activity_by_user": weekly_activity_by_user,
+        }, keep_works))
+    return records, unattributed
+
+def begin_dead_letter_replay() -> List[Dict[str, Any]]:
+    """
+    Loads the dead letters to replay and points DEAD_LETTERS at a fresh file, so requests that fail again
+    are recorded apart from the entries being replayed (which stay intact if the replay is interrupted).
+    """
+    global DEAD_LETTERS
+    entries = DEAD_LETTERS.load()
+    if entries:
+        replay_path = DEAD_LETTER_FILE + ".replay"
+        if os.path.exists(replay_path): os.remove(replay_path)
+        DEAD_LETTERS = DeadLetterQueue(replay_path)
+    return entries
+
+def finish_dead_letter_replay(unattributed: List[Dict[str, Any]]) -> int:
+    """
+    Replaces the replayed dead-letter file with the requests that failed again, plus the entries that belong
+    to no repository (kept for a full crawl). Returns how many requests remain dead-lettered.
+    """
+    for entry in unattributed:
+        DEAD_LETTERS.record(entry["url"], entry.get("params"), entry.get("accept"), entry.get("json_body"), entry.get("reason", ""))
+    if DEAD_LETTERS.count:
+        os.replace(DEAD_LETTERS.path, DEAD_LETTER_FILE)
+    elif os.path.exists(DEAD_LETTER_FILE):
+        os.remove(DEAD_LETTER_FILE)
+    return DEAD_LETTERS.count
+
+def run_dead_letter_replay(output_filename: str, stream_output: bool, token: Optional[str]) -> None:
+    """
+    `fetch.py --replay-dead-letters`: retries the dead-lettered requests of earlier runs and merges the results
+    into their output file (appended as records in NDJSON mode).
+    """
+    if not os.path.exists(output_filename):
+        raise SystemExit(f"Replaying dead letters needs the output of the crawl that recorded them, '{output_filename}'.")
+    entries = begin_dead_letter_replay()
+    if not entries:
+        print(f"No dead letters to replay in {DEAD_LETTER_FILE or '(dead-lettering disabled)'}.")
+        return
+    print(f"--- NOTE: Replaying {len(entries)} dead-lettered requests from {DEAD_LETTER_FILE} into {output_filename} ---")
+    watermarks = load_watermarks(WATERMARKS_FILE)
+
+    if stream_output:
+        records, unattributed = replay_dead_letters(ContributorGraph(), entries, token, watermarks, keep_works=False)
+        with open_ndjson_output(output_filename, append=True) as output_file:
+            write_ndjson_records(output_file, records)
+            write_ndjson_metadata(output_file, {"replayed_dead_letters": len(entries)})
+    else:
+        try:
+            with open(output_filename, 'r', encoding='utf-8') as f:
+                output_data = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            raise SystemExit(f"Could not load '{output_filename}' ({e}).")
+        graph = ContributorGraph.from_contributors_map({c['username']: c for c in output_data.get('contributors', []) if c.get('username')})
+        records, unattributed = replay_dead_letters(graph, entries, token, watermarks)
+        output_data["contributors"] = sorted(graph.to_contributors_map().values(), key=lambda x: x.get('username', '').lower())
+        with open(output_filename, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+    save_watermarks(WATERMARKS_FILE, watermarks)
+
+    still_failing = finish_dead_letter_replay(unattributed)
+    print(f"Updated {len(records)} contributor-work records in {output_filename}.")
+    if still_failing:
+        print(f"{still_failing} requests still fail; they remain in {DEAD_LETTER_FILE}.")
+    else:
+        print("All dead-lettered requests succeeded.")
+
+
+# --- Streaming NDJSON Output ---
+def open_ndjson_output(path: str, append: bool = False):
+    """Opens an NDJSON output file for writing text lines, gzip-compressed when the path ends in .gz."""
+    mode = 'at' if append else 'wt'
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def write_ndjson_records(output_file, records: List[Dict[str, Any]]) -> None:
+    """Writes one JSON document per line and flushes, so finished repositories survive a crash."""
+    for record in records:
+        output_file.write(json.dumps(record, ensure_ascii=False))
+        output_file.write("\n")
+    output_file.flush()
+
+def write_ndjson_metadata(output_file, metadata: Dict[str, Any]) -> None:
+    """Ends a run's records with its metadata line, which readers of the stream skip."""
+    write_ndjson_records(output_file, [{"metadata": metadata, "fetch_metrics": FETCH_METRICS.report()}])
 
 
 # --- Main Execution (Keep the existing main block) ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch contributor activity for GitHub repositories.")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Resume an interrupted crawl from the checkpoint in {CHECKPOINT_DIR}, skipping finished work.")
+    parser.add_argument('--org', action='append', default=[],
+                        help="Crawl every repository of this GitHub organisation, most recently pushed first. Repeatable.")
+    parser.add_argument('--max-repos', type=int, default=None,
+                        help="With --org, crawl only this many of the highest-priority repositories.")
+    parser.add_argument('--replay-dead-letters', action='store_true',
+                        help=f"Retry only the requests that failed in earlier runs (recorded in {DEAD_LETTER_FILE}) and merge them into the output.")
+    parser.add_argument('--commit-sampling', choices=sorted(COMMIT_SAMPLING_POLICIES), default=COMMIT_SAMPLING_POLICY,
+                        help=f"Which commits get details when a repository has more than {MAX_COMMITS_TO_DETAIL_PER_REPO} (default '{COMMIT_SAMPLING_POLICY}').")
+    args = parser.parse_args()
+    COMMIT_SAMPLING_POLICY = args.commit_sampling
+
     repository_urls = [
         "https://github.com/JuliaGeometry/Meshes.jl",
         "https://github.com/JuliaEarth/GeoStats.jl"
@@ -459,19 +2457,35 @@ if __name__ == "__main__":
     #     "https://github.com/simpeg/discretize"
     # ]
 
-    if not GITHUB_TOKEN:
+    github_token = GITHUB_TOKENS[0] if GITHUB_TOKENS else None
+    if not github_token:
         print("Warning: GITHUB_TOKEN environment variable not found.")
         print("API requests will be unauthenticated and subject to much lower rate limits.")
         print("Fetching commit/issue details without a token is highly likely to fail or be severely limited.")
     else:
-        if GITHUB_TOKEN.startswith("ghp_") or GITHUB_TOKEN.startswith("ghu_") or GITHUB_TOKEN.startswith("github_pat"):
+        if github_token.startswith("ghp_") or github_token.startswith("ghu_") or github_token.startswith("github_pat"):
              print("Successfully loaded GITHUB_TOKEN from environment.")
         else:
              print("Warning: GITHUB_TOKEN loaded, but doesn't look like a standard Personal Access Token format.")
+        if len(GITHUB_TOKENS) > 1:
+             print(f"Spreading requests across a pool of {len(GITHUB_TOKENS)} tokens from GITHUB_TOKEN and GITHUB_TOKENS.")
 
 
+    if args.org:
+        discovered_repos: List[Dict[str, Any]] = []
+        for org in args.org:
+            org_repos = fetch_org_repositories(org, github_token)
+            if org_repos is None:
+                print(f"Error: Could not list the repositories of '{org}'.")
+                continue
+            discovered_repos.extend(org_repos)
+        repository_urls = prioritise_repositories(discovered_repos)[:args.max_repos]
+        if not repository_urls:
+            raise SystemExit("No repositories found to crawl.")
+        print(f"--- NOTE: Crawling {len(repository_urls)} repositories from {', '.join(args.org)}, most recently pushed first ---")
+
     if MAX_COMMITS_TO_DETAIL_PER_REPO is not None:
-        print(f"--- NOTE: Will attempt to fetch details for a maximum of {MAX_COMMITS_TO_DETAIL_PER_REPO} commits per repository ---")
+        print(f"--- NOTE: Will attempt to fetch details for a maximum of {MAX_COMMITS_TO_DETAIL_PER_REPO} commits per repository ('{COMMIT_SAMPLING_POLICY}' sampling) ---")
     else:
         print("--- NOTE: Attempting to fetch details for ALL found commits per repository ---")
 
@@ -481,39 +2495,112 @@ if __name__ == "__main__":
         print("--- NOTE: Attempting to fetch details (simplified) for ALL found closed issues per repository ---")
 
 
+    # output_filename = "github_contributors_Meshes_GeoStats_v1.json" # First run of geo-related repos
+    output_filename = "github_contributors_SimPEG_v1.json" # First run of SimPEG repos
+    if args.org:
+        output_filename = f"github_contributors_{'_'.join(args.org)}_v1.json"
+    stream_output = OUTPUT_FORMAT in ("ndjson", "ndjson.gz")
+    if stream_output:
+        output_filename = f"{os.path.splitext(output_filename)[0]}.{OUTPUT_FORMAT}"
+
+    if args.replay_dead_letters:
+        run_dead_letter_replay(output_filename, stream_output, github_token)
+        raise SystemExit(0)
+
+    # --- Incremental crawl: start from the previous output and watermarks, if both exist ---
+    existing_contributors = None
+    previous_processed_repos: List[str] = []
+    watermarks = load_watermarks(WATERMARKS_FILE)
+    if watermarks and os.path.exists(output_filename) and stream_output:
+        # The stream is an append-only log, so only records for activity newer than the watermarks are added
+        existing_contributors = {}
+        print(f"--- NOTE: Incremental crawl, appending new activity to {output_filename} ---")
+    elif watermarks and os.path.exists(output_filename):
+        try:
+            with open(output_filename, 'r', encoding='utf-8') as f:
+                previous_output = json.load(f)
+            existing_contributors = {c['username']: c for c in previous_output.get('contributors', []) if c.get('username')}
+            previous_processed_repos = previous_output.get('metadata', {}).get('processed_repos', [])
+            print(f"--- NOTE: Incremental crawl, merging new activity into {len(existing_contributors)} contributors from {output_filename} ---")
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not load previous output '{output_filename}' ({e}). Doing a full crawl.")
+            watermarks = {}
+    elif watermarks:
+        print(f"Warning: Found watermarks in {WATERMARKS_FILE} but no previous output '{output_filename}'. Doing a full crawl.")
+        watermarks = {}
+
+    checkpoint = CrawlCheckpoint(CHECKPOINT_DIR)
+    if args.resume:
+        print(f"--- NOTE: Resuming from checkpoint in {CHECKPOINT_DIR} ---")
+    else:
+        checkpoint.clear()
+
+    stream_file = None
+    on_repository_done = None
+    if stream_output:
+        print(f"\nStreaming contributor-work records to {output_filename}...")
+        stream_file = open_ndjson_output(output_filename, append=existing_contributors is not None)
+
+        def on_repository_done(repo_url: str, records: List[Dict[str, Any]], refetched_issue_urls: Set[str]) -> None:
+            write_ndjson_records(stream_file, records)
+            save_watermarks(WATERMARKS_FILE, watermarks) # Finished repos are not re-crawled after a crash
+            checkpoint.discard(repo_url) # Already in the stream; a resumed run only appends newer activity
+            print(f"Wrote {len(records)} contributor-work records for {repo_url} to {output_filename}")
+
     start_time = time.time()
-    contributors_map = process_repositories(repository_urls, GITHUB_TOKEN)
+    try:
+        contributors_map = process_repositories(
+            repository_urls, github_token, existing_contributors, watermarks,
+            on_repository_done=on_repository_done, keep_works=not stream_output,
+            checkpoint=checkpoint
+        )
+    except BaseException:
+        if stream_file: stream_file.close() # Keep the records of finished repositories readable
+        raise
     end_time = time.time()
 
     final_contributor_list = list(contributors_map.values())
     final_contributor_list.sort(key=lambda x: x.get('username', '').lower())
 
+    metadata = {
+       "processed_repos": previous_processed_repos + [u for u in repository_urls if u not in previous_processed_repos],
+       "incremental": existing_contributors is not None,
+       "processing_time_seconds": round(end_time - start_time, 2),
+       "commit_detail_limit_per_repo": MAX_COMMITS_TO_DETAIL_PER_REPO,
+       "commit_sampling_policy": COMMIT_SAMPLING_POLICY,
+       "issue_detail_limit_per_repo": MAX_ISSUES_TO_DETAIL_PER_REPO
+    }
+    fetch_metrics = FETCH_METRICS.report()
     output_data = {
         "contributors": final_contributor_list,
-        "metadata": {
-           "processed_repos": repository_urls,
-           "processing_time_seconds": round(end_time - start_time, 2),
-           "commit_detail_limit_per_repo": MAX_COMMITS_TO_DETAIL_PER_REPO,
-           "issue_detail_limit_per_repo": MAX_ISSUES_TO_DETAIL_PER_REPO
-        }
+        "metadata": metadata,
+        "fetch_metrics": fetch_metrics
     }
 
     print(f"\n--- Processing completed in {end_time - start_time:.2f} seconds ---")
     print(f"--- Found data for {len(final_contributor_list)} unique contributors across processed repositories ---")
-
-
-    # output_filename = "github_contributors_Meshes_GeoStats_v1.json" # First run of geo-related repos
-    output_filename = "github_contributors_SimPEG_v1.json" # First run of SimPEG repos
-    try:
-        print(f"\nAttempting to save data to {output_filename}...")
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
-        print(f"Successfully saved data to {output_filename}")
-    except IOError as e:
-        print(f"\nError saving data to file '{output_filename}': {e}")
-    except TypeError as e:
-         print(f"\nError serializing data to JSON: {e}")
-
-    users_with_no_works = [c['username'] for c in final_contributor_list if not c.get('works')]
+    print("--- Fetch metrics: " + "\n".join(FETCH_METRICS.summary_lines()))
+    if DEAD_LETTERS.count:
+        print(f"--- {DEAD_LETTERS.count} requests still failed after retries. They were saved to {DEAD_LETTER_FILE}; run `python fetch.py --replay-dead-letters` to retry just those. ---")
+
+    if stream_output:
+        write_ndjson_metadata(stream_file, metadata)
+        stream_file.close()
+        print(f"Successfully streamed data to {output_filename}")
+        checkpoint.clear()
+    else:
+        try:
+            print(f"\nAttempting to save data to {output_filename}...")
+            with open(output_filename, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
+            print(f"Successfully saved data to {output_filename}")
+            save_watermarks(WATERMARKS_FILE, watermarks)
+            checkpoint.clear()
+        except IOError as e:
+            print(f"\nError saving data to file '{output_filename}': {e}")
+        except TypeError as e:
+             print(f"\nError serializing data to JSON: {e}")
+
+    users_with_no_works = [c['username'] for c in final_contributor_list if not c.get('works')] if not stream_output else []
     if users_with_no_works:
         print(f"\nNote: {len(users_with_no_works)} contributors were identified but had no associated closed issues or commits recorded in the processed repositories:")
\ No newline at end of file